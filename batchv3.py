@@ -0,0 +1,133 @@
+"""
+Batch runner for the v3 interpreter.
+
+    python3 batchv3.py programs/ -o results.json
+    python3 batchv3.py manifest.json --engine vm --workers 8
+
+Runs many Brewin programs, each with its own input, on a pool of worker processes, one per core by
+default, and writes what every run printed, the error it ended with and how long it took into one
+JSON results file, in the order of the programs.
+
+The programs are either every .br file of a directory, whose input, if any, is the lines of the .in
+file of the same name, or the entries of a JSON manifest:
+
+    [{"program": "fib.br", "input": ["10"]}, {"program": "sort.br", "input_file": "sort.in"}]
+
+with paths relative to the manifest. Once a program has read all of its input, inputi and inputs
+get None, as they do at the end of the inp list of an Interpreter.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from inputv3 import IterableInput
+from interpreterv3 import Interpreter
+
+PROGRAM_SUFFIX = '.br'
+INPUT_SUFFIX = '.in'
+
+
+def load_jobs(path):
+    """Return (name, program path, input lines) for every program of a directory or manifest"""
+    if os.path.isdir(path):
+        jobs = []
+        for file_name in sorted(os.listdir(path)):
+            if file_name.endswith(PROGRAM_SUFFIX):
+                program = os.path.join(path, file_name)
+                input_path = program[:-len(PROGRAM_SUFFIX)] + INPUT_SUFFIX
+                inputs = read_lines(input_path) if os.path.exists(input_path) else []
+                jobs.append((file_name, program, inputs))
+        return jobs
+    with open(path) as file:
+        manifest = json.load(file)
+    directory = os.path.dirname(path)
+    jobs = []
+    for entry in manifest:
+        if 'input_file' in entry:
+            inputs = read_lines(os.path.join(directory, entry['input_file']))
+        else:
+            inputs = [str(value) for value in entry.get('input', [])]
+        jobs.append((entry['program'], os.path.join(directory, entry['program']), inputs))
+    return jobs
+
+
+def read_lines(path):
+    with open(path) as file:
+        return file.read().splitlines()
+
+
+def run_job(job, engine='tree', max_steps=None, time_limit=None):
+    """Run one (name, program path, input lines) job and return its result"""
+    name, program, inputs = job
+    try:
+        with open(program) as file:
+            source = file.read().split('\n')
+    except OSError as error:
+        return {'program': name, 'output': [], 'error_type': None, 'error_line': None,
+                'exception': f'{type(error).__name__}: {error}', 'seconds': 0.0}
+    interpreter = Interpreter(console_output=False, engine=engine, max_steps=max_steps, time_limit=time_limit)
+    return dict(program=name, **run_program(interpreter, source, inputs))
+
+
+def run_program(interpreter, source, inputs):
+    """
+    Run the lines of a program on interpreter, a new one or one that ran other programs before, with
+    input lines; return what it printed, the error it ended with and how long it took
+    """
+    result = {'output': [], 'error_type': None, 'error_line': None, 'exception': None}
+    start = time.perf_counter()
+    interpreter.reset()
+    interpreter.input_provider = IterableInput(inputs)
+    try:
+        try:
+            interpreter.run(source)
+        except RuntimeError:
+            pass  # the error the program ended with is recorded by the interpreter
+        error_type, error_line = interpreter.get_error_type_and_line()
+        result['output'] = interpreter.get_output()
+        result['error_type'] = error_type.name if error_type is not None else None
+        result['error_line'] = error_line
+    except Exception as error:  # a program that crashes the interpreter must not stop the others
+        result['exception'] = f'{type(error).__name__}: {error}'
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def run_batch(jobs, engine='tree', workers=None, max_steps=None, time_limit=None):
+    """
+    Run jobs on a pool of worker processes, os.cpu_count() by default, each within the step budget and
+    time limit of Interpreter; return their results in order
+    """
+    workers = workers or os.cpu_count() or 1
+    # hand the jobs out in chunks, so small programs do not wait on a round trip to the pool each
+    chunk_size = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run_job, jobs, [engine] * len(jobs), [max_steps] * len(jobs),
+                                 [time_limit] * len(jobs), chunksize=chunk_size))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run many Brewin programs in parallel')
+    parser.add_argument('programs', help='directory of .br programs, or JSON manifest of programs and inputs')
+    parser.add_argument('-o', '--output', default='results.json', help='results file (default: results.json)')
+    parser.add_argument('--engine', default='tree', choices=Interpreter.ENGINES, help='execution engine')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per core)')
+    parser.add_argument('--max-steps', type=int, default=None, help='loop iterations and calls a program may take')
+    parser.add_argument('--time-limit', type=float, default=None, help='seconds a program may run')
+    args = parser.parse_args(argv)
+    jobs = load_jobs(args.programs)
+    start = time.perf_counter()
+    results = run_batch(jobs, args.engine, args.workers, args.max_steps, args.time_limit)
+    elapsed = time.perf_counter() - start
+    with open(args.output, 'w') as file:
+        json.dump({'engine': args.engine, 'seconds': elapsed, 'results': results}, file, indent=1)
+    failed = sum(1 for result in results if result['error_type'] is not None or result['exception'] is not None)
+    print(f'{len(results)} programs, {failed} ended with an error, {elapsed:.2f} s')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
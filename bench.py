@@ -0,0 +1,503 @@
+"""
+Benchmarks for the v3 interpreter.
+
+    python3 bench.py                 # every benchmark
+    python3 bench.py values parser   # only the named ones
+    python3 bench.py programs --engines vm --repeat 5
+
+Each benchmark prints one line per measurement with the best time over --repeat runs.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import tracemalloc
+
+from bparser import BParser
+from interpreterv3 import Interpreter, Type, Value
+from inputv3 import StreamInput
+from outputv3 import BufferedWriter, DiscardLog, RingBufferLog, TeeSink
+
+# allocation heavy programs: every loop iteration builds new Values, objects or both
+PROGRAMS = {
+    'arithmetic': """
+(class main
+  (method void main ()
+    (let ((int i 0) (int total 0))
+      (while (< i 100000)
+        (begin
+          (set total (+ total (% (* i 7) 13)))
+          (set i (+ i 1))))
+      (print total))))
+""",
+    'objects': """
+(class point
+  (field int x 0)
+  (field int y 0)
+  (method void init ((int a) (int b)) (begin (set x a) (set y b)))
+  (method int sum () (return (+ x y))))
+(class main
+  (method void main ()
+    (let ((int i 0) (int total 0) (point p null))
+      (while (< i 20000)
+        (begin
+          (set p (new point))
+          (call p init i 1)
+          (set total (+ total (call p sum)))
+          (set i (+ i 1))))
+      (print total))))
+""",
+    'linked_list': """
+(tclass node (field_type)
+  (field node@field_type next null)
+  (field field_type value)
+  (method void init ((field_type v) (node@field_type n)) (begin (set value v) (set next n)))
+  (method node@field_type get_next () (return next))
+  (method field_type get_value () (return value)))
+(class main
+  (method void main ()
+    (let ((int i 0) (int total 0) (node@int head null) (node@int cur null))
+      (while (< i 10000)
+        (begin
+          (set cur (new node@int))
+          (call cur init i head)
+          (set head cur)
+          (set i (+ i 1))))
+      (while (!= head null)
+        (begin
+          (set total (+ total (call head get_value)))
+          (set head (call head get_next))))
+      (print total))))
+""",
+}
+
+# programs whose run time is dominated by calls and expressions, with and without throwing
+EXCEPTION_PROGRAMS = {
+    'no_throw': """
+(class calc
+  (method int square ((int x)) (return (* x x)))
+  (method int add_squares ((int a) (int b)) (return (+ (call me square a) (call me square b)))))
+(class main
+  (field calc c null)
+  (method void main ()
+    (let ((int i 0) (int total 0))
+      (set c (new calc))
+      (try
+        (while (< i 20000)
+          (begin
+            (set total (+ total (% (call c add_squares i (+ i 1)) 1000)))
+            (set i (+ i 1))))
+        (print "unreached"))
+      (print total))))
+""",
+    'throw': """
+(class thrower
+  (method void fail ((int depth)) (if (== depth 0) (throw "failed") (call me fail (- depth 1)))))
+(class main
+  (field thrower t null)
+  (method void main ()
+    (let ((int i 0) (int caught 0))
+      (set t (new thrower))
+      (while (< i 5000)
+        (begin
+          (try (call t fail 5) (set caught (+ caught 1)))
+          (set i (+ i 1))))
+      (print caught))))
+""",
+}
+
+# times the program read from stdin on the tree-walker found in the directory argv[1], best of argv[2] runs; run
+# in a process of its own, so the interpreter of another revision does not meet the modules of this one
+BASELINE_SCRIPT = """
+import contextlib, io, sys, time
+sys.path.insert(0, sys.argv[1])
+from interpreterv3 import Interpreter
+lines = sys.stdin.read().split('\\n')
+best = None
+for _ in range(int(sys.argv[2])):
+    start = time.perf_counter()
+    interpreter = Interpreter(console_output=False)
+    with contextlib.redirect_stdout(io.StringIO()):  # older revisions print the parse tree
+        interpreter.run(lines)
+    elapsed = time.perf_counter() - start
+    if best is None or elapsed < best:
+        best = elapsed
+print(best)
+"""
+
+# recursion as deep as the argument of main: the vm keeps its frames on the heap, the other engines stop when
+# Python's stack runs out
+RECURSION_PROGRAM = """
+(class main
+  (method int sum ((int n)) (if (== n 0) (return 0) (return (+ n (call me sum (- n 1))))))
+  (method void main () (print (call me sum DEPTH))))
+"""
+
+# the same sum with the recursive call in tail position: every engine runs it in constant stack space
+TAIL_RECURSION_PROGRAM = """
+(class main
+  (method int sum ((int n) (int total)) (if (== n 0) (return total) (return (call me sum (- n 1) (+ total n)))))
+  (method void main () (print (call me sum DEPTH 0))))
+"""
+
+# prints a line per loop iteration
+OUTPUT_PROGRAM = """
+(class main
+  (method void main ()
+    (let ((int i 0))
+      (while (< i 20000)
+        (begin
+          (print "line " i)
+          (set i (+ i 1)))))))
+"""
+
+# output sinks compared by bench_output, built anew for every run; None is the default print and output_log
+OUTPUT_SINKS = {
+    'print': lambda: None,
+    'buffered': lambda: TeeSink(BufferedWriter(), RingBufferLog(100)),
+    'discard': lambda: TeeSink(BufferedWriter(), DiscardLog()),
+}
+
+# sums as many values as it reads with inputi
+INPUT_PROGRAM = """
+(class main
+  (field int x 0)
+  (field int total 0)
+  (method void main ()
+    (let ((int i 0))
+      (begin
+        (while (< i COUNT)
+          (begin
+            (inputi x)
+            (set total (+ total x))
+            (set i (+ i 1))))
+        (print total)))))
+"""
+
+# a program that runs in well under a millisecond, so setting up the interpreter is a large part of a run
+REUSE_PROGRAM = """
+(class point
+  (field int x 0)
+  (method void init ((int a)) (set x a))
+  (method int get () (return x)))
+(class main
+  (field point p null)
+  (method void main ()
+    (begin
+      (set p (new point))
+      (call p init 5)
+      (print (call p get)))))
+"""
+
+
+class OldValue:
+    """
+    Value as it was before it got __slots__ and the literal cache, for bench_values to compare against; only
+    its case of Type.ERROR, which is gone, is left out
+    """
+
+    def __init__(self, value, type=None, class_name=None):
+        self.class_name = None  # None if it's a primitive type
+        self.original_class_name = None
+
+        if type == None:
+            if value.isnumeric() or (value[0] == '-' and value[1:].isnumeric()):
+                self.type = Type.INT
+                self.value = int(value)
+            elif value == 'true' or value == 'false':
+                self.type = Type.BOOL
+                if value == 'true':
+                    self.value = True
+                else:
+                    self.value = False
+            elif value == 'null':
+                self.type = Type.POINTER
+                self.value = None
+            elif value[0] == '"' and value[-1] == '"':
+                self.type = Type.STRING
+                self.value = value.strip('"')
+            else:
+                self.type = Type.UNDEFINED
+                self.value = -1
+        else:
+            if type == Type.INT:
+                self.type = Type.INT
+                self.value = int(value)
+            if type == Type.BOOL:
+                self.type = Type.BOOL
+                self.value = value
+            if type == Type.STRING:
+                self.type = Type.STRING
+                self.value = str(value)
+            if type == Type.POINTER:
+                self.type = Type.POINTER
+                self.value = value
+                self.class_name = class_name
+                self.original_class_name = class_name
+            if type == Type.RETURN:
+                self.type = Type.RETURN
+                self.value = value
+
+    def typeof(self):
+        return self.type
+
+    def val(self):
+        return self.value
+
+
+# the int + and < of the interpreter as they were with OldValue
+OLD_OPERATIONS = {
+    '+': lambda x, y: OldValue(x.val() + y.val(), Type.INT),
+    '<': lambda x, y: OldValue(x.val() < y.val(), Type.BOOL),
+}
+
+
+def synthetic_source(classes):
+    """A program of about 30 lines per class, with strings, comments and nested expressions"""
+    lines = []
+    for i in range(classes):
+        lines += [
+            f'# class number {i}',
+            f'(class class{i}',
+            '  (field int count 0)',
+            '  (field string name "a (string) with # in it")',
+            '  (field bool done false)',
+            '  (method int step ((int a) (int b))',
+            '    (begin',
+            '      (set count (+ count (* a (- b 1))))  # update the count',
+            '      (if (> count 1000)',
+            '        (begin (set done true) (return (% count 7)))',
+            '        (return (/ (+ a b) 2)))))',
+            '  (method void run ()',
+            '    (let ((int i 0) (string s "loop"))',
+            '      (while (< i 10)',
+            '        (begin',
+            '          (call me step i (+ i 1))',
+            '          (set s (+ s "."))',
+            '          (set i (+ i 1))))',
+            '      (print name " " s " " count)))',
+            '  (method string describe ()',
+            '    (if done',
+            '      (return (+ name " is done"))',
+            '      (return (+ name " is running"))))',
+            '  (method bool check ((int x))',
+            '    (try',
+            '      (begin (throw "fail") (return true))',
+            '      (begin',
+            '        (print exception)',
+            '        (return (& (> x 0) (!= x 10))))))',
+            ')',
+        ]
+    return lines
+
+
+def best_of(repeat, function):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def run_program(source, engine='tree', cache_dir=None):
+    interpreter = Interpreter(console_output=False, engine=engine, cache_dir=cache_dir)
+    interpreter.run(source.split('\n') if isinstance(source, str) else source)
+    return interpreter
+
+
+def bench_values(args):
+    """Cost of creating Values and of the operators that create them, with OldValue and with Value"""
+    count = 200000
+    operations = run_program('(class main (method void main () (return)))').operations
+    implementations = {
+        'old': (OldValue, OLD_OPERATIONS['+'], OLD_OPERATIONS['<']),
+        'new': (Value, operations[Type.INT]['+'], operations[Type.INT]['<']),
+    }
+
+    for implementation, (value_class, add, less) in implementations.items():
+        a = value_class(3, Type.INT)
+        b = value_class(4, Type.INT)
+
+        def construct():
+            int_type = Type.INT
+            for i in range(count):
+                value_class(i, int_type)
+
+        def parse():
+            for _ in range(count):
+                value_class('1234')
+
+        def operate():
+            for _ in range(count):
+                add(a, b)
+                less(a, b)
+
+        for name, function in (('construct', construct), ('parse literal', parse), ('add and compare', operate)):
+            elapsed = best_of(args.repeat, function)
+            print(f'values {name:<20} {implementation:<4} {elapsed * 1e9 / count:8.1f} ns per Value')
+
+        tracemalloc.start()
+        values = [value_class(i, Type.INT) for i in range(count)]
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'values {"memory":<20} {implementation:<4} {size / len(values):8.1f} bytes per Value')
+
+
+def baseline_times(revision, sources, repeat):
+    """Best run times of sources on the tree-walker of a git revision of this repository"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    archive = subprocess.run(['git', 'archive', revision], cwd=here, stdout=subprocess.PIPE, check=True).stdout
+    with tempfile.TemporaryDirectory() as directory:
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            tar.extractall(directory)
+        return [float(subprocess.run([sys.executable, '-c', BASELINE_SCRIPT, directory, str(repeat)], input=source,
+                                     stdout=subprocess.PIPE, text=True, check=True).stdout)
+                for source in sources]
+
+
+def bench_programs(args):
+    """Run time of the allocation heavy PROGRAMS on every engine"""
+    for name, source in PROGRAMS.items():
+        for engine in args.engines:
+            elapsed = best_of(args.repeat, lambda: run_program(source, engine))
+            print(f'programs {name:<12} {engine:<8} {elapsed * 1000:9.1f} ms')
+
+
+def bench_parser(args):
+    """Parse time of large synthetic programs, and start up time of running them with and without a parse cache"""
+    for classes in (100, 1000):
+        lines = synthetic_source(classes)
+        for mode, interned in (('tokens', False), ('interned', True)):
+            elapsed = best_of(args.repeat, lambda: BParser.parse(lines, interned))
+            print(f'parser {len(lines):>6} lines {mode:<8} {elapsed * 1000:9.1f} ms {len(lines) / elapsed:12.0f} lines/s')
+    lines = synthetic_source(1000) + ['(class main (method void main () (return)))']
+    with tempfile.TemporaryDirectory() as cache_dir:
+        run_program(lines, cache_dir=cache_dir)
+        for name, directory in (('uncached', None), ('cached', cache_dir)):
+            elapsed = best_of(args.repeat, lambda: run_program(lines, cache_dir=directory))
+            print(f'parser {name:<8} start {"":<15} {elapsed * 1000:9.1f} ms')
+
+
+def bench_exceptions(args):
+    """
+    Run time of EXCEPTION_PROGRAMS on every engine: what try costs code that does not throw, and throwing.
+    With --baseline, also on the tree-walker of that revision, such as the parent of the commit that made throw
+    raise BrewinThrow instead of returning a Value of Type.ERROR that every statement checked for.
+    """
+    if args.baseline:
+        baseline = baseline_times(args.baseline, EXCEPTION_PROGRAMS.values(), args.repeat)
+        for name, elapsed in zip(EXCEPTION_PROGRAMS, baseline):
+            print(f'exceptions {name:<10} {"baseline":<8} {elapsed * 1000:9.1f} ms')
+    for name, source in EXCEPTION_PROGRAMS.items():
+        for engine in args.engines:
+            elapsed = best_of(args.repeat, lambda: run_program(source, engine))
+            print(f'exceptions {name:<10} {engine:<8} {elapsed * 1000:9.1f} ms')
+
+
+def bench_output(args):
+    """Run time of a print heavy program on every engine with each of OUTPUT_SINKS, printing to a line buffered file"""
+    lines = OUTPUT_PROGRAM.split('\n')
+    for name, sink in OUTPUT_SINKS.items():
+        for engine in args.engines:
+            def run():
+                interpreter = Interpreter(engine=engine, output_sink=sink())
+                with open(os.devnull, 'w', buffering=1) as stream, contextlib.redirect_stdout(stream):
+                    interpreter.run(lines)
+            elapsed = best_of(args.repeat, run)
+            print(f'output {name:<10} {engine:<8} {elapsed * 1000:9.1f} ms')
+
+
+def bench_input(args):
+    """Run time of a program reading many values, from an inp list and from a file read by StreamInput"""
+    count = 20000
+    lines = INPUT_PROGRAM.replace('COUNT', str(count)).split('\n')
+    values = [str(i) for i in range(count)]
+    data = '\n'.join(values).encode()
+    providers = {
+        'list': lambda: {'inp': values},
+        'stream': lambda: {'input_provider': StreamInput(io.BytesIO(data))},
+    }
+    for name, provider in providers.items():
+        for engine in args.engines:
+            def run():
+                interpreter = Interpreter(console_output=False, engine=engine, **provider())
+                interpreter.run(lines)
+            elapsed = best_of(args.repeat, run)
+            print(f'input {name:<10} {engine:<8} {elapsed * 1000:9.1f} ms')
+
+
+def bench_reuse(args):
+    """Run time of many runs of a small program, on a new interpreter each and on one interpreter reset between runs"""
+    runs = 1000
+    lines = REUSE_PROGRAM.split('\n')
+
+    def fresh():
+        for _ in range(runs):
+            interpreter = Interpreter(console_output=False, engine=engine)
+            interpreter.run(lines)
+
+    def warm():
+        interpreter = Interpreter(console_output=False, engine=engine)
+        for _ in range(runs):
+            interpreter.reset()
+            interpreter.run(lines)
+
+    for name, run in (('fresh', fresh), ('reset', warm)):
+        for engine in args.engines:
+            elapsed = best_of(args.repeat, run)
+            print(f'reuse {name:<6} {engine:<8} {elapsed * 1e6 / runs:9.1f} us per run')
+
+
+def bench_recursion(args):
+    """Time per call of ever deeper recursion on every engine, until an engine runs out of stack"""
+    for name, program in (('plain', RECURSION_PROGRAM), ('tail', TAIL_RECURSION_PROGRAM)):
+        for engine in args.engines:
+            for depth in (100, 10000, 90000, 200000):
+                source = program.replace('DEPTH', str(depth))
+                try:
+                    elapsed = best_of(args.repeat, lambda: run_program(source, engine))
+                except RuntimeError as error:
+                    print(f'recursion {name:<5} {depth:>6} {engine:<8} {error}')
+                    break
+                print(f'recursion {name:<5} {depth:>6} {engine:<8} {elapsed * 1e6 / depth:9.2f} us per call')
+
+
+BENCHMARKS = {
+    'values': bench_values,
+    'programs': bench_programs,
+    'parser': bench_parser,
+    'exceptions': bench_exceptions,
+    'output': bench_output,
+    'input': bench_input,
+    'reuse': bench_reuse,
+    'recursion': bench_recursion,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks for the v3 interpreter')
+    parser.add_argument('benchmarks', nargs='*', help=f'benchmarks to run: {", ".join(BENCHMARKS)} (default: all)')
+    parser.add_argument('--engines', default=','.join(Interpreter.ENGINES),
+                        type=lambda engines: engines.split(','), help='comma separated engines to run programs on')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement, the best one is reported')
+    parser.add_argument('--baseline', metavar='REVISION',
+                        help='git revision whose tree-walker the exceptions benchmark times as well')
+    args = parser.parse_args(argv)
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f'unknown benchmark {name}')
+    for name in args.benchmarks or BENCHMARKS:
+        BENCHMARKS[name](args)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
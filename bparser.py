@@ -5,16 +5,20 @@ Provided module for parsing Brewin programs. When grading your project,
 we'll use our own copy; don't submit (or change) your own version!
 """
 
+import mmap
+import re
+import sys
+
 
 class StringWithLineNumber(str):
     """
     Wrapper class for str that allows you to add a line number tag (line_num).
     """
 
-    line_num = None
+    __slots__ = ('line_num',)  # without a __dict__ per token, large programs parse much faster
 
     def __new__(cls, string, line_num):
-        instance = super().__new__(cls, string)
+        instance = str.__new__(cls, string)
         instance.line_num = line_num
         return instance
 
@@ -25,6 +29,25 @@ class StringWithLineNumber(str):
         return StringWithLineNumber(self, self.line_num)
 
 
+class ListWithLineNumber(list):
+    """
+    Wrapper class for list that allows you to add a line number tag (line_num): the line of its
+    first token, or of its opening parenthesis if it does not start with a token.
+    """
+
+    __slots__ = ('line_num',)
+
+    def __init__(self, line_num, items=()):
+        super().__init__(items)
+        self.line_num = line_num
+
+
+class BParserError(Exception):
+    """
+    Raised by BParser.parse_stream when the program is not well formed.
+    """
+
+
 class BParser:
     """
     Static class that wraps BParser.parse and class-level constants. Do not initialize this class!
@@ -36,9 +59,13 @@ class BParser:
     QUOTE_CHAR = '"'
     WHITESPACE_CHARS = " \t\r\n"
     DELIMETER_CHARS = WHITESPACE_CHARS + OPEN_PAREN_CHAR + CLOSE_PAREN_CHAR
+    # one match per token, in order: a string, a parenthesis, any other run of characters up to a
+    # delimiter, quote or comment, a quote that is not closed on its line, or the start of a comment;
+    # whitespace between tokens is the only text no alternative matches
+    TOKEN_REGEX = re.compile(r'"[^"]*"|[()]|[^ \t\r\n()"#]+|"|#')
 
     @staticmethod
-    def parse(lines):
+    def parse(lines, interned=False):
         """
         Maps a list of input strings containing only alphanumeric tokens, spaces, and parentheses
         to a tuple with two items:
@@ -60,66 +87,53 @@ class BParser:
             ]
         )
         """
-        cur_token = ""
-        in_quote = False
-        output = []
-        output_stack = [output]
+        try:
+            return True, list(BParser.parse_stream(lines, interned))
+        except BParserError as error:
+            return False, str(error)
+
+    @staticmethod
+    def parse_stream(lines, interned=False):
+        """
+        Generator version of parse that reads lines as it goes: lines can be any iterable of str or bytes
+        lines, such as a file object, or a memory-mapped file. Yields each top-level item, such as a whole
+        (class ...), as soon as its closing parenthesis is read; raises BParserError with the message parse
+        would return if the input is not well formed, after yielding the items before the error.
+
+        With interned, tokens are plain strings interned with sys.intern, so every occurrence of a name or
+        keyword is the same object as the others and as the constants it is compared with, and lists are
+        ListWithLineNumber: the line numbers are kept once per list instead of once per token.
+        """
+        if isinstance(lines, mmap.mmap):
+            lines = iter(lines.readline, b"")
+        output_stack = [[]]
         for line_no, line in enumerate(lines):
-            line = BParser.__remove_comment(line)
-            for char in line:
-                if char == BParser.QUOTE_CHAR:
-                    if not in_quote:
-                        if cur_token:
-                            token_and_line_num = StringWithLineNumber(
-                                cur_token, line_no
-                            )
-                            output_stack[-1].append(token_and_line_num)
-                        cur_token = BParser.QUOTE_CHAR
-                        in_quote = True
-                    else:
-                        cur_token += BParser.QUOTE_CHAR
-                        token_and_line_num = StringWithLineNumber(cur_token, line_no)
-                        output_stack[-1].append(token_and_line_num)
-                        cur_token = ""
-                        in_quote = False
-                    continue
-                if in_quote:
-                    cur_token += char
-                    continue
-
-                if char in BParser.DELIMETER_CHARS:
-                    if cur_token:
-                        token_and_line_num = StringWithLineNumber(cur_token, line_no)
-                        output_stack[-1].append(token_and_line_num)
-                        cur_token = ""
+            if isinstance(line, bytes):
+                line = line.decode()
+            for token in BParser.TOKEN_REGEX.findall(line):
+                char = token[0]
                 if char == BParser.OPEN_PAREN_CHAR:
-                    nested = output_stack[-1]
-                    nested.append([])
-                    output_stack.append(nested[-1])
+                    nested = ListWithLineNumber(line_no) if interned else []
+                    output_stack[-1].append(nested)
+                    output_stack.append(nested)
                 elif char == BParser.CLOSE_PAREN_CHAR:
                     if len(output_stack) < 2:
-                        return False, "Extra closing parenthesis"
+                        raise BParserError("Extra closing parenthesis")
                     output_stack.pop()
-                elif char not in BParser.WHITESPACE_CHARS:
-                    cur_token += char
-            if in_quote:
-                return False, "Unclosed string"
-            if cur_token:
-                token_and_line_num = StringWithLineNumber(cur_token, line_no)
-                output_stack[-1].append(token_and_line_num)
-                cur_token = ""
+                    if len(output_stack) == 1:
+                        yield output_stack[0].pop()
+                elif char == BParser.COMMENT_CHAR:
+                    break
+                elif token == BParser.QUOTE_CHAR:
+                    raise BParserError("Unclosed string")
+                elif len(output_stack) == 1:
+                    yield sys.intern(token) if interned else StringWithLineNumber(token, line_no)
+                elif interned:
+                    nested = output_stack[-1]
+                    if not nested:
+                        nested.line_num = line_no
+                    nested.append(sys.intern(token))
+                else:
+                    output_stack[-1].append(StringWithLineNumber(token, line_no))
         if len(output_stack) > 1:
-            return False, "Unclosed parenthesis"
-        return True, output
-
-    @staticmethod
-    def __remove_comment(line):
-        in_string = False
-        stripped_line = ""
-        for char in line:
-            if char == BParser.COMMENT_CHAR and not in_string:
-                return stripped_line
-            if char == BParser.QUOTE_CHAR:
-                in_string = not in_string
-            stripped_line += char
-        return stripped_line
+            raise BParserError("Unclosed parenthesis")
@@ -0,0 +1,132 @@
+"""
+On-disk cache of parsed programs for the v3 interpreter.
+
+Interpreter(cache_dir=...) keeps, per program source, the token tree its front end produces: parsed
+and, if the interpreter folds constants, folded. The file is named after a hash of the source lines
+and the options that shape the tree, like a .pyc file, and a later run of the same source loads it
+instead of parsing and folding again. Classes are still discovered from the
+loaded tree, since they refer to the interpreter that runs them. A directory keeps at most MAX_FILES
+programs: storing one more removes those least recently stored or loaded.
+
+The tree is stored with marshal as flat tables rather than nested lists:
+- texts: every distinct token text once, interned again when it is loaded;
+- shape: the tree, an index into texts per atom and OPEN, followed by the line number of the list,
+  and CLOSE markers around every list.
+"""
+
+import gc
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+
+from bparser import ListWithLineNumber
+
+OPEN = -1
+CLOSE = -2
+
+
+class ParseCache:
+    FORMAT_VERSION = 3  # changes whenever the layout of the file, or how the trees in it are folded, changes
+    SUFFIX = '.bpc'
+    MAX_FILES = 1000  # programs kept in a cache directory
+
+    def __init__(self, interpreter, directory, program_source):
+        self.directory = directory
+        key = hashlib.sha256(marshal.dumps((self.FORMAT_VERSION, interpreter.fold_constants, tuple(program_source))))
+        self.path = os.path.join(directory, key.hexdigest() + self.SUFFIX)
+
+    def load(self):
+        """Return (parsed program, folds) stored for the source, or None if there is no usable file"""
+        try:
+            with open(self.path, 'rb') as file:
+                data = file.read()
+            os.utime(self.path)  # the file was used: it is the last one to be evicted
+        except OSError:
+            return None
+        # the tree is built from new objects without cycles: pausing the garbage collector, whose passes
+        # would walk every object built so far, makes the load noticeably faster
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self.__decode(data)
+        except (EOFError, ValueError, TypeError, IndexError):
+            return None  # a corrupt or truncated file is a cache miss: the program is parsed again
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def __decode(self, data):
+        version, texts, shape, folds = marshal.loads(data)
+        if version != self.FORMAT_VERSION:
+            return None
+        texts = [sys.intern(text) for text in texts]
+        program = []
+        stack = [program]
+        items = iter(shape)
+        for item in items:
+            if item >= 0:
+                stack[-1].append(texts[item])
+            elif item == OPEN:
+                line_num = next(items, None)
+                if not isinstance(line_num, int):
+                    return None
+                nested = ListWithLineNumber(line_num)
+                stack[-1].append(nested)
+                stack.append(nested)
+            elif item == CLOSE and len(stack) > 1:
+                stack.pop()
+            else:
+                return None
+        if len(stack) != 1 or not all(isinstance(class_def, list) for class_def in program):
+            return None
+        return program, [tuple(fold) for fold in folds]
+
+    def store(self, parsed_program, folds):
+        """Write the parsed program and its folds for the source; a cache that cannot be written is skipped"""
+        texts = {}  # dict: {key=token text, value=index in the texts table}
+        shape = []
+        self.__flatten(parsed_program, texts, shape)
+        data = marshal.dumps((self.FORMAT_VERSION, list(texts), shape, folds))
+        temp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # write to a temporary file first, so that a concurrent run never reads half a file
+            descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, self.path)
+            self.__evict()
+        except OSError:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def __evict(self):
+        # remove the files least recently stored or loaded beyond MAX_FILES; other runs may be removing
+        # them at the same time, so a file that is already gone is skipped
+        files = []  # all but the one just stored
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self.SUFFIX) and entry.path != self.path:
+                try:
+                    files.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+        if len(files) < self.MAX_FILES:
+            return
+        files.sort()
+        for _, path in files[:len(files) - self.MAX_FILES + 1]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def __flatten(self, items, texts, shape):
+        for item in items:
+            if isinstance(item, list):
+                shape.append(OPEN)
+                shape.append(item.line_num)
+                self.__flatten(item, texts, shape)
+                shape.append(CLOSE)
+            else:
+                shape.append(texts.setdefault(item, len(texts)))
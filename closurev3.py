@@ -0,0 +1,565 @@
+"""
+Compile-to-closure execution engine for the v3 interpreter.
+
+Every method body is translated once into a tree of Python closures: each statement becomes a
+function of the running Frame that returns None, or the Value that is its result in the
+tree-walker (that of a (return ...), a call, or a statement around them), and each expression
+becomes a function of the Frame that returns a Value. Keyword
+dispatch, literal parsing and the decision of whether a name is a local, a parameter or a field
+all happen at translation time, so running a method only calls the prepared closures.
+
+Select it with Interpreter(engine='closure').
+"""
+
+import operator
+
+from intbase import InterpreterBase, ErrorType
+from interpreterv3 import BrewinThrow, Type, Value, add_return_check
+from interpreterv3 import BOOL_TYPE, INT_TYPE, POINTER_TYPE, STRING_TYPE
+from runtimev3 import CallSite, Instance, Runtime, Scope, is_well_formed
+
+# operators on the Python values of operands whose type is known at translation time, so nested
+# expressions and conditions skip the intermediate Values
+# dict: {key=operand type, value={key=operator, value=(operation, result type)}}
+UNBOXED_OPERATIONS = {
+    Type.INT: {
+        '+': (operator.add, Type.INT),
+        '-': (operator.sub, Type.INT),
+        '*': (operator.mul, Type.INT),
+        '/': (lambda a, b: int(a / b), Type.INT),
+        '%': (operator.mod, Type.INT),
+        '==': (operator.eq, Type.BOOL),
+        '!=': (operator.ne, Type.BOOL),
+        '>=': (operator.ge, Type.BOOL),
+        '<=': (operator.le, Type.BOOL),
+        '>': (operator.gt, Type.BOOL),
+        '<': (operator.lt, Type.BOOL),
+    },
+    Type.BOOL: {
+        '==': (operator.eq, Type.BOOL),
+        '!=': (operator.ne, Type.BOOL),
+        '&': (operator.and_, Type.BOOL),
+        '|': (operator.or_, Type.BOOL),
+    },
+    Type.STRING: {
+        '+': (operator.add, Type.STRING),
+        '==': (operator.eq, Type.BOOL),
+        '!=': (operator.ne, Type.BOOL),
+        '>=': (operator.ge, Type.BOOL),
+        '<=': (operator.le, Type.BOOL),
+        '>': (operator.gt, Type.BOOL),
+        '<': (operator.lt, Type.BOOL),
+    },
+}
+PRIMITIVE_TYPES = {InterpreterBase.INT_DEF: Type.INT, InterpreterBase.BOOL_DEF: Type.BOOL,
+                   InterpreterBase.STRING_DEF: Type.STRING}
+
+
+class Frame:
+    """State of one running method"""
+
+    __slots__ = ('me', 'layout', 'locals')
+
+    def __init__(self, me, layout, locals):
+        self.me = me  # the Instance the method was called on
+        # the layout the method was looked up in, where (call me ...) looks up methods too: like in the
+        # tree-walker, that of the base class for a method run by (call super ...)
+        self.layout = layout
+        self.locals = locals  # parameters and (let ...) variables, in the slots given to them by Scope
+
+
+class TailCall:
+    """A call in tail position, returned by the method body that makes it for invoke to run"""
+
+    __slots__ = ('call_site', 'layout', 'me', 'args')
+
+    def __init__(self, call_site, layout, me, args):
+        self.call_site = call_site
+        self.layout = layout
+        self.me = me
+        self.args = args
+
+
+class ClosureEngine:
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.runtime = Runtime(interpreter)
+        self.compiled_classes = {}  # dict: {key=class name, value={key=method name, value=(body, slot count)}}
+        self.__try_depth = 0  # (try ...) statements, body or catch, the statement being compiled is in
+        self.__statement_compilers = {
+            InterpreterBase.PRINT_DEF: self.__compile_print,
+            InterpreterBase.INPUT_INT_DEF: self.__compile_input,
+            InterpreterBase.INPUT_STRING_DEF: self.__compile_input,
+            InterpreterBase.SET_DEF: self.__compile_set,
+            InterpreterBase.CALL_DEF: self.__compile_call_statement,
+            InterpreterBase.WHILE_DEF: self.__compile_while,
+            InterpreterBase.IF_DEF: self.__compile_if,
+            InterpreterBase.RETURN_DEF: self.__compile_return,
+            InterpreterBase.LET_DEF: self.__compile_let,
+            InterpreterBase.BEGIN_DEF: self.__compile_begin,
+            InterpreterBase.THROW_DEF: self.__compile_throw,
+            InterpreterBase.TRY_DEF: self.__compile_try,
+        }
+
+    def run(self, class_def):
+        interpreter = self.interpreter
+        runtime = self.runtime
+        obj = runtime.new_object(class_def.my_name).value
+        interpreter.countdown -= 1
+        if interpreter.countdown < 0:
+            interpreter.check_limits()
+        try:
+            method, _, (body, slot_count) = CallSite(InterpreterBase.MAIN_FUNC_DEF, 0).resolve(obj.layout, [],
+                                                                                            self.__lookup)
+            result = body(Frame(obj, obj.layout, runtime.bind_arguments(method, [], slot_count)))
+            # like in the tree-walker, the result of main is not coerced to its return type, only those of
+            # the calls it makes in tail position
+            if result.__class__ is TailCall:
+                self.__run_tail_calls([], result)
+        except BrewinThrow:
+            pass  # an uncaught exception ends the program, as it does in the tree-walker
+
+    def invoke(self, call_site, layout, me, args):
+        """Call a method of me, looked up in the method table of layout"""
+        interpreter = self.interpreter
+        interpreter.countdown -= 1
+        if interpreter.countdown < 0:
+            interpreter.check_limits()
+        runtime = self.runtime
+        method, _, (body, slot_count) = call_site.resolve(layout, args, self.__lookup)
+        result = body(Frame(me, layout, runtime.bind_arguments(method, args, slot_count)))
+        if result.__class__ is TailCall:
+            return self.__run_tail_calls([method], result)
+        return runtime.coerce_return(method, result)
+
+    def __run_tail_calls(self, methods, result):
+        # run the call a method returned in tail position, and the ones those calls return in turn, one
+        # after the other instead of nested; then coerce the result to the return type of each method on
+        # the way back, innermost first, as nested calls would have
+        interpreter = self.interpreter
+        runtime = self.runtime
+        while result.__class__ is TailCall:
+            interpreter.countdown -= 1
+            if interpreter.countdown < 0:
+                interpreter.check_limits()
+            method, _, (body, slot_count) = result.call_site.resolve(result.layout, result.args, self.__lookup)
+            add_return_check(methods, method)
+            result = body(Frame(result.me, result.layout, runtime.bind_arguments(method, result.args, slot_count)))
+        for method in reversed(methods):
+            result = runtime.coerce_return(method, result)
+        return result
+
+    def __lookup(self, layout, method_name, args):
+        method, owner = self.runtime.find_method(layout, method_name, Runtime.signature(args))
+        compiled = self.compiled_classes.get(owner.name)
+        if compiled is None:
+            # the first call into a class compiles all of its methods
+            compiled = self.compiled_classes[owner.name] = self.__compile_class(owner)
+        return method, owner, compiled[method_name]
+
+    def __compile_class(self, layout):
+        compiled = {}
+        for method in self.runtime.members(layout.name)[1]:
+            scope = Scope.for_method(layout, method)
+            compiled[method[2]] = self.__compile_statement(method[4], scope), scope.slot_count
+        return compiled
+
+    def __fail(self, error_type, description, line_num=None):
+        interpreter = self.interpreter
+
+        def fail(frame):
+            interpreter.error(error_type, description, line_num)
+        return fail
+
+    # statements
+
+    def __compile_statement(self, statement, scope):
+        if not isinstance(statement, list) or not statement or not isinstance(statement[0], str):
+            return self.__fail(ErrorType.SYNTAX_ERROR, "invalid statement")
+        compiler = self.__statement_compilers.get(statement[0])
+        if compiler is None:
+            return self.__fail(ErrorType.SYNTAX_ERROR, f"unknown statement {statement[0]}", statement.line_num)
+        if not is_well_formed(statement):
+            # malformed statements only fail once they run, like they do in the tree-walker
+            return self.__fail(ErrorType.SYNTAX_ERROR, f"malformed {statement[0]} statement", statement.line_num)
+        return compiler(statement, scope)
+
+    def __compile_print(self, statement, scope):
+        line_num = statement.line_num
+        parts = []
+        for arg in statement[1:]:
+            if arg == InterpreterBase.ME_DEF:
+                # the tree-walker does not print objects: to it, me is an undefined variable here
+                parts.append(self.__fail(ErrorType.NAME_ERROR, "undefined variable", line_num))
+            elif arg == InterpreterBase.EXCEPTION_VARIABLE_DEF:
+                current_exception = self.runtime.current_exception
+                parts.append(lambda frame: current_exception(line_num, "undefined variable"))
+            else:
+                parts.append(self.__compile_operand(arg, scope, line_num))
+        output = self.interpreter.output
+        format_value = Runtime.format_value
+
+        def run_print(frame):
+            output(''.join([format_value(part(frame)) for part in parts]))
+        return run_print
+
+    def __compile_input(self, statement, scope):
+        name = statement[1]
+        if name not in scope.fields:
+            return self.__fail(ErrorType.NAME_ERROR, "undefined variable", statement.line_num)
+        slot = scope.fields[name][0]
+        value_type = INT_TYPE if statement[0] == InterpreterBase.INPUT_INT_DEF else STRING_TYPE
+        get_input = self.interpreter.get_input
+
+        def run_input(frame):
+            frame.me.fields[slot] = Value(get_input(), value_type)
+        return run_input
+
+    def __compile_set(self, statement, scope):
+        name = statement[1]
+        value = self.__compile_argument(statement[2], scope, statement.line_num)
+        runtime = self.runtime
+        if name == InterpreterBase.EXCEPTION_VARIABLE_DEF:
+            set_exception = runtime.set_exception
+            return lambda frame: set_exception(value(frame))
+        binding = scope.resolve(name)
+        if binding is None:
+            return self.__fail(ErrorType.NAME_ERROR, "undefined variable", statement.line_num)
+        kind, slot, type_name = binding
+        check_store = runtime.check_store
+        if kind == 'local':
+            def set_local(frame):
+                frame.locals[slot] = check_store(type_name, value(frame))
+            return set_local
+
+        def set_field(frame):
+            frame.me.fields[slot] = check_store(type_name, value(frame))
+        return set_field
+
+    def __compile_call_statement(self, statement, scope):
+        # the result of a call statement is the Value the call returns
+        return self.__compile_call(statement, scope)
+
+    def __compile_while(self, statement, scope):
+        body = self.__compile_statement(statement[2], scope)
+        interpreter = self.interpreter
+        if isinstance(statement[1], list):
+            # like in the tree-walker, an expression condition is evaluated once more before the loop, which
+            # is the result of a loop that never runs, and any value but false, 0, "" and null goes on
+            first = self.__compile_expression(statement[1], scope)
+            unboxed = self.__compile_unboxed(statement[1], scope)
+            condition = unboxed[1] if unboxed is not None else lambda frame: first(frame).value
+
+            def run_while_expression(frame):
+                result = first(frame)
+                while condition(frame):
+                    interpreter.countdown -= 1
+                    if interpreter.countdown < 0:
+                        interpreter.check_limits()
+                    result = body(frame)
+                    if result is not None:
+                        return result
+                return result
+            return run_while_expression
+        condition = self.__compile_condition(statement[1], scope, statement.line_num,
+                                             "not boolean in while statement")
+
+        def run_while(frame):
+            while condition(frame):
+                interpreter.countdown -= 1
+                if interpreter.countdown < 0:
+                    interpreter.check_limits()
+                result = body(frame)
+                if result is not None:
+                    return result
+        return run_while
+
+    def __compile_if(self, statement, scope):
+        condition = self.__compile_condition(statement[1], scope, statement.line_num,
+                                             "not boolean in if statement")
+        then_branch = self.__compile_statement(statement[2], scope)
+        if len(statement) <= 3:
+            def run_if(frame):
+                if condition(frame):
+                    return then_branch(frame)
+            return run_if
+        else_branch = self.__compile_statement(statement[3], scope)
+
+        def run_if_else(frame):
+            if condition(frame):
+                return then_branch(frame)
+            return else_branch(frame)
+        return run_if_else
+
+    def __compile_condition(self, token, scope, line_num, description):
+        """Compile an if/while condition into a closure that returns a Python bool"""
+        if token == InterpreterBase.TRUE_DEF or token == InterpreterBase.FALSE_DEF:
+            constant = token == InterpreterBase.TRUE_DEF
+            return lambda frame: constant
+        if isinstance(token, list):
+            line_num = None  # the tree-walker reports expression conditions without a line
+        elif token == InterpreterBase.ME_DEF or scope.resolve(token) is None:
+            # other than true and false, the tree-walker only takes variables and expressions for conditions
+            return self.__fail(ErrorType.TYPE_ERROR, description, line_num)
+        unboxed = self.__compile_unboxed(token, scope)
+        if unboxed is not None and unboxed[0] is BOOL_TYPE:
+            return unboxed[1]
+        value = self.__compile_operand(token, scope, line_num)
+        interpreter = self.interpreter
+
+        def condition(frame):
+            result = value(frame)
+            if result.type != BOOL_TYPE:
+                interpreter.error(ErrorType.TYPE_ERROR, description, line_num)
+            return result.value
+        return condition
+
+    def __compile_return(self, statement, scope):
+        if len(statement) == 1:
+            void_result = Runtime.VOID_RESULT
+            return lambda frame: void_result
+        if isinstance(statement[1], list) and statement[1] and statement[1][0] == InterpreterBase.CALL_DEF \
+                and self.__try_depth == 0:
+            # a call in tail position; inside a try it must run within the try
+            return self.__compile_call(statement[1], scope, tail=True)
+        return self.__compile_operand(statement[1], scope, None)
+
+    def __compile_let(self, statement, scope):
+        declarations = []
+        declared = {}
+        for variable in statement[1]:
+            if variable[1] in declared:
+                return self.__fail(ErrorType.NAME_ERROR, 'Duplicate definition of local variables')
+            declared[variable[1]] = variable[0]
+            initial_value = self.interpreter.constant(variable[2]) if len(variable) == 3 else None
+            declarations.append((variable[1], variable[0], initial_value))
+        slots = scope.enter_let(declared.items())
+        body = self.__compile_sequence(statement[2:], scope)
+        scope.exit_let()
+        declarations = [(slot, type_name, initial_value)
+                        for slot, (_, type_name, initial_value) in zip(slots, declarations)]
+        declare = self.runtime.declare
+
+        def run_let(frame):
+            slots = frame.locals
+            for slot, type_name, initial_value in declarations:
+                slots[slot] = declare(type_name, initial_value)
+            return body(frame)
+        return run_let
+
+    def __compile_begin(self, statement, scope):
+        return self.__compile_sequence(statement[1:], scope)
+
+    def __compile_sequence(self, statements, scope):
+        # the statements of a begin or let: like in the tree-walker, the first result of one that is not a
+        # call ends them, otherwise their result is that of the last one
+        body = [(self.__compile_statement(sub_statement, scope),
+                 not (isinstance(sub_statement, list) and sub_statement[:1] == [InterpreterBase.CALL_DEF]))
+                for sub_statement in statements]
+        if all(ends for _, ends in body):
+            body = [sub_statement for sub_statement, _ in body]
+
+            def run_statements(frame):
+                for sub_statement in body:
+                    result = sub_statement(frame)
+                    if result is not None:
+                        return result
+            return run_statements
+
+        def run_sequence(frame):
+            result = None
+            for sub_statement, ends in body:
+                result = sub_statement(frame)
+                if ends and result is not None:
+                    return result
+            return result
+        return run_sequence
+
+    def __compile_throw(self, statement, scope):
+        value = self.__compile_argument(statement[1], scope, statement.line_num)
+        interpreter = self.interpreter
+
+        def run_throw(frame):
+            err_msg = value(frame)
+            if err_msg.type is Type.UNDEFINED:
+                interpreter.error(ErrorType.NAME_ERROR, 'Undefined variable')
+            if err_msg.type != STRING_TYPE:
+                interpreter.error(ErrorType.TYPE_ERROR, 'Not a string in throw')
+            raise BrewinThrow(err_msg)
+        return run_throw
+
+    def __compile_try(self, statement, scope):
+        self.__try_depth += 1
+        try:
+            body = self.__compile_statement(statement[1], scope)
+            handler = self.__compile_statement(statement[2], scope)
+        finally:
+            self.__try_depth -= 1
+        interpreter = self.interpreter
+
+        def run_try(frame):
+            # like in the tree-walker, a (return ...) in the body only ends the body: the method goes on
+            # after the try
+            try:
+                body(frame)
+                return None
+            except BrewinThrow as thrown:
+                interpreter.exception = thrown.value
+            # the catch statement runs outside the except clause, so an exception it throws is not chained
+            result = handler(frame)
+            interpreter.exception = None  # the exception variable is gone once a catch completes
+            return result
+        return run_try
+
+    # expressions
+
+    def __compile_argument(self, token, scope, line_num):
+        """
+        Compile the value of a set or throw statement or an argument of a call; there, like in the
+        tree-walker, a name that is not a variable, me included, is an undefined literal that fails the
+        type check or method lookup it gets to
+        """
+        if not isinstance(token, list) and token != InterpreterBase.EXCEPTION_VARIABLE_DEF \
+                and scope.resolve(token) is None:
+            literal = self.interpreter.constant(token)
+            return lambda frame: literal
+        return self.__compile_operand(token, scope, line_num)
+
+    def __compile_operand(self, token, scope, line_num):
+        if isinstance(token, list):
+            return self.__compile_expression(token, scope)
+        if token == InterpreterBase.ME_DEF:
+            class_name = scope.layout.name
+            return lambda frame: Value(frame.me, POINTER_TYPE, class_name)
+        if token == InterpreterBase.EXCEPTION_VARIABLE_DEF:
+            current_exception = self.runtime.current_exception
+            return lambda frame: current_exception()
+        literal = self.interpreter.constant(token)
+        if literal.typeof() != Type.UNDEFINED:
+            return lambda frame: literal
+        binding = scope.resolve(token)
+        if binding is None:
+            return self.__fail(ErrorType.NAME_ERROR, "undefined variable", line_num)
+        kind, slot, _ = binding
+        if kind == 'local':
+            return lambda frame: frame.locals[slot]
+        return lambda frame: frame.me.fields[slot]
+
+    def __compile_expression(self, expression, scope):
+        if not expression:
+            return self.__fail(ErrorType.SYNTAX_ERROR, "empty expression")
+        operator = expression[0]
+        line_num = expression.line_num if isinstance(operator, str) else None
+        if operator == InterpreterBase.CALL_DEF:
+            return self.__compile_call(expression, scope)
+        if operator == InterpreterBase.NEW_DEF:
+            if not is_well_formed(expression):
+                return self.__fail(ErrorType.SYNTAX_ERROR, "malformed new expression", line_num)
+            class_name = expression[1]
+            new_object = self.runtime.new_object
+            return lambda frame: new_object(class_name)
+        if not isinstance(operator, str) or operator not in self.interpreter.operators:
+            return self.__fail(ErrorType.NAME_ERROR, "undefined variable", line_num)
+        unboxed = self.__compile_unboxed(expression, scope)
+        if unboxed is not None:
+            result_type, evaluate = unboxed
+            if result_type is BOOL_TYPE:
+                boolean = Value.boolean
+                return lambda frame: boolean(evaluate(frame))
+            return lambda frame: Value(evaluate(frame), result_type)
+        operands = [self.__compile_operand(token, scope, line_num) for token in expression[1:]]
+        runtime = self.runtime
+        if len(operands) == 1:
+            if operator != '!':
+                return self.__fail(ErrorType.TYPE_ERROR, "operator error", line_num)
+            operand = operands[0]
+            logical_not = runtime.logical_not
+            return lambda frame: logical_not(operand(frame), line_num)
+        if len(operands) != 2:
+            return self.__fail(ErrorType.SYNTAX_ERROR, "invalid operator", line_num)
+        left, right = operands
+        operations = runtime.binary_ops.get(operator, {})
+        binary = runtime.binary
+
+        def evaluate(frame):
+            a = left(frame)
+            b = right(frame)
+            if a.type is b.type and a.type is not POINTER_TYPE:
+                operation = operations.get(a.type)
+                if operation is not None:
+                    return operation(a, b)
+            return binary(operator, a, b, line_num)
+        return evaluate
+
+    def __compile_unboxed(self, token, scope):
+        """
+        Compile an operand whose type is int, bool or string whatever values the program runs with into
+        (its Type, a closure that returns its Python value); return None for any other operand
+        """
+        if isinstance(token, list):
+            if len(token) == 2 and token[0] == '!':
+                operand = self.__compile_unboxed(token[1], scope)
+                if operand is not None and operand[0] is BOOL_TYPE:
+                    evaluate = operand[1]
+                    return BOOL_TYPE, lambda frame: not evaluate(frame)
+            elif len(token) == 3 and isinstance(token[0], str):
+                left = self.__compile_unboxed(token[1], scope)
+                right = self.__compile_unboxed(token[2], scope)
+                if left is not None and right is not None and left[0] is right[0] \
+                        and token[0] in UNBOXED_OPERATIONS[left[0]]:
+                    operation, result_type = UNBOXED_OPERATIONS[left[0]][token[0]]
+                    evaluate_left = left[1]
+                    evaluate_right = right[1]
+                    return result_type, lambda frame: operation(evaluate_left(frame), evaluate_right(frame))
+            return None
+        if token == InterpreterBase.ME_DEF or token == InterpreterBase.EXCEPTION_VARIABLE_DEF:
+            return None
+        constant = self.interpreter.constant(token)
+        literal_type, literal = constant.type, constant.value
+        if literal_type in UNBOXED_OPERATIONS:
+            return literal_type, lambda frame: literal
+        if literal_type is not Type.UNDEFINED:
+            return None
+        binding = scope.resolve(token)
+        # parameters and let variables always hold their declared type; fields can be overwritten by input
+        if binding is not None and binding[0] == 'local' and binding[2] in PRIMITIVE_TYPES:
+            slot = binding[1]
+            return PRIMITIVE_TYPES[binding[2]], lambda frame: frame.locals[slot].value
+        return None
+
+    def __compile_call(self, statement, scope, tail=False):
+        if not is_well_formed(statement):
+            return self.__fail(ErrorType.SYNTAX_ERROR, "malformed call expression", statement.line_num)
+        target = statement[1]
+        if not isinstance(target, list) and target not in (InterpreterBase.ME_DEF, InterpreterBase.SUPER_DEF) \
+                and scope.resolve(target) is None:
+            return self.__fail(ErrorType.FAULT_ERROR, "referenced illegal value")
+        if len(statement) == 2:
+            return self.__fail(ErrorType.SYNTAX_ERROR, "malformed call expression", statement.line_num)
+        call_site = CallSite(statement[2], len(statement) - 3)
+        args = [self.__compile_argument(arg, scope, statement.line_num) for arg in statement[3:]]
+        # a call in tail position is only prepared, for the invoke that runs the method making it
+        invoke = TailCall if tail else self.invoke
+        interpreter = self.interpreter
+        if target == InterpreterBase.ME_DEF:
+            def call_me(frame):
+                return invoke(call_site, frame.layout, frame.me, [arg(frame) for arg in args])
+            return call_me
+        if target == InterpreterBase.SUPER_DEF:
+            super_layout = scope.layout.super_layout
+            if super_layout is None:
+                return self.__fail(ErrorType.NAME_ERROR, "method undefined")
+
+            def call_super(frame):
+                return invoke(call_site, super_layout, frame.me, [arg(frame) for arg in args])
+            return call_super
+        target_value = self.__compile_operand(target, scope, statement.line_num)
+
+        def call(frame):
+            obj = target_value(frame).value
+            if not isinstance(obj, Instance):
+                if obj is None:
+                    interpreter.error(ErrorType.FAULT_ERROR, "referenced a null value")
+                interpreter.error(ErrorType.FAULT_ERROR, "referenced illegal value")
+            return invoke(call_site, obj.layout, obj, [arg(frame) for arg in args])
+        return call
@@ -0,0 +1,170 @@
+"""
+Constant folding pass of the v3 interpreter.
+
+Runs once over the parsed program, before its classes are discovered, and rewrites method bodies
+in place for every engine:
+- an operator expression whose operands are all int, bool or string literals (or fold to them)
+  becomes the literal it evaluates to, e.g. (+ 1 (* 2 3)) becomes 7;
+- (if true A B) becomes A, (if false A B) becomes B and (if false A) and (while false S) become an
+  empty (begin); a while whose condition expression folds to false becomes (return false), since
+  the tree-walker ends the statements around such a loop with the value of its condition.
+
+Expressions that would fail when run, such as (+ 1 "a") or (/ 1 0), are left alone so the error
+still happens when and where the program reaches them. if/while conditions only fold to true or
+false, since the tree-walker reports other literal and expression conditions differently.
+
+Every rewrite is recorded; Interpreter.get_folds() returns them.
+"""
+
+import sys
+
+from bparser import ListWithLineNumber
+from intbase import InterpreterBase
+from interpreterv3 import Type
+
+# types of the literals an expression can fold into
+FOLDABLE_TYPES = (Type.INT, Type.BOOL, Type.STRING)
+
+
+class ConstantFolder:
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.folds = []  # (line number, original, folded) per rewritten expression or statement
+
+    def fold_program(self, parsed_program):
+        """Fold the bodies of the methods of every class and template class; return the folds"""
+        for class_def in parsed_program:
+            self.fold_class(class_def)
+        return self.folds
+
+    def fold_class(self, class_def):
+        """Fold the method bodies of one top-level item of the program if it is a class or template class"""
+        if not isinstance(class_def, list) or not class_def or \
+                class_def[0] not in (InterpreterBase.CLASS_DEF, InterpreterBase.TEMPLATE_CLASS_DEF):
+            return
+        for item in class_def:
+            if isinstance(item, list) and len(item) > 4 and item[0] == InterpreterBase.METHOD_DEF:
+                item[4] = self.__fold_statement(item[4])
+
+    # statements
+
+    def __fold_statement(self, statement):
+        if not isinstance(statement, list) or not statement:
+            return statement
+        keyword = statement[0]
+        if keyword == InterpreterBase.IF_DEF and len(statement) > 2:
+            return self.__fold_if(statement)
+        if keyword == InterpreterBase.WHILE_DEF and len(statement) > 2:
+            return self.__fold_while(statement)
+        if keyword in (InterpreterBase.BEGIN_DEF, InterpreterBase.TRY_DEF):
+            self.__fold_statements(statement, 1)
+        elif keyword == InterpreterBase.LET_DEF:
+            self.__fold_statements(statement, 2)
+        elif keyword in (InterpreterBase.PRINT_DEF, InterpreterBase.RETURN_DEF, InterpreterBase.THROW_DEF):
+            self.__fold_expressions(statement, 1)
+        elif keyword == InterpreterBase.SET_DEF:
+            self.__fold_expressions(statement, 2)
+        elif keyword == InterpreterBase.CALL_DEF:
+            self.__fold_call(statement)
+        return statement
+
+    def __fold_statements(self, statement, start):
+        for i in range(start, len(statement)):
+            statement[i] = self.__fold_statement(statement[i])
+
+    def __fold_if(self, statement):
+        statement[1] = self.__fold_expression(statement[1], condition=True)
+        self.__fold_statements(statement, 2)
+        if statement[1] == InterpreterBase.TRUE_DEF:
+            return self.__strip(statement, statement[2], 'then branch')
+        if statement[1] == InterpreterBase.FALSE_DEF:
+            if len(statement) > 3:
+                return self.__strip(statement, statement[3], 'else branch')
+            return self.__strip(statement, None, '(begin)')
+        return statement
+
+    def __fold_while(self, statement):
+        expression = isinstance(statement[1], list)
+        statement[1] = self.__fold_expression(statement[1], condition=True)
+        statement[2] = self.__fold_statement(statement[2])
+        if statement[1] == InterpreterBase.FALSE_DEF:
+            if expression:
+                line_num = statement.line_num
+                self.folds.append((line_num, f'({statement[0]} {statement[1]} ...)', '(return false)'))
+                return ListWithLineNumber(line_num, (InterpreterBase.RETURN_DEF, InterpreterBase.FALSE_DEF))
+            return self.__strip(statement, None, '(begin)')
+        return statement
+
+    def __strip(self, statement, branch, description):
+        line_num = statement.line_num
+        self.folds.append((line_num, f'({statement[0]} {statement[1]} ...)', description))
+        if branch is None:
+            return ListWithLineNumber(line_num, (InterpreterBase.BEGIN_DEF,))
+        if isinstance(branch, list) and branch and branch[0] == InterpreterBase.CALL_DEF:
+            # the statements around an if end when it runs a call, but not when they run the call themselves
+            return ListWithLineNumber(line_num, (InterpreterBase.BEGIN_DEF, branch))
+        return branch
+
+    # expressions
+
+    def __fold_expressions(self, statement, start):
+        for i in range(start, len(statement)):
+            statement[i] = self.__fold_expression(statement[i])
+
+    def __fold_call(self, expression):
+        if len(expression) > 1 and isinstance(expression[1], list):
+            expression[1] = self.__fold_expression(expression[1])
+        self.__fold_expressions(expression, 3)
+
+    def __fold_expression(self, expression, condition=False):
+        """Return the literal token expression folds into, or expression with its operands folded"""
+        if not isinstance(expression, list) or not expression or isinstance(expression[0], list):
+            return expression
+        operator = expression[0]
+        if operator == InterpreterBase.CALL_DEF:
+            self.__fold_call(expression)
+            return expression
+        if operator not in self.interpreter.operators:
+            return expression
+        original = self.__format(expression)
+        self.__fold_expressions(expression, 1)
+        result = self.__evaluate(operator, expression[1:])
+        if result is None or (condition and result.type != Type.BOOL):
+            return expression
+        token = sys.intern(self.__literal(result))
+        self.folds.append((expression.line_num, original, token))
+        return token
+
+    def __evaluate(self, operator, operands):
+        """Return the Value of operator applied to literal operands, or None if it cannot be folded"""
+        values = []
+        for operand in operands:
+            if isinstance(operand, list):
+                return None
+            value = self.interpreter.constant(operand)
+            if value.type not in FOLDABLE_TYPES:
+                return None
+            values.append(value)
+        operations = self.interpreter.operations[values[0].type] if values else {}
+        if operator not in operations:
+            return None
+        if len(values) == 1 and operator == '!':
+            return operations[operator](values[0])
+        if len(values) != 2 or operator == '!' or values[0].type != values[1].type:
+            return None
+        if operator in ('/', '%') and values[1].value == 0:
+            return None
+        return operations[operator](values[0], values[1])
+
+    @staticmethod
+    def __literal(value):
+        if value.type == Type.BOOL:
+            return InterpreterBase.TRUE_DEF if value.value else InterpreterBase.FALSE_DEF
+        if value.type == Type.STRING:
+            return f'"{value.value}"'
+        return str(value.value)
+
+    def __format(self, expression):
+        if isinstance(expression, list):
+            return '(' + ' '.join([self.__format(token) for token in expression]) + ')'
+        return str(expression)
@@ -0,0 +1,80 @@
+"""
+Input providers of the v3 interpreter.
+
+By default (inputi ...) and (inputs ...) read a line with input(), or take the next string of the
+inp list the interpreter was made with. Interpreter(input_provider=...) takes every value from a
+provider instead:
+- IterableInput takes them from any iterable of strings, one at a time;
+- StreamInput reads a file object or memory-mapped file in large blocks and splits them into lines,
+  or into whitespace separated tokens, only as far as the program asks for values.
+
+A provider returns None once it runs out, as get_input does at the end of the inp list.
+"""
+
+import codecs
+
+
+class InputProvider:
+    """Where the values of inputi and inputs come from"""
+
+    def next(self):
+        """Return the next input value as a string, or None if there is none left"""
+        raise NotImplementedError
+
+
+class IterableInput(InputProvider):
+    """Takes the values from an iterable of strings"""
+
+    def __init__(self, values):
+        self.values = iter(values)
+
+    def next(self):
+        return next(self.values, None)
+
+
+class StreamInput(InputProvider):
+    """
+    Reads a file object or memory-mapped file block_size characters or bytes at a time; each line,
+    without its line break, is a value, or with tokens=True each whitespace separated token. Bytes
+    are decoded as UTF-8
+    """
+
+    BLOCK_SIZE = 1 << 20
+
+    def __init__(self, stream, block_size=BLOCK_SIZE, tokens=False):
+        self.stream = stream
+        self.block_size = block_size
+        self.values = self.__tokens() if tokens else self.__lines()
+
+    def next(self):
+        return next(self.values, None)
+
+    def __blocks(self):
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        while True:
+            block = self.stream.read(self.block_size)
+            if not block:
+                break
+            yield decoder.decode(block) if isinstance(block, bytes) else block
+        yield decoder.decode(b'', final=True)
+
+    def __lines(self):
+        pending = ''
+        for block in self.__blocks():
+            lines = (pending + block).split('\n')
+            pending = lines.pop()  # the part of a line the next block goes on with
+            for line in lines:
+                yield line[:-1] if line.endswith('\r') else line
+        if pending:
+            yield pending[:-1] if pending.endswith('\r') else pending
+
+    def __tokens(self):
+        pending = ''
+        for block in self.__blocks():
+            text = pending + block
+            tokens = text.split()
+            # a token at the very end of the block may go on in the next one
+            pending = tokens.pop() if tokens and not text[-1].isspace() else ''
+            yield from tokens
+        if pending:
+            yield pending
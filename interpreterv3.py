@@ -1,51 +1,314 @@
 from intbase import InterpreterBase, ErrorType
-from bparser import BParser
+from bparser import BParser, BParserError
+from cachev3 import ParseCache
 from enum import Enum
+from collections import OrderedDict
 from copy import deepcopy
+import asyncio
+import sys
+import time
 
 
 class Interpreter(InterpreterBase):
     """Interpreter Class"""
-    def __init__(self, console_output=True, inp=None, trace_output=False):
+    ENGINES = ('tree', 'closure', 'vm')
+    INLINE_CACHE_SIZE = 4  # receiver class and argument type combinations remembered per call site
+    CALL_SITE_LIMIT = 4096  # call sites the tree-walker caches before it starts over
+    TEMPLATE_CACHE_SIZE = 256  # specialized template classes kept before the least recently used is dropped
+    LITERAL_CACHE_SIZE = 65536  # atoms whose Value is kept before the least recently used is dropped
+    MAX_FRAMES = 100000  # default limit on nested method calls of the vm engine
+    YIELD_EVERY = 1000  # loop iterations between two chances for other tasks to run, in run_async
+    LIMIT_CHECK_INTERVAL = 1000  # steps between two looks at the clock, when a run has a time limit
+
+    def __init__(self, console_output=True, inp=None, trace_output=False, engine='tree', fold_constants=True,
+                 cache_dir=None, max_frames=MAX_FRAMES, output_sink=None, input_provider=None,
+                 max_steps=None, time_limit=None):
         super().__init__(console_output, inp)  # call InterpreterBase’s constructor
-        self.all_classes = {}  # dict: {key=class_name, value = class description}
-        self.all_template_classes = {} # dict: {key=template_class_name, value = template_class_description}
+        if engine not in self.ENGINES:
+            raise ValueError(f"unknown execution engine {engine}")
+        self.engine = engine  # 'tree' walks the token lists, 'closure' and 'vm' run compiled method bodies
+        self.fold_constants = fold_constants  # fold constant expressions and if/while on literals before running
+        self.cache_dir = cache_dir  # directory of parsed programs keyed by a hash of their source, None to parse every run
+        # the vm keeps its frames on the heap, so only this limits how deep Brewin calls nest; the other
+        # engines run out of Python stack after a few hundred
+        self.max_frames = max_frames
+        # OutputSink of outputv3 that printed lines go to, None to print them and keep them in output_log
+        if output_sink is not None and not console_output and output_sink.writes_console():
+            raise ValueError("an output sink that writes to the console needs console_output=True")
+        self.output_sink = output_sink
+        # InputProvider of inputv3 that inputi and inputs read from, None to read inp or the console
+        self.input_provider = input_provider
+        # a run that takes more than max_steps steps, every loop iteration and method call being one, or
+        # more than time_limit seconds ends with a FAULT_ERROR; None for no limit
+        self.max_steps = max_steps
+        self.time_limit = time_limit
+        # the operator tables, default values and constants do not depend on the program, so every run
+        # of the interpreter shares them
         self.operations = {}
         self.operators = {'+', '-', '*', '/', '%', '==', '>=', '<=', '!=', '>', '<', '&', '|', '!'}
-        self.type_match = {}
         self.default_return_val = {}
+        self.constants = OrderedDict()  # dict: {key=atom, value=Value it parses to, Type.UNDEFINED for names}
+        self.__init_operations()
+        self.__init_default_return_val()
+        self.__reset_program()
+        self.__start_limits()
+
+    def __reset_program(self):
+        # state of the program being run; each run starts over with new tables instead of clearing them
+        self.folds = []  # (line number, original, folded) for every rewrite of the constant folder
+        self.all_classes = {}  # dict: {key=class_name, value = class description}
+        self.all_template_classes = {} # dict: {key=template_class_name, value = template_class_description}
+        self.type_match = {}
+        self.__init_type_match()
         self.class_relationships = {}
+        self.ancestors = {}  # dict: {key=class name, value=frozenset of the class and every class it inherits from}
         self.exception = None
+        self.call_site_caches = {}  # dict: {key=id of a call statement, value=(statement, inline cache)}
+        self.template_instances = OrderedDict()  # dict: {key=full template name such as node@int, value=ClassDefinition}
+        self.template_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
 
     def run(self, program_source):
+        """
+        Run a program given as a list of lines, or read it from a file object, memory-mapped file or any
+        other iterator of lines: then each class is discovered as soon as it is read, and a syntax error is
+        only reported when the parser reaches it.
+
+        An interpreter can run any number of programs, one after the other: every run starts from a clean
+        program state, and reset() clears the output and input cursor of the previous one
+        """
+        try:
+            class_def = self.__load_program(program_source)
+            try:
+                self.__run_main(class_def)
+            except RecursionError:
+                self.error(ErrorType.FAULT_ERROR, "call stack exhausted")
+        finally:
+            if self.output_sink is not None:
+                self.output_sink.flush()
+
+    async def run_async(self, program_source, read_input=None, write_output=None, yield_every=YIELD_EVERY):
+        """
+        Run a program like run does, as a coroutine on the vm engine: inputi and inputs await read_input(),
+        print awaits write_output(line), and every yield_every iterations of a loop the program gives way
+        to the other tasks of the event loop. Without read_input or write_output, values are read with
+        get_input and lines printed with output, as they are by run
+        """
+        if self.engine != 'vm':
+            # the other engines run Brewin calls on the Python stack, so they cannot be suspended
+            raise ValueError("run_async needs the vm engine")
+        if yield_every < 1:
+            raise ValueError("yield_every must be at least 1")
+        from vmv3 import INPUT_REQUEST, OUTPUT_REQUEST
+        try:
+            class_def = self.__load_program(program_source)
+            steps = self.__load_engine().steps(class_def, yield_every)
+            reply = None
+            while True:
+                try:
+                    request = steps.send(reply)
+                except StopIteration:
+                    break
+                reply = None
+                if request[0] == INPUT_REQUEST:
+                    reply = self.get_input() if read_input is None else await read_input()
+                elif request[0] == OUTPUT_REQUEST:
+                    if write_output is None:
+                        self.output(request[1])
+                    else:
+                        await write_output(request[1])
+                else:
+                    await asyncio.sleep(0)
+        finally:
+            if self.output_sink is not None:
+                self.output_sink.flush()
+
+    def __load_program(self, program_source):
+        # parse, fold and discover the classes of a program; return the main class
+        self.__reset_program()
+        self.__start_limits()
+        cache = self.__load_cache(program_source)
+        cached_program = cache.load() if cache is not None else None
+        if cached_program is not None:
+            parsed_program, self.folds = cached_program
+            for class_def in parsed_program:
+                self.__track_class(class_def)
+        else:
+            parsed_program = self.__parse(program_source)
+            folder = self.__load_folder() if self.fold_constants else None
+            for class_def in parsed_program:
+                if folder is not None:
+                    folder.fold_class(class_def)
+                self.__track_class(class_def)
+            if cache is not None:
+                cache.store(parsed_program, self.folds)
+        for class_name in self.class_relationships:
+            self.ancestors[class_name] = self.__find_ancestors(class_name)
+        return self.__find_definition_for_class(self.MAIN_CLASS_DEF)
+
+    def __run_main(self, class_def):
+        if self.engine != 'tree':
+            self.__load_engine().run(class_def)
+            return
+        obj = class_def.instantiate_object()
+        try:
+            obj.run_main()
+        except BrewinThrow:
+            pass  # an uncaught exception ends the program
+
+    def __start_limits(self):
+        self.steps_taken = 0  # steps counted by check_limits so far
+        self.deadline = None if self.time_limit is None else time.monotonic() + self.time_limit
+        self.__set_countdown()
+
+    def __set_countdown(self):
+        countdown = sys.maxsize if self.deadline is None else self.LIMIT_CHECK_INTERVAL
+        if self.max_steps is not None:
+            countdown = min(countdown, self.max_steps - self.steps_taken)
+        self.steps_granted = countdown
+        self.countdown = countdown  # steps the engines may take before they call check_limits
+
+    def check_limits(self):
+        """
+        Called by the engines once their steps take countdown below 0: end the run if it took more steps
+        than max_steps or is past its time limit, otherwise let it go on for another countdown steps
+        """
+        self.steps_taken += self.steps_granted + 1  # the steps of the countdown and the one that ended it
+        if self.max_steps is not None and self.steps_taken > self.max_steps:
+            self.error(ErrorType.FAULT_ERROR, "step budget exhausted")
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.error(ErrorType.FAULT_ERROR, "time limit exceeded")
+        self.__set_countdown()
+
+    def __parse(self, program_source):
+        if not isinstance(program_source, (list, tuple)):
+            return self.__parse_stream(program_source)
         # first parse the program
-        result, parsed_program = BParser.parse(program_source)
+        result, parsed_program = BParser.parse(program_source, interned=True)
         if result == False:
             self.error(ErrorType.SYNTAX_ERROR, "invalid input")
-        print(parsed_program)  # ! delete this before submission
-        self.__init_operations()
-        self.__init_type_match()
-        self.__init_default_return_val()
-        self.__discover_all_classes_and_track_them(parsed_program)
-        class_def = self.__find_definition_for_class(self.MAIN_CLASS_DEF)
-        obj = class_def.instantiate_object()
-        obj.run_method(InterpreterBase.MAIN_FUNC_DEF)
-
-    def __discover_all_classes_and_track_them(self, parsed_program):
-        # find all classes and put them is all_classes
-        for class_def in parsed_program:
-            if class_def[1] not in self.all_classes and class_def[0] == InterpreterBase.CLASS_DEF:
-                class_definition = ClassDefinition(class_def[1], class_def[2:], self)
-                self.class_relationships[class_def[1]] = class_definition.super_class
-                self.all_classes[class_def[1]] = class_definition
-                self.type_match[class_def[1]] = Type.POINTER
-            elif class_def[0] == InterpreterBase.TEMPLATE_CLASS_DEF and class_def[1] not in self.all_template_classes:
-                class_definition = ClassDefinition(class_def[1], class_def[3:], self)
-                class_definition.parametrized_types = class_def[2]
-                self.all_template_classes[class_def[1]] = class_definition
-            else:
-                self.error(ErrorType.TYPE_ERROR, f"duplicate class name {class_def[1]} {class_def[1].line_num}")
-            # ! check if the program has at least one class
+        return parsed_program
+
+    def __parse_stream(self, program_source):
+        try:
+            yield from BParser.parse_stream(program_source, interned=True)
+        except BParserError:
+            self.error(ErrorType.SYNTAX_ERROR, "invalid input")
+
+    def output(self, val):
+        if self.output_sink is None:
+            super().output(val)
+        else:
+            self.output_sink.write(val)
+
+    def get_input(self):
+        if self.input_provider is None:
+            return super().get_input()
+        return self.input_provider.next()
+
+    def get_output(self):
+        if self.output_sink is None:
+            return super().get_output()
+        return self.output_sink.get_output()
+
+    def reset(self):
+        """Reset I/O and the state of the last program for another run"""
+        super().reset()
+        if self.output_sink is not None:
+            self.output_sink.clear()
+        self.__reset_program()
+
+    def constant(self, token):
+        """Return the shared Value of an atom of the program; it must not be modified"""
+        constant = self.constants.get(token)
+        if constant is not None:
+            self.constants.move_to_end(token)
+            return constant
+        constant = self.constants[token] = Value(token)
+        if len(self.constants) > self.LITERAL_CACHE_SIZE:
+            # an interpreter that runs many programs would otherwise keep the atoms of all of them
+            self.constants.popitem(last=False)
+        return constant
+
+    def literal(self, token):
+        """Return a new Value of an atom of the program, for the tree-walker, which modifies the Values it evaluates"""
+        constant = self.constant(token)
+        return Value(constant.value, constant.type)
+
+    def get_folds(self):
+        """Return (line number, original, folded) for every expression and statement the constant folder rewrote"""
+        return self.folds
+
+    def __load_cache(self, program_source):
+        # a streamed program is not cached: its hash would only be known once all of it has been read
+        if self.cache_dir is None or not isinstance(program_source, (list, tuple)):
+            return None
+        return ParseCache(self, self.cache_dir, program_source)
+
+    def __load_folder(self):
+        from foldv3 import ConstantFolder  # imports this module, like the engines
+        folder = ConstantFolder(self)
+        self.folds = folder.folds
+        return folder
+
+    def __load_engine(self):
+        # the compiled engines build on the classes of this module, so they are imported on demand
+        if self.engine == 'closure':
+            from closurev3 import ClosureEngine
+            return ClosureEngine(self)
+        from vmv3 import VirtualMachine
+        return VirtualMachine(self)
+
+    def __track_class(self, class_def):
+        # put a class in all_classes, or a template class in all_template_classes
+        if class_def[1] not in self.all_classes and class_def[0] == InterpreterBase.CLASS_DEF:
+            class_definition = ClassDefinition(class_def[1], class_def[2:], self)
+            self.class_relationships[class_def[1]] = class_definition.super_class
+            self.all_classes[class_def[1]] = class_definition
+            self.type_match[class_def[1]] = Type.POINTER
+        elif class_def[0] == InterpreterBase.TEMPLATE_CLASS_DEF and class_def[1] not in self.all_template_classes:
+            class_definition = ClassDefinition(class_def[1], class_def[3:], self)
+            class_definition.parametrized_types = class_def[2]
+            self.all_template_classes[class_def[1]] = class_definition
+        else:
+            self.error(ErrorType.TYPE_ERROR, f"duplicate class name {class_def[1]} {class_def.line_num}")
+        # ! check if the program has at least one class
+
+    def specialize_template(self, name):
+        """Return the class definition of a template instantiation such as node@int, specializing it on first use"""
+        class_def = self.template_instances.get(name)
+        if class_def is not None:
+            self.template_instances.move_to_end(name)
+            self.template_cache_stats['hits'] += 1
+            return class_def
+        self.template_cache_stats['misses'] += 1
+        param = name.split(InterpreterBase.TYPE_CONCAT_CHAR)
+        class_def = self.template_instances[name] = self.all_template_classes[param[0]].instantiate_template(
+            name, param[1:])
+        if len(self.template_instances) > self.TEMPLATE_CACHE_SIZE:
+            self.template_instances.popitem(last=False)
+            self.template_cache_stats['evictions'] += 1
+        return class_def
+
+    def get_template_cache_stats(self):
+        """Return hits, misses and evictions of the cache of specialized template classes, and its size"""
+        return dict(self.template_cache_stats, size=len(self.template_instances))
+
+    def __find_ancestors(self, class_name):
+        ancestors = [class_name]
+        # a base class that is not defined still counts as an ancestor; stop at the first repeated name
+        while ancestors[-1] in self.class_relationships and self.class_relationships[ancestors[-1]] is not None \
+                and self.class_relationships[ancestors[-1]] not in ancestors:
+            ancestors.append(self.class_relationships[ancestors[-1]])
+        return frozenset(ancestors)
+
+    def is_subclass(self, base_name, derived_name):
+        """True if derived_name is base_name or inherits from it; None (the class of null) matches every class"""
+        if derived_name is None:
+            return True
+        ancestors = self.ancestors.get(derived_name)
+        if ancestors is None:
+            return base_name == derived_name
+        return base_name in ancestors
 
     def __find_definition_for_class(self, class_name):
         if class_name in self.all_classes:
@@ -59,37 +322,37 @@ class Interpreter(InterpreterBase):
         https://github.com/UCLA-CS-131/fall-22-proj-starter/blob/main/interpreterv1.py
         """
         self.operations[Type.INT] = {
-            '+': lambda x, y: Value(x.val() + y.val(), Type.INT),
-            '-': lambda x, y: Value(x.val() - y.val(), Type.INT),
-            '*': lambda x, y: Value(x.val() * y.val(), Type.INT),
-            '/': lambda x, y: Value(x.val() / y.val(), Type.INT),
-            '%': lambda x, y: Value(x.val() % y.val(), Type.INT),
-            '==': lambda x, y: Value(x.val() == y.val(), Type.BOOL),
-            '>=': lambda x, y: Value(x.val() >= y.val(), Type.BOOL),
-            '<=': lambda x, y: Value(x.val() <= y.val(), Type.BOOL),
-            '>': lambda x, y: Value(x.val() > y.val(), Type.BOOL),
-            '<': lambda x, y: Value(x.val() < y.val(), Type.BOOL),
-            '!=': lambda x, y: Value(x.val() != y.val(), Type.BOOL),
+            '+': lambda x, y: Value(x.val() + y.val(), INT_TYPE),
+            '-': lambda x, y: Value(x.val() - y.val(), INT_TYPE),
+            '*': lambda x, y: Value(x.val() * y.val(), INT_TYPE),
+            '/': lambda x, y: Value(x.val() / y.val(), INT_TYPE),
+            '%': lambda x, y: Value(x.val() % y.val(), INT_TYPE),
+            '==': lambda x, y: Value.boolean(x.val() == y.val()),
+            '>=': lambda x, y: Value.boolean(x.val() >= y.val()),
+            '<=': lambda x, y: Value.boolean(x.val() <= y.val()),
+            '>': lambda x, y: Value.boolean(x.val() > y.val()),
+            '<': lambda x, y: Value.boolean(x.val() < y.val()),
+            '!=': lambda x, y: Value.boolean(x.val() != y.val()),
         }
         self.operations[Type.BOOL] = {
-            '!=': lambda x, y: Value(x.val() != y.val(), Type.BOOL),
-            '==': lambda x, y: Value(x.val() == y.val(), Type.BOOL),
-            '&': lambda x, y: Value(x.val() & y.val(), Type.BOOL),
-            '|': lambda x, y: Value(x.val() | y.val(), Type.BOOL),
-            '!': lambda x: Value(not x.val(), Type.BOOL)
+            '!=': lambda x, y: Value.boolean(x.val() != y.val()),
+            '==': lambda x, y: Value.boolean(x.val() == y.val()),
+            '&': lambda x, y: Value.boolean(x.val() & y.val()),
+            '|': lambda x, y: Value.boolean(x.val() | y.val()),
+            '!': lambda x: Value.boolean(not x.val())
         }
         self.operations[Type.STRING] = {
-            '+': lambda x, y: Value(x.val() + y.val(), Type.STRING),
-            '==': lambda x, y: Value(x.val() == y.val(), Type.BOOL),
-            '!=': lambda x, y: Value(x.val() != y.val(), Type.BOOL),
-            '>=': lambda x, y: Value(x.val() >= y.val(), Type.BOOL),
-            '<=': lambda x, y: Value(x.val() <= y.val(), Type.BOOL),
-            '>': lambda x, y: Value(x.val() > y.val(), Type.BOOL),
-            '<': lambda x, y: Value(x.val() < y.val(), Type.BOOL),
+            '+': lambda x, y: Value(x.val() + y.val(), STRING_TYPE),
+            '==': lambda x, y: Value.boolean(x.val() == y.val()),
+            '!=': lambda x, y: Value.boolean(x.val() != y.val()),
+            '>=': lambda x, y: Value.boolean(x.val() >= y.val()),
+            '<=': lambda x, y: Value.boolean(x.val() <= y.val()),
+            '>': lambda x, y: Value.boolean(x.val() > y.val()),
+            '<': lambda x, y: Value.boolean(x.val() < y.val()),
         }
         self.operations[Type.POINTER] = {
-            '==': lambda x, y: Value(x.val() is y.val(), Type.BOOL),
-            '!=': lambda x, y: Value(x.val() is not y.val(), Type.BOOL)
+            '==': lambda x, y: Value.boolean(x.val() is y.val()),
+            '!=': lambda x, y: Value.boolean(x.val() is not y.val())
         }
 
     def __init_type_match(self):
@@ -113,6 +376,10 @@ class ClassDefinition:
         self.interpreter = interpreter
         self.super_class = None
         self.parametrized_types = None
+        # method table shared by every instance, built on the first instantiation of the class
+        self.methods = None  # dict: {key=method name, value=Method}
+        self.method_table = None  # dict: {key=method name, value=[(Method, depth)] from this class up to the base class}
+        self.dispatch_cache = {}  # dict: {key=(method name, argument types), value=(Method, depth)}
         if len(self.my_class_definition) >= 2:
             if self.my_class_definition[0] == 'inherits':
                 self.super_class = self.my_class_definition[1]
@@ -125,7 +392,7 @@ class ClassDefinition:
                 self.interpreter.error(ErrorType.NAME_ERROR, "duplicate names")
 
     # uses the definition of a class to create and return an instance of it
-    def instantiate_object(self, param=None):
+    def instantiate_object(self):
         obj = ObjectDefinition(self.interpreter)
         obj.class_name = self.my_name
         # ! assume a class cannot inherit itself
@@ -137,18 +404,42 @@ class ClassDefinition:
                 self.interpreter.error(ErrorType.NAME_ERROR, 'Base class not found')
 
         for field in self.my_fields:
-            if self.parametrized_types is not None:
-                field = deepcopy(field)
-                self.__search_and_replace(field, param)
             obj.add_field(field)
 
+        if self.methods is None:
+            self.__build_method_table()
+        obj.class_definition = self
+        obj.obj_methods = self.methods
+        return obj
+
+    def instantiate_template(self, name, param):
+        """Return the definition of the class name, this template class with its type parameters replaced by param"""
+        class_def = ClassDefinition(name, [], self.interpreter)
+        class_def.super_class = self.super_class
+        class_def.my_fields = [self.specialize(field, param) for field in self.my_fields]
+        class_def.my_methods = [self.specialize(method, param) for method in self.my_methods]
+        return class_def
+
+    def __build_method_table(self):
+        methods = {}
         for method in self.my_methods:
-            if self.parametrized_types is not None:
-                method = deepcopy(method)
-                self.__search_and_replace(method, param)
-            obj.add_method(method)
+            if method[2] in methods:
+                self.interpreter.error(ErrorType.NAME_ERROR, "duplicate method")
+            methods[method[2]] = Method(method[1], method[2], method[3], method[4], self.interpreter)
+        # the base class was instantiated first, so its table is already built
+        method_table = {name: [(method, 0)] for name, method in methods.items()}
+        if self.super_class is not None:
+            for name, overloads in self.interpreter.all_classes[self.super_class].method_table.items():
+                method_table.setdefault(name, []).extend((method, depth + 1) for method, depth in overloads)
+        self.method_table = method_table
+        self.methods = methods
+
+    def specialize(self, item, param):
+        """Return a copy of a field or method of a template class with its type parameters replaced."""
+        item = deepcopy(item)
+        self.__search_and_replace(item, param)
+        return item
 
-        return obj
     def __search_and_replace(self, lst, param):
         if len(lst) == 0:
             return
@@ -158,26 +449,22 @@ class ClassDefinition:
             else:
                 for j in range(len(self.parametrized_types)):
                     if lst[i] == self.parametrized_types[j]:
-                        lst[i] = param[j]
+                        lst[i] = sys.intern(param[j])
                     elif lst[i].split('@')[0] in self.interpreter.all_template_classes:
-                        lst[i] = lst[i].replace(self.parametrized_types[j], param[j])
+                        lst[i] = sys.intern(lst[i].replace(self.parametrized_types[j], param[j]))
 
 class ObjectDefinition:
     def __init__(self, interpreter):
         self.interpreter = interpreter
         self.class_name = None
+        self.class_definition = None  # class whose method table this object uses
         self.obj_methods = {}  # object methods
         self.obj_variables = {}  # fields of object
         self.method_variables = []  # stack frame of variables
         self.local_variables = [{}]  # stack frame of local variables
         self.super_object = None
         self.original_calling_object = self
-
-    def add_method(self, method):
-        if method[2] in self.obj_methods:
-            self.interpreter.error(ErrorType.NAME_ERROR, "duplicate method")
-        else:
-            self.obj_methods[method[2]] = Method(method[1], method[2], method[3], method[4], self.interpreter)
+        self.block_depth = 0  # (let ...) and (try ...) statements of the running method the current statement is in
 
     def add_field(self, field):
         if field[2] in self.obj_variables:
@@ -185,7 +472,7 @@ class ObjectDefinition:
         if field[1].split('@')[0] in self.interpreter.all_template_classes:
             self.__check_template_class(field[1])
         if len(field) == 4:
-            temp_value = Value(field[3])
+            temp_value = self.interpreter.literal(field[3])
         else:
             temp_type = self.interpreter.type_match[field[1]]
             val = self.interpreter.default_return_val[temp_type].val()
@@ -198,38 +485,60 @@ class ObjectDefinition:
         self.obj_variables[field[2]] = temp_value
 
     # Interpret the specified method using the provided parameters
-    def run_method(self, method_name, parameters={}, type_signature=[]):
+    def run_method(self, method_name, parameters={}, type_signature=[], method=None):
+        interpreter = self.interpreter
+        interpreter.countdown -= 1
+        if interpreter.countdown < 0:
+            interpreter.check_limits()
         self.method_variables.append(parameters)
-        method, calling_obj = self.__find_method(method_name, type_signature)
+        if method is None:
+            method, calling_obj = self.__find_method(method_name, type_signature)
+        else:
+            calling_obj = self
         statement = method.get_top_level_statement()
-        result = calling_obj.__run_statement(statement)
-        self.method_variables.pop()
-        return result
+        block_depth = calling_obj.block_depth
+        calling_obj.block_depth = 0
+        try:
+            return calling_obj.__run_statement(statement)
+        finally:
+            self.method_variables.pop()
+            calling_obj.block_depth = block_depth
+
+    def run_main(self):
+        """Run the main method of the object, and the calls it makes in tail position"""
+        result = self.run_method(InterpreterBase.MAIN_FUNC_DEF)
+        if result is not None and result.type is TAIL_CALL_TYPE:
+            self.__finish_call(result.value)
 
     def __find_method(self, method_name, type_signature):
-        if method_name in self.obj_methods and self.obj_methods[method_name].get_type_signature() == type_signature:
-            return self.obj_methods[method_name], self
-        elif method_name in self.obj_methods and len(self.obj_methods[method_name].get_type_signature()) == len(
-                type_signature):
-            method_type_signature = self.obj_methods[method_name].get_type_signature()
-            flag = True
-            for i in range(len(method_type_signature)):
-                if isinstance(method_type_signature[i], tuple) and isinstance(type_signature[i], tuple):
-                    if not self.__find_class_name(method_type_signature[i][1], type_signature[i][1]):
-                        flag = False
-                else:
-                    if method_type_signature[i] != type_signature[i]:
-                        flag = False
-            if flag:
-                return self.obj_methods[method_name], self
-            elif self.super_object is not None:
-                return self.super_object.__find_method(method_name, type_signature)
+        dispatch_cache = self.class_definition.dispatch_cache
+        key = (method_name, tuple(type_signature))
+        entry = dispatch_cache.get(key)
+        if entry is None:
+            for method, depth in self.class_definition.method_table.get(method_name, ()):
+                if self.__signature_matches(method.get_type_signature(), type_signature):
+                    entry = dispatch_cache[key] = (method, depth)
+                    break
             else:
                 self.interpreter.error(ErrorType.NAME_ERROR, "method undefined")
-        elif self.super_object is not None:
-            return self.super_object.__find_method(method_name, type_signature)
-        else:
-            self.interpreter.error(ErrorType.NAME_ERROR, "method undefined")
+        method, depth = entry
+        calling_obj = self
+        for _ in range(depth):
+            calling_obj = calling_obj.super_object
+        return method, calling_obj
+
+    def __signature_matches(self, method_type_signature, type_signature):
+        if method_type_signature == type_signature:
+            return True
+        if len(method_type_signature) != len(type_signature):
+            return False
+        for i in range(len(method_type_signature)):
+            if isinstance(method_type_signature[i], tuple) and isinstance(type_signature[i], tuple):
+                if not self.__find_class_name(method_type_signature[i][1], type_signature[i][1]):
+                    return False
+            elif method_type_signature[i] != type_signature[i]:
+                return False
+        return True
 
     # runs/interprets the passed-in statement until completion and
     # gets the result, if any
@@ -265,13 +574,9 @@ class ObjectDefinition:
             if isinstance(out_stmt[i], list):
                 if out_stmt[i][0] == 'call':
                     result = self.__execute_call_statement(out_stmt[i])
-                    if result is not None and result.typeof() == Type.ERROR:
-                        return result
                     out_str += self.__format_string(result)
                 else:
                     result = self.__evaluate_expression(out_stmt[i])
-                    if result is not None and result.typeof() == Type.ERROR:
-                        return result
                     out_str += self.__format_string(result)
             elif self.__find_local_variables(out_stmt[i]) is not None:
                 index = self.__find_local_variables(out_stmt[i])
@@ -280,12 +585,12 @@ class ObjectDefinition:
                 out_str += self.__format_string(self.method_variables[-1][out_stmt[i]])
             elif out_stmt[i] in self.obj_variables:
                 out_str += self.__format_string(self.obj_variables[out_stmt[i]])
-            elif Value(out_stmt[i]).typeof() is not Type.UNDEFINED:
-                out_str += self.__format_string(Value(out_stmt[i]))
+            elif self.interpreter.constant(out_stmt[i]).typeof() is not Type.UNDEFINED:
+                out_str += self.__format_string(self.interpreter.constant(out_stmt[i]))
             elif out_stmt[i] == InterpreterBase.EXCEPTION_VARIABLE_DEF and self.interpreter.exception is not None:
                 out_str += self.__format_string(self.interpreter.exception)
             else:
-                self.interpreter.error(ErrorType.NAME_ERROR, "undefined variable", statement[0].line_num)
+                self.interpreter.error(ErrorType.NAME_ERROR, "undefined variable", statement.line_num)
         self.interpreter.output(out_str)
 
     def __find_local_variables(self, name):
@@ -310,7 +615,7 @@ class ObjectDefinition:
 
     def __execute_input_statement(self, statement):
         if statement[1] not in self.obj_variables:
-            self.interpreter.error(ErrorType.NAME_ERROR, "undefined variable", statement[0].line_num)
+            self.interpreter.error(ErrorType.NAME_ERROR, "undefined variable", statement.line_num)
         elif statement[0] == 'inputi':
             self.obj_variables[statement[1]] = Value(self.interpreter.get_input(), Type.INT)
         elif statement[0] == 'inputs':
@@ -322,7 +627,7 @@ class ObjectDefinition:
             if (statement[1] not in self.obj_variables) and (statement[1] not in self.method_variables[-1]):
                 # ! there might be a problem with stack of super class
                     if statement[1] != InterpreterBase.EXCEPTION_VARIABLE_DEF:
-                        self.interpreter.error(ErrorType.NAME_ERROR, "undefined variable", statement[0].line_num)
+                        self.interpreter.error(ErrorType.NAME_ERROR, "undefined variable", statement.line_num)
 
         name = statement[1]
         if isinstance(statement[2], list):
@@ -330,8 +635,6 @@ class ObjectDefinition:
                 result = self.__execute_call_statement(statement[2])
             else:
                 result = self.__evaluate_expression(statement[2])
-            if result is not None and result.typeof() == Type.ERROR:
-                return result
             if name == InterpreterBase.EXCEPTION_VARIABLE_DEF:
                 if self.interpreter.exception is None:
                     self.interpreter.error(ErrorType.NAME_ERROR, 'Undefined exception')
@@ -373,7 +676,7 @@ class ObjectDefinition:
                 elif statement[2] in self.obj_variables:
                     temp_value = self.obj_variables[statement[2]]
                 else:
-                    temp_value = Value(statement[2])
+                    temp_value = self.interpreter.literal(statement[2])
                 self.__type_check(self.interpreter.exception, temp_value)
                 self.interpreter.exception = temp_value
             elif self.__find_local_variables(name) is not None:
@@ -391,7 +694,7 @@ class ObjectDefinition:
                 elif statement[2] in self.obj_variables:
                     temp_value = self.obj_variables[statement[2]]
                 else:
-                    temp_value = Value(statement[2])
+                    temp_value = self.interpreter.literal(statement[2])
                     if temp_value.typeof() == Type.POINTER:
                         temp_value.class_name = self.local_variables[index][name].class_name
                 self.__type_check(self.local_variables[index][name], temp_value)
@@ -410,7 +713,7 @@ class ObjectDefinition:
                 elif statement[2] in self.obj_variables:
                     temp_value = self.obj_variables[statement[2]]
                 else:
-                    temp_value = Value(statement[2])
+                    temp_value = self.interpreter.literal(statement[2])
                     if temp_value.typeof() == Type.POINTER:
                         temp_value.class_name = self.method_variables[-1][name].class_name
                 self.__type_check(self.method_variables[-1][name], temp_value)
@@ -430,7 +733,7 @@ class ObjectDefinition:
                 elif statement[2] in self.obj_variables:
                     temp_value = self.obj_variables[statement[2]]
                 else:
-                    temp_value = Value(statement[2])
+                    temp_value = self.interpreter.literal(statement[2])
                     if temp_value.typeof() == Type.POINTER:
                         temp_value.class_name = self.obj_variables[name].class_name
 
@@ -448,6 +751,10 @@ class ObjectDefinition:
             self.interpreter.error(ErrorType.TYPE_ERROR, 'Assigning incompatible type')
 
     def __execute_call_statement(self, statement):
+        return self.__finish_call(self.__prepare_call(statement))
+
+    def __prepare_call(self, statement):
+        # evaluate the target and arguments of a call and find its method, without running it
         local_variables = {}
         method = None
         param_names = None
@@ -490,8 +797,6 @@ class ObjectDefinition:
         for i in range(len(param_values)):
             if isinstance(param_values[i], list):
                 temp_value = self.__evaluate_expression(param_values[i])
-                if temp_value is not None and temp_value.typeof() == Type.ERROR:
-                    return temp_value
             elif param_values[i] == InterpreterBase.EXCEPTION_VARIABLE_DEF:
                 if self.interpreter.exception is not None:
                     temp_value = self.interpreter.exception
@@ -505,14 +810,14 @@ class ObjectDefinition:
             elif param_values[i] in self.obj_variables:
                 temp_value = self.obj_variables[param_values[i]]
             else:
-                temp_value = Value(param_values[i])
+                temp_value = self.interpreter.literal(param_values[i])
             temp_list.append(temp_value)
             if temp_value.typeof() == Type.POINTER:
                 type_signature.append((temp_value.typeof(), temp_value.class_name))
             else:
                 type_signature.append(temp_value.typeof())
 
-        method, calling_obj = obj.__find_method(statement[2], type_signature)
+        method, calling_obj = self.__find_method_at_call_site(obj, statement, type_signature)
         param_names = method.get_params()
         for j in range(len(param_names)):
             if temp_list[j].typeof() == Type.POINTER:
@@ -522,14 +827,30 @@ class ObjectDefinition:
                 if temp_list[j].val() is None and temp_list[j].class_name is None:
                     temp_list[j].class_name = param_names[j][0]
             local_variables[param_names[j][1]] = temp_list[j]
+        return obj, calling_obj, method, statement[2], local_variables, type_signature
+
+    def __finish_call(self, call):
+        # run a prepared call; when its method ends with a call in tail position, that call comes back
+        # as a Type.TAIL_CALL Value and runs here in turn, instead of nesting inside the method. The
+        # result is then checked against the return type of every method on the way back, in the order
+        # the nested calls would have; see add_return_check for the ones that are left out
+        methods = [call[2]]
+        while True:
+            obj, calling_obj, method, method_name, local_variables, type_signature = call
+            calling_obj.original_calling_object = obj
+            result = calling_obj.run_method(method_name, local_variables, type_signature, method)
+            if result is None or result.type is not TAIL_CALL_TYPE:
+                break
+            call = result.value
+            add_return_check(methods, call[2])
+        for method in reversed(methods):
+            result = self.__coerce_return(method, result)
+        return result
 
-        calling_obj.original_calling_object = obj
-        result = calling_obj.run_method(statement[2], local_variables, type_signature)
+    def __coerce_return(self, method, result):
         # ! need to deal with classes
         return_type = method.get_return_type()
 
-        if result is not None and result.typeof() == Type.ERROR:
-            return result
         if result is None:
             if return_type != Type.RETURN:
                 result_val = self.interpreter.default_return_val[return_type].val()
@@ -555,21 +876,45 @@ class ObjectDefinition:
                 self.interpreter.error(ErrorType.TYPE_ERROR, 'Returning invalid class')
         return result
 
+    def __find_method_at_call_site(self, obj, statement, type_signature):
+        # inline cache of the call statement: how many super objects up from the receiver the method is,
+        # by receiver class and argument types
+        call_site_caches = self.interpreter.call_site_caches
+        call_site = call_site_caches.get(id(statement))
+        if call_site is None or call_site[0] is not statement:
+            if len(call_site_caches) >= Interpreter.CALL_SITE_LIMIT:
+                call_site_caches.clear()
+            call_site = call_site_caches[id(statement)] = (statement, {})
+        key = (obj.class_name, tuple(type_signature))
+        depth = call_site[1].get(key)
+        if depth is None:
+            method, calling_obj = obj.__find_method(statement[2], type_signature)
+            if len(call_site[1]) < Interpreter.INLINE_CACHE_SIZE:
+                depth = 0
+                part = obj
+                while part is not calling_obj:
+                    part = part.super_object
+                    depth += 1
+                call_site[1][key] = depth
+            return method, calling_obj
+        calling_obj = obj
+        for _ in range(depth):
+            calling_obj = calling_obj.super_object
+        return calling_obj.obj_methods[statement[2]], calling_obj
+
     def __execute_while_statement(self, statement):
         result = None
         if isinstance(statement[1], list):
             result = self.__evaluate_expression(statement[1])
-            if result is not None and result.typeof() == Type.ERROR:
-                return result
             while (self.__evaluate_expression(statement[1]).val()):
-                result = self.__run_statement(statement[2])
+                result = self.__run_loop_body(statement)
                 if isinstance(result, Value):
                     break
             return result
         elif statement[1] == 'true' or statement[1] == 'false':
             if statement[1] == 'true':
                 while (True):
-                    result = self.__run_statement(statement[2])
+                    result = self.__run_loop_body(statement)
                     if isinstance(result, Value):
                         break
             return result
@@ -577,32 +922,38 @@ class ObjectDefinition:
                 self.local_variables[self.__find_local_variables(statement[1])][statement[1]].typeof() == Type.BOOL:
             index = self.__find_local_variables(statement[1])
             while (self.local_variables[index][statement[1]].val()):
-                result = self.__run_statement(statement[2])
+                result = self.__run_loop_body(statement)
                 if isinstance(result, Value):
                     break
             return result
         elif statement[1] in self.method_variables[-1] and self.method_variables[-1][
             statement[1]].typeof() == Type.BOOL:
             while (self.method_variables[-1][statement[1]].val()):
-                result = self.__run_statement(statement[2])
+                result = self.__run_loop_body(statement)
                 if isinstance(result, Value):
                     break
             return result
         elif statement[1] in self.obj_variables and self.obj_variables[statement[1]].typeof() == Type.BOOL:
             while (self.obj_variables[statement[1]].val()):
-                result = self.__run_statement(statement[2])
+                result = self.__run_loop_body(statement)
                 if isinstance(result, Value):
                     break
             return result
         else:
-            self.interpreter.error(ErrorType.TYPE_ERROR, "not boolean in while statement", statement[0].line_num)
+            self.interpreter.error(ErrorType.TYPE_ERROR, "not boolean in while statement", statement.line_num)
+
+    def __run_loop_body(self, statement):
+        # one iteration of a while loop, a step of the run
+        interpreter = self.interpreter
+        interpreter.countdown -= 1
+        if interpreter.countdown < 0:
+            interpreter.check_limits()
+        return self.__run_statement(statement[2])
 
     def __execute_if_statement(self, statement):
         # print(statement)
         if isinstance(statement[1], list):
             eval_res = self.__evaluate_expression(statement[1])
-            if eval_res is not None and eval_res.typeof() == Type.ERROR:
-                return eval_res
             if eval_res.typeof() != Type.BOOL:
                 self.interpreter.error(ErrorType.TYPE_ERROR, "not boolean in if statement")
             if eval_res.val():
@@ -642,23 +993,24 @@ class ObjectDefinition:
             elif len(statement) > 3:
                 return self.__run_statement(statement[3])
         else:
-            self.interpreter.error(ErrorType.TYPE_ERROR, "not boolean in if statement", statement[0].line_num)
+            self.interpreter.error(ErrorType.TYPE_ERROR, "not boolean in if statement", statement.line_num)
 
     def __execute_return_statement(self, statement):
         if len(statement) == 1:
             return Value(None, Type.RETURN)
         if isinstance(statement[1], list):
             if statement[1][0] == 'call':
+                if self.block_depth == 0:
+                    # a call in tail position runs once this method has returned, see __finish_call; the
+                    # variables of an enclosing let would still be visible to it and an enclosing try
+                    # would still catch its exceptions, so those calls run here
+                    return Value(self.__prepare_call(statement[1]), Type.TAIL_CALL)
                 result = self.__execute_call_statement(statement[1])
                 if result is None:
                     return Value(None, Type.RETURN)
-                elif result is not None and result.typeof() == Type.ERROR:
-                    return result
                 return result
             else:
                 result = self.__evaluate_expression(statement[1])
-                if result is not None and result.typeof() == Type.ERROR:
-                    return result
                 if result is None:
                     return Value(None, Type.RETURN)
                 return result
@@ -678,7 +1030,7 @@ class ObjectDefinition:
             else:
                 self.interpreter.error(ErrorType.NAME_ERROR, 'Undefined exception')
         else:
-            result = Value(statement[1])
+            result = self.interpreter.literal(statement[1])
             if result.typeof() == Type.UNDEFINED:
                 self.interpreter.error(ErrorType.NAME_ERROR, "Undefined variable")
         return result
@@ -694,6 +1046,7 @@ class ObjectDefinition:
                 self.interpreter.error(ErrorType.TYPE_ERROR, 'Parametrized type does not exist')
         if name not in self.interpreter.type_match:
             self.interpreter.type_match[name] = Type.POINTER
+            self.interpreter.ancestors[name] = frozenset((name,))
 
     def __execute_let_statements(self, statement):
         variables = statement[1]
@@ -706,7 +1059,7 @@ class ObjectDefinition:
                 if variables[i][0].split('@')[0] in self.interpreter.all_template_classes:
                     self.__check_template_class(variables[i][0])
                 if len(variables[i]) == 3:
-                    temp_value = Value(variables[i][2])
+                    temp_value = self.interpreter.literal(variables[i][2])
                 else:
                     temp_type = self.interpreter.type_match[variables[i][0]]
                     val = self.interpreter.default_return_val[temp_type].val()
@@ -722,33 +1075,37 @@ class ObjectDefinition:
             else:
                 self.interpreter.error(ErrorType.TYPE_ERROR, 'invalid types')
         self.local_variables.append(let_variables)
-        for j in statements:
-            result = self.__run_statement(j)
-            if isinstance(result, Value) and result.typeof() == Type.ERROR:
-                self.local_variables.pop()
-                return result
-            if j[0] != InterpreterBase.CALL_DEF and isinstance(result, Value):
-                self.local_variables.pop()
-                return result
-
-        self.local_variables.pop()
+        self.block_depth += 1
+        try:
+            for j in statements:
+                result = self.__run_statement(j)
+                if j[0] != InterpreterBase.CALL_DEF and isinstance(result, Value):
+                    return result
+        finally:
+            self.local_variables.pop()
+            self.block_depth -= 1
         return result
 
     def __execute_try_statement(self, statement):
-        result = self.__run_statement(statement[1])
-        if result is not None and result.typeof() == Type.ERROR:
-            self.interpreter.exception = result.val()
+        self.block_depth += 1
+        try:
+            try:
+                self.__run_statement(statement[1])
+                return None
+            except BrewinThrow as thrown:
+                self.interpreter.exception = thrown.value
+            # the catch statement runs outside the except clause, so an exception it throws is not chained
             result = self.__run_statement(statement[2])
-            self.interpreter.exception = None
-            return result
+        finally:
+            self.block_depth -= 1
+        self.interpreter.exception = None
+        return result
 
     def __execute_all_sub_statements_of_begin_statement(self, statement):
         statements = statement[1:]
         result = None
         for i in statements:
             result = self.__run_statement(i)
-            if isinstance(result, Value) and result.typeof() == Type.ERROR:
-                return result
             if (i[0] != InterpreterBase.CALL_DEF) and isinstance(result, Value):
                 return result
 
@@ -758,8 +1115,6 @@ class ObjectDefinition:
         err_msg = None
         if isinstance(statement[1], list):
             err_msg = self.__evaluate_expression(statement[1])
-            if err_msg is not None and err_msg.typeof() == Type.ERROR:
-                return err_msg
         else:
             if statement[1] == InterpreterBase.EXCEPTION_VARIABLE_DEF:
                 if self.interpreter.exception is None:
@@ -774,14 +1129,15 @@ class ObjectDefinition:
             elif statement[1] in self.obj_variables:
                 err_msg = self.obj_variables[statement[1]]
             else:
-                err_msg = Value(statement[1])
+                err_msg = self.interpreter.literal(statement[1])
         if err_msg is None:
             self.interpreter.error(ErrorType.TYPE_ERROR, 'Not a string in throw')
         if err_msg is not None and err_msg.typeof() == Type.UNDEFINED:
             self.interpreter.error(ErrorType.NAME_ERROR, 'Undefined variable')
         if err_msg is not None and err_msg.typeof() != Type.STRING:
             self.interpreter.error(ErrorType.TYPE_ERROR, 'Not a string in throw')
-        return Value(err_msg, Type.ERROR)
+        raise BrewinThrow(err_msg)
+
     def __evaluate_expression(self, statement):
         stack = []
         if isinstance(statement, list):
@@ -794,8 +1150,6 @@ class ObjectDefinition:
                         result = self.__execute_call_statement(i)
                     else:
                         result = self.__evaluate_expression(i)
-                    if result is not None and result.typeof() == Type.ERROR:
-                        return result
                     stack.append(result)
                 elif i == 'new':
                     stack.append('new')
@@ -822,11 +1176,11 @@ class ObjectDefinition:
                 elif i in self.obj_variables:
                     stack.append(self.obj_variables[i])
                 else:
-                    new_var = Value(i)
+                    new_var = self.interpreter.literal(i)
                     if new_var.typeof() == Type.UNDEFINED:
                         if len(stack) >= 1 and stack[-1] == 'new':
                             self.interpreter.error(ErrorType.TYPE_ERROR, "undefined class")
-                        self.interpreter.error(ErrorType.NAME_ERROR, "undefined variable", statement[0].line_num)
+                        self.interpreter.error(ErrorType.NAME_ERROR, "undefined variable", statement.line_num)
                     else:
                         stack.append(new_var)
             if len(stack) == 3:
@@ -834,9 +1188,9 @@ class ObjectDefinition:
                 a = stack.pop()
                 operator = stack.pop()
                 if operator not in self.interpreter.operators:
-                    self.interpreter.error(ErrorType.SYNTAX_ERROR, "invalid operator", statement[0].line_num)
+                    self.interpreter.error(ErrorType.SYNTAX_ERROR, "invalid operator", statement.line_num)
                 if a.typeof() != b.typeof():
-                    self.interpreter.error(ErrorType.TYPE_ERROR, "type does not match", statement[0].line_num)
+                    self.interpreter.error(ErrorType.TYPE_ERROR, "type does not match", statement.line_num)
                 if operator not in self.interpreter.operations[a.typeof()]:
                     self.interpreter.error(ErrorType.TYPE_ERROR, "incompatible operand")
                 if a.typeof() == Type.POINTER and (a.class_name is not None) and (b.class_name is not None):
@@ -849,7 +1203,7 @@ class ObjectDefinition:
                 operator = stack.pop()
                 if operator == '!':
                     if a.typeof() != Type.BOOL:
-                        self.interpreter.error(ErrorType.TYPE_ERROR, "non boolean", statement[0].line_num)
+                        self.interpreter.error(ErrorType.TYPE_ERROR, "non boolean", statement.line_num)
                     if operator not in self.interpreter.operations[a.typeof()]:
                         self.interpreter.error(ErrorType.TYPE_ERROR, "incompatible operand")
                 elif operator == 'new':
@@ -861,10 +1215,8 @@ class ObjectDefinition:
                         temp_value.original_class_name = a
                         return temp_value
                     elif (a.split('@')[0]) in self.interpreter.all_template_classes:
-                        param = a.split('@')
-                        class_def = self.interpreter.all_template_classes[param[0]]
-                        obj = class_def.instantiate_object(param[1:])
-                        obj.class_name = a
+                        class_def = self.interpreter.specialize_template(a)
+                        obj = class_def.instantiate_object()
                         temp_value = Value(obj, Type.POINTER)
                         temp_value.class_name = a
                         return temp_value
@@ -872,23 +1224,14 @@ class ObjectDefinition:
                         self.interpreter.error(ErrorType.TYPE_ERROR, "Undefined class")
 
                 else:
-                    self.interpreter.error(ErrorType.TYPE_ERROR, "operator error", statement[0].line_num)
+                    self.interpreter.error(ErrorType.TYPE_ERROR, "operator error", statement.line_num)
                 return self.interpreter.operations[a.typeof()][operator](a)
 
         else:
-            self.interpreter.error(ErrorType.TYPE_ERROR, "not an expression", statement[0].line_num)
+            self.interpreter.error(ErrorType.TYPE_ERROR, "not an expression", statement.line_num)
 
     def __find_class_name(self, base_name, derived_class):
-        if base_name == derived_class:
-            return True
-        elif derived_class is None:
-            return True
-        elif derived_class not in self.interpreter.class_relationships:
-            return False
-        elif self.interpreter.class_relationships[derived_class] is None:
-            return False
-        else:
-            return self.__find_class_name(base_name, self.interpreter.class_relationships[derived_class])
+        return self.interpreter.is_subclass(base_name, derived_class)
 
     def check_template_class(self, name):
         self.__check_template_class(name)
@@ -953,56 +1296,64 @@ class Type(Enum):
     POINTER = 4
     UNDEFINED = -1
     RETURN = 0
-    ERROR = 5
+    TAIL_CALL = 5  # value is a call prepared by a (return (call ...)) of the tree-walker, not run yet
+
+    # members are singletons compared by identity, so hash them by identity too instead of by name;
+    # types are part of every inline cache key
+    __hash__ = object.__hash__
+
 
+# looking up a member of an Enum class is several times slower than reading a global, so code that
+# runs for every Value uses these
+INT_TYPE = Type.INT
+BOOL_TYPE = Type.BOOL
+STRING_TYPE = Type.STRING
+POINTER_TYPE = Type.POINTER
+RETURN_TYPE = Type.RETURN
+TAIL_CALL_TYPE = Type.TAIL_CALL
 
 class Value:
     "value class"
 
+    # Values are the most allocated objects of a running program: keep them small and build them
+    # with as few comparisons as possible
+    __slots__ = ('type', 'value', 'class_name', 'original_class_name')
+
     def __init__(self, value, type=None, class_name=None):
-        self.class_name = None  # None if it's a primitive type
-        self.original_class_name = None
-
-        if type == None:
-            if value.isnumeric() or (value[0] == '-' and value[1:].isnumeric()):
-                self.type = Type.INT
-                self.value = int(value)
-            elif value == 'true' or value == 'false':
-                self.type = Type.BOOL
-                if value == 'true':
-                    self.value = True
-                else:
-                    self.value = False
-            elif value == 'null':
-                self.type = Type.POINTER
-                self.value = None
-            elif value[0] == '"' and value[-1] == '"':
-                self.type = Type.STRING
-                self.value = value.strip('"')
-            else:
-                self.type = Type.UNDEFINED
-                self.value = -1
+        if type is None:
+            # only atoms of the program are built without a type, once each by Interpreter.constant
+            type, value = Value.parse_literal(value)
+        elif type is INT_TYPE:
+            value = int(value)
+        elif type is STRING_TYPE:
+            value = str(value)
+        self.type = type
+        self.value = value
+        if type is POINTER_TYPE:
+            self.class_name = class_name
+            self.original_class_name = class_name
+        else:
+            self.class_name = None  # None if it's a primitive type
+            self.original_class_name = None
+
+    @staticmethod
+    def parse_literal(token):
+        """Return the (Type, Python value) of a literal token, Type.UNDEFINED if it is not one"""
+        if token.isnumeric() or (token[0] == '-' and token[1:].isnumeric()):
+            return INT_TYPE, int(token)
+        elif token == 'true' or token == 'false':
+            return BOOL_TYPE, token == 'true'
+        elif token == 'null':
+            return POINTER_TYPE, None
+        elif token[0] == '"' and token[-1] == '"':
+            return STRING_TYPE, token.strip('"')
         else:
-            if type == Type.INT:
-                self.type = Type.INT
-                self.value = int(value)
-            if type == Type.BOOL:
-                self.type = Type.BOOL
-                self.value = value
-            if type == Type.STRING:
-                self.type = Type.STRING
-                self.value = str(value)
-            if type == Type.POINTER:
-                self.type = Type.POINTER
-                self.value = value
-                self.class_name = class_name
-                self.original_class_name = class_name
-            if type == Type.RETURN:
-                self.type = Type.RETURN
-                self.value = value
-            if type == Type.ERROR:
-                self.type = Type.ERROR
-                self.value = value
+            return Type.UNDEFINED, -1
+
+    @staticmethod
+    def boolean(flag):
+        """Return the shared Value of true or false"""
+        return TRUE_VALUE if flag else FALSE_VALUE
 
     def typeof(self):
         return self.type
@@ -1011,6 +1362,47 @@ class Value:
         return self.value
 
 
+# bool results are never modified once created, so every comparison shares these two
+TRUE_VALUE = Value(True, Type.BOOL)
+FALSE_VALUE = Value(False, Type.BOOL)
+
+
+class BrewinThrow(Exception):
+    """Raised by (throw ...) and caught by the nearest enclosing (try ...)"""
+
+    def __init__(self, value):
+        super().__init__(value)
+        self.value = value
+
+
+def add_return_check(methods, method):
+    """
+    Add method, run by a call in tail position, to methods: the methods whose return types the result of a
+    chain of tail calls is coerced to once it ends, outermost first. Only the methods that can still change
+    the outcome are kept, so the list stays short however long the chain is, mutual recursion included.
+    """
+    if not methods:
+        methods.append(method)
+        return
+    last = methods[-1]
+    if method.return_type is last.return_type:
+        if method.return_type is not POINTER_TYPE or method.real_return_type == last.real_return_type:
+            return  # coercing twice to the same type is coercing once
+        # of a run of class return types, every class is checked against a result that is not null, and a
+        # null result takes the outermost class, so a class the run already has adds nothing
+        start = len(methods)
+        while start > 0 and methods[start - 1].return_type is POINTER_TYPE:
+            start -= 1
+        for other in methods[start:]:
+            if other.real_return_type == method.real_return_type:
+                return
+    elif method.return_type is not RETURN_TYPE:
+        # no value of the return type of method passes the coercion to the other type of last: every result
+        # fails there at the latest, and the methods around last are never reached
+        del methods[:-1]
+    methods.append(method)
+
+
 def main():
     test_1 = """
     (tclass node (field_type)
@@ -0,0 +1,140 @@
+"""
+Output sinks of the v3 interpreter.
+
+By default Interpreter.output prints every line of a (print ...) as it is made and also keeps it in
+output_log for get_output(). Interpreter(output_sink=...) sends the lines to a sink instead:
+- BufferedWriter writes them to a stream in blocks, instead of one write per line;
+- OutputLog keeps every line, RingBufferLog only the last ones and DiscardLog none of them, for
+  get_output();
+- TeeSink passes every line on to several sinks, e.g. a BufferedWriter and a RingBufferLog, and
+  takes get_output() from one of them.
+
+The interpreter flushes its sink when a run ends, whether or not the program failed. A sink that
+writes to the console, a BufferedWriter without a stream, cannot be used with console_output=False.
+"""
+
+import sys
+from collections import deque
+
+
+class OutputSink:
+    """Where the lines a program prints go"""
+
+    def write(self, line):
+        raise NotImplementedError
+
+    def writes_console(self):
+        """Return whether the sink writes lines to sys.stdout"""
+        return False
+
+    def flush(self):
+        """Pass on lines held back by the sink"""
+
+    def clear(self):
+        """Forget the lines kept for get_output, for another run"""
+
+    def get_output(self):
+        """Return the lines kept for Interpreter.get_output(), oldest first"""
+        return []
+
+
+class BufferedWriter(OutputSink):
+    """Writes lines to a stream once they add up to block_size characters, and when flushed"""
+
+    BLOCK_SIZE = 65536
+
+    def __init__(self, stream=None, block_size=BLOCK_SIZE):
+        self.stream = stream  # None writes to whatever sys.stdout is when the block is written
+        self.block_size = block_size
+        self.pending = []
+        self.pending_size = 0  # characters in pending, with their newlines
+
+    def write(self, line):
+        self.pending.append(line)
+        self.pending_size += len(line) + 1
+        if self.pending_size >= self.block_size:
+            self.flush()
+
+    def writes_console(self):
+        return self.stream is None
+
+    def flush(self):
+        if not self.pending:
+            return
+        stream = sys.stdout if self.stream is None else self.stream
+        self.pending.append('')
+        stream.write('\n'.join(self.pending))
+        stream.flush()
+        self.pending = []
+        self.pending_size = 0
+
+
+class OutputLog(OutputSink):
+    """Keeps every line, like the output_log of InterpreterBase"""
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, line):
+        self.lines.append(line)
+
+    def clear(self):
+        self.lines = []
+
+    def get_output(self):
+        return self.lines
+
+
+class RingBufferLog(OutputSink):
+    """Keeps the last size lines"""
+
+    def __init__(self, size):
+        self.lines = deque(maxlen=size)
+
+    def write(self, line):
+        self.lines.append(line)
+
+    def clear(self):
+        self.lines.clear()
+
+    def get_output(self):
+        return list(self.lines)
+
+
+class DiscardLog(OutputSink):
+    """Keeps nothing"""
+
+    def write(self, line):
+        pass
+
+
+class TeeSink(OutputSink):
+    """Passes every line on to each of sinks; get_output() is that of log, by default the last of sinks"""
+
+    def __init__(self, *sinks, log=None):
+        if not sinks:
+            raise ValueError("a TeeSink needs at least one sink")
+        if log is None:
+            log = sinks[-1]
+        elif not any(sink is log for sink in sinks):
+            raise ValueError("the log of a TeeSink must be one of its sinks")
+        self.sinks = sinks
+        self.log = log
+
+    def write(self, line):
+        for sink in self.sinks:
+            sink.write(line)
+
+    def writes_console(self):
+        return any(sink.writes_console() for sink in self.sinks)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def clear(self):
+        for sink in self.sinks:
+            sink.clear()
+
+    def get_output(self):
+        return self.log.get_output()
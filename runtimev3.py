@@ -0,0 +1,369 @@
+"""
+Runtime support shared by the compiled execution engines of the v3 interpreter.
+
+The tree-walker in interpreterv3.py interprets the parsed token lists directly. A compiled
+engine translates every method body once and runs the translation instead, and uses this
+module for everything that does not depend on how a method body is executed: object layout
+and creation, method lookup, argument binding, return value coercion, typed stores, operators
+and printing.
+
+Objects of the compiled engines are flat: an Instance keeps the fields of its class and of all
+of its base classes in one array. The ClassLayout of a class gives the fields of every base
+class the same slots they have in the base class itself, so the compiled methods of a base
+class index the fields of any derived instance directly.
+"""
+
+from intbase import InterpreterBase, ErrorType
+from interpreterv3 import Interpreter, Method, ObjectDefinition, Value
+from interpreterv3 import BOOL_TYPE, POINTER_TYPE, RETURN_TYPE, STRING_TYPE
+
+# fewest items, keyword included, of each statement and of call and new expressions
+MINIMUM_SIZES = {
+    InterpreterBase.INPUT_INT_DEF: 2,
+    InterpreterBase.INPUT_STRING_DEF: 2,
+    InterpreterBase.SET_DEF: 3,
+    InterpreterBase.CALL_DEF: 2,
+    InterpreterBase.WHILE_DEF: 3,
+    InterpreterBase.IF_DEF: 3,
+    InterpreterBase.LET_DEF: 2,
+    InterpreterBase.THROW_DEF: 2,
+    InterpreterBase.TRY_DEF: 3,
+    InterpreterBase.NEW_DEF: 2,
+}
+
+
+def is_well_formed(statement):
+    """Return whether a statement, or call or new expression, has every item the compiled engines read"""
+    keyword = statement[0]
+    if len(statement) < MINIMUM_SIZES.get(keyword, 1):
+        return False
+    if keyword in (InterpreterBase.SET_DEF, InterpreterBase.INPUT_INT_DEF, InterpreterBase.INPUT_STRING_DEF,
+                   InterpreterBase.NEW_DEF):
+        return isinstance(statement[1], str)
+    if keyword == InterpreterBase.CALL_DEF:
+        # an unknown target is reported before a missing method name
+        return len(statement) == 2 or isinstance(statement[2], str)
+    if keyword == InterpreterBase.LET_DEF:
+        return isinstance(statement[1], list) and all(
+            isinstance(variable, list) and len(variable) >= 2 and all(isinstance(item, str) for item in variable)
+            for variable in statement[1])
+    return True
+
+
+class ClassLayout:
+    """Field slots and method table of a class or of a template instantiation such as node@int"""
+
+    def __init__(self, name, super_layout):
+        self.name = name
+        self.super_layout = super_layout
+        self.fields = {}  # dict: {key=name of a field of this class, value=(slot, declared type)}
+        self.defaults = list(super_layout.defaults) if super_layout is not None else []  # initial value per slot
+        self.method_table = {}  # dict: {key=method name, value=[(Method, defining ClassLayout)] from this class up}
+        self.dispatch_cache = {}  # dict: {key=(method name, argument types), value=(Method, defining ClassLayout)}
+
+    def __repr__(self):
+        return f'<layout {self.name}>'
+
+
+class Instance:
+    """A Brewin object of the compiled engines"""
+
+    __slots__ = ('layout', 'fields')
+
+    def __init__(self, layout):
+        self.layout = layout
+        self.fields = list(layout.defaults)  # every field of the hierarchy, indexed by its ClassLayout slot
+
+    @property
+    def class_name(self):
+        return self.layout.name
+
+
+class CallSite:
+    """
+    Inline cache of one (call ...) in a compiled method body.
+
+    Maps the class the method is looked up in and the argument types seen at this call to the
+    method they resolved to, the layout of the class that defines it and its compiled body, so
+    repeated calls skip the method lookup. The cache is monomorphic or polymorphic up to
+    Interpreter.INLINE_CACHE_SIZE entries; past that, new combinations are looked up every time.
+    """
+
+    __slots__ = ('method_name', 'argc', 'entries')
+
+    def __init__(self, method_name, argc):
+        self.method_name = method_name
+        self.argc = argc
+        self.entries = {}  # dict: {key=(ClassLayout, argument types), value=(method, defining layout, compiled body)}
+
+    def resolve(self, layout, args, lookup):
+        """Return lookup(layout, method name, args): (method, defining layout, compiled body)"""
+        key = (layout, tuple([arg.class_name if arg.type is POINTER_TYPE else arg.type for arg in args]))
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = lookup(layout, self.method_name, args)
+            if len(self.entries) < Interpreter.INLINE_CACHE_SIZE:
+                self.entries[key] = entry
+        return entry
+
+    def __repr__(self):
+        return f'{self.method_name}/{self.argc}'
+
+
+class Scope:
+    """
+    Resolves the names of a method body once, while the body is translated.
+
+    Parameters take the first slots of the array of locals of a running method and every
+    (let ...) variable gets a slot of its own after them, so reading or writing a parameter or
+    a local is one index into that array. Fields resolve to their slot in the Instance fields
+    of the class that defines the method.
+    """
+
+    def __init__(self, layout, params):
+        self.layout = layout  # layout of the class that defines the method
+        self.fields = layout.fields
+        self.slot_types = [type_name for _, type_name in params]  # declared type of every slot
+        self.lets = [{name: slot for slot, (name, _) in enumerate(params)}]  # innermost scope last
+
+    def resolve(self, name):
+        """Return ('local', slot, declared type), ('field', slot, declared type) or None"""
+        for depth in range(len(self.lets) - 1, -1, -1):
+            if name in self.lets[depth]:
+                slot = self.lets[depth][name]
+                return 'local', slot, self.slot_types[slot]
+        if name in self.fields:
+            slot, type_name = self.fields[name]
+            return 'field', slot, type_name
+        return None
+
+    def enter_let(self, variables):
+        """Open the scope of a (let ...) for (name, declared type) pairs and return their slots"""
+        names = {}
+        for name, type_name in variables:
+            names[name] = len(self.slot_types)
+            self.slot_types.append(type_name)
+        self.lets.append(names)
+        return list(names.values())
+
+    def exit_let(self):
+        self.lets.pop()
+
+    @property
+    def slot_count(self):
+        return len(self.slot_types)
+
+    @staticmethod
+    def for_method(layout, method):
+        return Scope(layout, [(param[1], param[0]) for param in method[3]])
+
+
+class Runtime:
+    """Language semantics that the compiled engines call into"""
+
+    VOID_RESULT = Value(None, RETURN_TYPE)
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.binary_ops = {}  # dict: {key=operator, value={key=operand type, value=operation}}
+        for operand_type, operations in interpreter.operations.items():
+            for operator, operation in operations.items():
+                if operator != '!':
+                    self.binary_ops.setdefault(operator, {})[operand_type] = operation
+        self.__not = interpreter.operations[BOOL_TYPE]['!']
+        self.is_subclass = interpreter.is_subclass  # O(1) with the ancestor sets of the interpreter
+        self.layouts = {}  # dict: {key=class name, value=ClassLayout}, built on the first (new ...) of a class
+        self.__type_checker = ObjectDefinition(interpreter)
+
+    # classes and objects
+
+    def is_template(self, type_name):
+        return type_name.split(InterpreterBase.TYPE_CONCAT_CHAR)[0] in self.interpreter.all_template_classes
+
+    def type_of(self, type_name):
+        """Map a declared type name to its Type, registering template names on first use"""
+        if type_name not in self.interpreter.type_match and self.is_template(type_name):
+            self.__type_checker.check_template_class(type_name)
+        if type_name not in self.interpreter.type_match:
+            self.interpreter.error(ErrorType.TYPE_ERROR, f'Type {type_name} does not exist')
+        return self.interpreter.type_match[type_name]
+
+    def class_definition(self, class_name):
+        """ClassDefinition of a class or of a template instantiation such as node@int"""
+        if class_name in self.interpreter.all_classes:
+            return self.interpreter.all_classes[class_name]
+        return self.interpreter.specialize_template(class_name)
+
+    def members(self, class_name):
+        """Field and method definitions of a class or of a template instantiation such as node@int"""
+        class_def = self.class_definition(class_name)
+        return class_def.my_fields, class_def.my_methods
+
+    def layout(self, class_name):
+        layout = self.layouts.get(class_name)
+        if layout is None:
+            layout = self.layouts[class_name] = self.__build_layout(class_name)
+        return layout
+
+    def __build_layout(self, class_name):
+        # same checks, in the same order, as ClassDefinition.instantiate_object
+        interpreter = self.interpreter
+        class_def = self.class_definition(class_name)
+        super_layout = None
+        if class_def.super_class is not None:
+            if class_def.super_class not in interpreter.all_classes:
+                interpreter.error(ErrorType.NAME_ERROR, 'Base class not found')
+            super_layout = self.layout(class_def.super_class)
+        layout = ClassLayout(class_name, super_layout)
+        fields, methods = class_def.my_fields, class_def.my_methods
+        prototype = ObjectDefinition(interpreter)  # checks the fields and makes their initial values
+        for field in fields:
+            prototype.add_field(field)
+            layout.fields[field[2]] = (len(layout.defaults), field[1])
+            layout.defaults.append(prototype.obj_variables[field[2]])
+        for method in methods:
+            if method[2] in layout.method_table:
+                interpreter.error(ErrorType.NAME_ERROR, "duplicate method")
+            layout.method_table[method[2]] = [(Method(method[1], method[2], method[3], method[4], interpreter), layout)]
+        if super_layout is not None:
+            for name, overloads in super_layout.method_table.items():
+                layout.method_table.setdefault(name, []).extend(overloads)
+        return layout
+
+    def new_object(self, class_name):
+        interpreter = self.interpreter
+        if class_name not in interpreter.all_classes:
+            if not self.is_template(class_name):
+                interpreter.error(ErrorType.TYPE_ERROR, "Undefined class")
+            self.__type_checker.check_template_class(class_name)
+        return Value(Instance(self.layout(class_name)), POINTER_TYPE, class_name)
+
+    def find_method(self, layout, method_name, signature):
+        """Return (method, defining layout) of the method an instance of layout runs for a call"""
+        key = (method_name, tuple(signature))
+        entry = layout.dispatch_cache.get(key)
+        if entry is None:
+            for method, owner in layout.method_table.get(method_name, ()):
+                if self.__signature_matches(method.get_type_signature(), signature):
+                    entry = layout.dispatch_cache[key] = (method, owner)
+                    break
+            else:
+                self.interpreter.error(ErrorType.NAME_ERROR, "method undefined")
+        return entry
+
+    def __signature_matches(self, method_type_signature, signature):
+        if len(method_type_signature) != len(signature):
+            return False
+        for expected, actual in zip(method_type_signature, signature):
+            if isinstance(expected, tuple) and isinstance(actual, tuple):
+                if not self.is_subclass(expected[1], actual[1]):
+                    return False
+            elif expected != actual:
+                return False
+        return True
+
+    # calls
+
+    @staticmethod
+    def signature(args):
+        return [(POINTER_TYPE, arg.class_name) if arg.type == POINTER_TYPE else arg.type for arg in args]
+
+    def bind_arguments(self, method, args, slot_count):
+        """Return the array of locals of a call: the arguments in parameter slots, then empty let slots"""
+        slots = list(args)
+        for index, (type_name, _) in enumerate(method.get_params()):
+            arg = slots[index]
+            if arg.type == POINTER_TYPE:
+                if not self.is_subclass(type_name, arg.class_name):
+                    self.interpreter.error(ErrorType.TYPE_ERROR, 'Passing invalid class')
+                if arg.class_name is None:
+                    slots[index] = Value(None, POINTER_TYPE, type_name)
+        if slot_count > len(slots):
+            slots.extend([None] * (slot_count - len(slots)))
+        return slots
+
+    def coerce_return(self, method, result):
+        return_type = method.get_return_type()
+        if result is None or (result.type == RETURN_TYPE and return_type != RETURN_TYPE):
+            return self.default_value(return_type, method.real_return_type)
+        if result.type != return_type:
+            self.interpreter.error(ErrorType.TYPE_ERROR, 'invalid return type')
+        if return_type == POINTER_TYPE:
+            if result.value is None:
+                return Value(None, POINTER_TYPE, method.real_return_type)
+            if not self.is_subclass(method.real_return_type, result.class_name):
+                self.interpreter.error(ErrorType.TYPE_ERROR, 'Returning invalid class')
+        return result
+
+    def default_value(self, value_type, class_name=None):
+        if value_type == RETURN_TYPE:
+            return self.VOID_RESULT
+        if value_type == POINTER_TYPE:
+            return Value(None, POINTER_TYPE, class_name)
+        return self.interpreter.default_return_val[value_type]
+
+    # variables
+
+    def declare(self, type_name, initial_value):
+        """Create the value of a (let ...) variable; initial_value is a literal Value or None"""
+        value_type = self.type_of(type_name)
+        if initial_value is None:
+            return self.default_value(value_type, type_name)
+        if initial_value.type != value_type:
+            self.interpreter.error(ErrorType.TYPE_ERROR, 'invalid types')
+        if value_type == POINTER_TYPE:
+            return Value(None, POINTER_TYPE, type_name)
+        return initial_value
+
+    def check_store(self, type_name, value):
+        """Type check a value assigned to a variable declared with type_name and return what to store"""
+        if value.type != self.type_of(type_name):
+            self.interpreter.error(ErrorType.TYPE_ERROR, 'Assigning incompatible type')
+        if value.type == POINTER_TYPE:
+            if value.class_name is None:
+                return Value(None, POINTER_TYPE, type_name)
+            if not self.is_subclass(type_name, value.class_name):
+                self.interpreter.error(ErrorType.TYPE_ERROR, 'Assigning incompatible type')
+        return value
+
+    def current_exception(self, line_num=None, description='Undefined exception'):
+        """
+        Return the exception of the catch block that is running; like the tree-walker, there is one for
+        the whole program, set by a catch block and cleared once it completes
+        """
+        exception = self.interpreter.exception
+        if exception is None:
+            self.interpreter.error(ErrorType.NAME_ERROR, description, line_num)
+        return exception
+
+    def set_exception(self, value):
+        self.current_exception()
+        self.interpreter.exception = self.check_store(InterpreterBase.STRING_DEF, value)
+
+    # operators
+
+    def binary(self, operator, a, b, line_num):
+        if a.type != b.type:
+            self.interpreter.error(ErrorType.TYPE_ERROR, "type does not match", line_num)
+        operation = self.binary_ops[operator].get(a.type)
+        if operation is None:
+            self.interpreter.error(ErrorType.TYPE_ERROR, "incompatible operand")
+        if a.type == POINTER_TYPE and a.class_name is not None and b.class_name is not None:
+            if not self.is_subclass(a.class_name, b.class_name) and not self.is_subclass(b.class_name, a.class_name):
+                self.interpreter.error(ErrorType.TYPE_ERROR, 'Incompatible types')
+        return operation(a, b)
+
+    def logical_not(self, a, line_num):
+        if a.type != BOOL_TYPE:
+            self.interpreter.error(ErrorType.TYPE_ERROR, "non boolean", line_num)
+        return self.__not(a)
+
+    @staticmethod
+    def format_value(value):
+        if value.type == BOOL_TYPE:
+            return 'true' if value.value else 'false'
+        if value.type == STRING_TYPE:
+            return value.value.strip('"')
+        if value.type == RETURN_TYPE:
+            return 'None'
+        return str(value.value)
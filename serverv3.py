@@ -0,0 +1,146 @@
+"""
+Resident server for the v3 interpreter.
+
+    python3 serverv3.py /tmp/brewin.sock --workers 8 --engine vm
+
+Listens on a Unix domain socket and runs the programs sent to it on a pool of worker processes,
+started once, so a run pays neither Python start up nor imports. Each worker keeps one Interpreter
+per engine and resets it between runs, and the workers share a parse cache keyed by a hash of the
+source (cachev3.py) in --cache-dir, a temporary directory by default.
+
+A client sends one JSON request per line and gets one JSON response per line back, any number of
+them per connection:
+
+    {"source": "(class main ...)", "input": ["10"], "engine": "vm"}
+    {"output": ["55"], "error_type": null, "error_line": null, "exception": null, "seconds": 0.0012}
+
+source is the program text or a list of its lines; input, a list of strings, and engine are
+optional. A request that cannot be run, or whose worker dies, gets {"exception": "..."} back and
+the connection goes on; the workers of a pool that lost one are replaced. request() sends one
+request from Python.
+"""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from batchv3 import run_program
+from interpreterv3 import Interpreter
+
+# state of a worker process, set up by init_worker
+worker_options = {}  # keyword arguments of every Interpreter of the worker
+worker_interpreters = {}  # dict: {key=engine, value=Interpreter reused for every run on it}
+
+
+def init_worker(cache_dir, max_steps, time_limit):
+    worker_options.update(cache_dir=cache_dir, max_steps=max_steps, time_limit=time_limit)
+
+
+def serve_request(request, engine):
+    """Run the program of a request in a worker process and return the response"""
+    if not isinstance(request, dict):
+        return {'exception': f'TypeError: request must be a JSON object, not {type(request).__name__}'}
+    engine = request.get('engine', engine)
+    if engine not in Interpreter.ENGINES:
+        return {'exception': f'ValueError: unknown execution engine {engine}'}
+    interpreter = worker_interpreters.get(engine)
+    if interpreter is None:
+        interpreter = worker_interpreters[engine] = Interpreter(console_output=False, engine=engine,
+                                                                **worker_options)
+    inputs = request.get('input', [])
+    if not isinstance(inputs, list) or not all(isinstance(value, str) for value in inputs):
+        return {'exception': 'TypeError: input must be a list of strings'}
+    source = request['source']
+    if isinstance(source, str):
+        source = source.split('\n')
+    return run_program(interpreter, source, inputs)
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            pool = self.server.pool
+            try:
+                request = json.loads(line)
+                response = pool.submit(serve_request, request, self.server.engine).result()
+            except Exception as error:  # a bad request or a failed worker must not end the connection
+                if isinstance(error, BrokenProcessPool):
+                    self.server.replace_pool(pool)
+                response = {'exception': f'{type(error).__name__}: {error}'}
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class InterpreterServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server that hands the requests of every connection to a pool of worker processes"""
+
+    daemon_threads = True
+
+    def __init__(self, path, engine='tree', workers=None, cache_dir=None, max_steps=None, time_limit=None):
+        if os.path.exists(path):
+            os.remove(path)  # the socket of a server that did not shut down cleanly
+        super().__init__(path, RequestHandler)
+        self.engine = engine  # engine of requests that do not name one
+        self.workers = workers or os.cpu_count() or 1
+        self.worker_args = (cache_dir, max_steps, time_limit)
+        self.pool_lock = threading.Lock()
+        self.pool = self.__start_pool()
+
+    def __start_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker, initargs=self.worker_args)
+
+    def replace_pool(self, broken_pool):
+        """Start new workers in place of a pool one of whose workers died, unless another thread already did"""
+        with self.pool_lock:
+            if self.pool is broken_pool:
+                self.pool = self.__start_pool()
+        broken_pool.shutdown(wait=False)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def request(path, source, inputs=(), engine=None):
+    """Send one program to the server listening on path and return its response"""
+    message = {'source': source, 'input': [str(value) for value in inputs]}
+    if engine is not None:
+        message['engine'] = engine
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path)
+        connection.sendall(json.dumps(message).encode() + b'\n')
+        with connection.makefile('rb') as reader:
+            return json.loads(reader.readline())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve Brewin runs over a Unix domain socket')
+    parser.add_argument('socket', help='path of the socket to listen on')
+    parser.add_argument('--engine', default='tree', choices=Interpreter.ENGINES,
+                        help='engine of requests that do not name one')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per core)')
+    parser.add_argument('--cache-dir', default=None, help='parse cache directory (default: a temporary one)')
+    parser.add_argument('--max-steps', type=int, default=None, help='loop iterations and calls a program may take')
+    parser.add_argument('--time-limit', type=float, default=None, help='seconds a program may run')
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with InterpreterServer(args.socket, args.engine, args.workers, args.cache_dir or temp_dir,
+                               args.max_steps, args.time_limit) as server:
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,106 @@
+"""
+Tests of Interpreter.run_async.
+
+Run with python3 -m unittest test_asyncv3
+"""
+
+import asyncio
+import io
+import unittest
+
+from intbase import ErrorType
+from interpreterv3 import Interpreter
+
+# reads how far to count, prints every hundredth number on the way and where it stopped
+COUNTER = '''
+(class main
+ (field int n 0)
+ (field int i 0)
+ (field string name "")
+ (method void main ()
+  (begin
+   (inputs name)
+   (inputi n)
+   (while (< i n) (begin (if (== (% i 100) 0) (print name " " i)) (set i (+ i 1))))
+   (print name " done " n))))
+'''
+FAILING = '''
+(class main
+ (method void main () (begin (print "before") (print missing))))
+'''
+
+
+class RunAsyncTest(unittest.TestCase):
+    def test_concurrent_sessions_interleave(self):
+        log = []
+
+        async def session(name, count):
+            inputs = asyncio.Queue()
+            for value in (name, str(count)):
+                inputs.put_nowait(value)
+
+            async def write_output(line):
+                log.append(line)
+
+            interpreter = Interpreter(console_output=False, engine='vm')
+            await interpreter.run_async(io.StringIO(COUNTER), read_input=inputs.get, write_output=write_output,
+                                        yield_every=10)
+            return interpreter.get_output(), interpreter.error_type
+
+        async def main():
+            return await asyncio.gather(session('a', 300), session('b', 500))
+
+        results = asyncio.run(main())
+        # the lines went to write_output, not to the output log
+        self.assertEqual(results, [([], None), ([], None)])
+        for name, count in (('a', 300), ('b', 500)):
+            own = [line for line in log if line.startswith(name + ' ')]
+            self.assertEqual(own, [f'{name} {i}' for i in range(0, count, 100)] + [f'{name} done {count}'])
+        # neither session ran to the end before the other printed its first line
+        self.assertLess(log.index('b 0'), log.index('a done 300'))
+        self.assertLess(log.index('a 0'), log.index('b done 500'))
+
+    def test_waits_for_input(self):
+        async def main():
+            inputs = asyncio.Queue()
+            interpreter = Interpreter(console_output=False, engine='vm')
+            task = asyncio.ensure_future(interpreter.run_async(io.StringIO(COUNTER), read_input=inputs.get))
+            await asyncio.sleep(0.01)
+            self.assertFalse(task.done())
+            await inputs.put('late')
+            await inputs.put('100')
+            await task
+            return interpreter.get_output()
+
+        self.assertEqual(asyncio.run(main()), ['late 0', 'late done 100'])
+
+    def test_same_as_run(self):
+        for source, inputs in ((COUNTER, ['x', '250']), (FAILING, [])):
+            expected = Interpreter(console_output=False, inp=inputs, engine='vm')
+            try:
+                expected.run(io.StringIO(source))
+            except RuntimeError:
+                pass
+            for yield_every in (1, 7, 1000):
+                with self.subTest(yield_every=yield_every):
+                    interpreter = Interpreter(console_output=False, inp=inputs, engine='vm')
+                    try:
+                        asyncio.run(interpreter.run_async(io.StringIO(source), yield_every=yield_every))
+                    except RuntimeError:
+                        pass
+                    self.assertEqual((interpreter.get_output(), interpreter.get_error_type_and_line()),
+                                     (expected.get_output(), expected.get_error_type_and_line()))
+        self.assertEqual(expected.get_error_type_and_line(), (ErrorType.NAME_ERROR, 2))
+
+    def test_needs_the_vm_engine(self):
+        for engine in Interpreter.ENGINES:
+            if engine != 'vm':
+                with self.subTest(engine=engine):
+                    with self.assertRaises(ValueError):
+                        asyncio.run(Interpreter(console_output=False, engine=engine).run_async(io.StringIO(COUNTER)))
+        with self.assertRaises(ValueError):
+            asyncio.run(Interpreter(console_output=False, engine='vm').run_async(io.StringIO(COUNTER), yield_every=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+"""
+Tests of the batch runner.
+
+Run with python3 -m unittest test_batchv3
+"""
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from batchv3 import load_jobs, run_batch, run_job, run_program
+from interpreterv3 import Interpreter
+
+ECHO = '''(class main
+ (field int n 0)
+ (method void main () (begin (inputi n) (print "got " n))))'''
+FAILING = '''(class main
+ (method void main () (print x)))'''
+
+
+class RunProgramTest(unittest.TestCase):
+    def test_output_and_error(self):
+        interpreter = Interpreter(console_output=False)
+        result = run_program(interpreter, ECHO.split('\n'), ['7'])
+        self.assertEqual((result['output'], result['error_type'], result['exception']), (['got 7'], None, None))
+        result = run_program(interpreter, FAILING.split('\n'), [])
+        self.assertEqual((result['output'], result['error_type'], result['error_line']), ([], 'NAME_ERROR', 1))
+
+    def test_writes_nothing_to_stdout(self):
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            run_program(Interpreter(console_output=False), ECHO.split('\n'), ['7'])
+        self.assertEqual(stdout.getvalue(), '')
+
+
+class RunBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        for name, source in (('echo', ECHO), ('failing', FAILING)):
+            with open(os.path.join(self.directory.name, name + '.br'), 'w') as file:
+                file.write(source)
+        with open(os.path.join(self.directory.name, 'echo.in'), 'w') as file:
+            file.write('5\n')
+
+    def test_directory(self):
+        results = run_batch(load_jobs(self.directory.name), workers=1)
+        self.assertEqual([(result['program'], result['output'], result['error_type']) for result in results],
+                         [('echo.br', ['got 5'], None), ('failing.br', [], 'NAME_ERROR')])
+
+    def test_missing_program(self):
+        result = run_job(('gone.br', os.path.join(self.directory.name, 'gone.br'), []))
+        self.assertTrue(result['exception'].startswith('FileNotFoundError'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+"""
+Differential tests of the parser: BParser.parse must give the same tokens, line numbers and errors as
+the character by character parser it replaced, a copy of which is kept here as the reference.
+
+Run with python3 -m unittest test_bparser
+"""
+
+import random
+import unittest
+
+from bparser import BParser, ListWithLineNumber, StringWithLineNumber
+
+
+class ReferenceParser:
+    """BParser.parse before it tokenized with a regular expression, unchanged but for the names"""
+
+    QUOTE_CHAR = '"'
+    COMMENT_CHAR = '#'
+    WHITESPACE_CHARS = ' \t\r\n'
+    DELIMETER_CHARS = WHITESPACE_CHARS + '()'
+
+    @staticmethod
+    def parse(lines):
+        cur_token = ""
+        in_quote = False
+        output = []
+        output_stack = [output]
+        for line_no, line in enumerate(lines):
+            line = ReferenceParser.remove_comment(line)
+            for char in line:
+                if char == ReferenceParser.QUOTE_CHAR:
+                    if not in_quote:
+                        if cur_token:
+                            output_stack[-1].append(StringWithLineNumber(cur_token, line_no))
+                        cur_token = ReferenceParser.QUOTE_CHAR
+                        in_quote = True
+                    else:
+                        cur_token += ReferenceParser.QUOTE_CHAR
+                        output_stack[-1].append(StringWithLineNumber(cur_token, line_no))
+                        cur_token = ""
+                        in_quote = False
+                    continue
+                if in_quote:
+                    cur_token += char
+                    continue
+
+                if char in ReferenceParser.DELIMETER_CHARS:
+                    if cur_token:
+                        output_stack[-1].append(StringWithLineNumber(cur_token, line_no))
+                        cur_token = ""
+                if char == '(':
+                    nested = output_stack[-1]
+                    nested.append([])
+                    output_stack.append(nested[-1])
+                elif char == ')':
+                    if len(output_stack) < 2:
+                        return False, "Extra closing parenthesis"
+                    output_stack.pop()
+                elif char not in ReferenceParser.WHITESPACE_CHARS:
+                    cur_token += char
+            if in_quote:
+                return False, "Unclosed string"
+            if cur_token:
+                output_stack[-1].append(StringWithLineNumber(cur_token, line_no))
+                cur_token = ""
+        if len(output_stack) > 1:
+            return False, "Unclosed parenthesis"
+        return True, output
+
+    @staticmethod
+    def remove_comment(line):
+        in_string = False
+        stripped_line = ""
+        for char in line:
+            if char == ReferenceParser.COMMENT_CHAR and not in_string:
+                return stripped_line
+            if char == ReferenceParser.QUOTE_CHAR:
+                in_string = not in_string
+            stripped_line += char
+        return stripped_line
+
+
+def with_line_numbers(items):
+    """The tokens of a parse tree as (text, line number) pairs, keeping its nesting"""
+    return [with_line_numbers(item) if isinstance(item, list) else (str(item), item.line_num) for item in items]
+
+
+def texts(items):
+    return [texts(item) if isinstance(item, list) else item for item in items]
+
+
+CASES = [
+    '(class main (method void main () (print "hello world")))',
+    '(class main\n  (field int x 5)  # a comment\n  # a whole line of comment\n  (method void main () (print x)))',
+    '(print "a # in a string") # and a comment after it',
+    '(print "# only a string")',
+    'token#comment right after a token',
+    '(print "two" "strings"")',
+    '(print "unterminated)\n(print "x")',
+    '(print "a"b"c")',
+    '(a b)) (c)',
+    '(a (b\n c)',
+    '"top level string" atom (list)',
+    '(\ttabs\tand\r\ncarriage returns )',
+    '(empty () lists (()))',
+    '(-5 "" "(" ")")',
+    '',
+    '#',
+    '"',
+]
+
+
+class DifferentialParserTest(unittest.TestCase):
+    def assert_same(self, lines):
+        expected_status, expected = ReferenceParser.parse(lines)
+        status, output = BParser.parse(lines)
+        self.assertEqual(status, expected_status)
+        if not expected_status:
+            self.assertEqual(output, expected)
+            self.assertEqual(BParser.parse(lines, interned=True), (False, expected))
+            return
+        self.assertEqual(with_line_numbers(output), with_line_numbers(expected))
+        interned_status, interned = BParser.parse(lines, interned=True)
+        self.assertTrue(interned_status)
+        self.assertEqual(texts(interned), texts(expected))
+        self.assert_list_lines(interned, expected)
+
+    def assert_list_lines(self, interned, expected):
+        # an interned list keeps the line of its first token, when it starts with one
+        for item, reference in zip(interned, expected):
+            if isinstance(item, list):
+                self.assertIsInstance(item, ListWithLineNumber)
+                if reference and not isinstance(reference[0], list):
+                    self.assertEqual(item.line_num, reference[0].line_num)
+                self.assert_list_lines(item, reference)
+
+    def test_cases(self):
+        for source in CASES:
+            with self.subTest(source=source):
+                self.assert_same(source.split('\n'))
+
+    def test_random_lines(self):
+        generator = random.Random(131)
+        alphabet = ['(', ')', '"', '#', ' ', ' ', '\t', 'a', 'bc', '1', '-', '\r']
+        for _ in range(5000):
+            lines = [''.join(generator.choice(alphabet) for _ in range(generator.randrange(12)))
+                     for _ in range(generator.randrange(1, 5))]
+            with self.subTest(lines=lines):
+                self.assert_same(lines)
+
+    def test_random_balanced_programs(self):
+        # most random lines end in an error early; these are balanced, so their trees are compared too
+        generator = random.Random(2023)
+        words = ['x', '"s # t"', '"()"', '""', '-1', '# note', '\t', 'y"z"']
+        for _ in range(2000):
+            parts = []
+            depth = 0
+            for _ in range(generator.randrange(1, 30)):
+                choice = generator.random()
+                if choice < 0.25:
+                    parts.append('(')
+                    depth += 1
+                elif choice < 0.45 and depth:
+                    parts.append(')')
+                    depth -= 1
+                elif choice < 0.55:
+                    parts.append('\n')
+                else:
+                    parts.append(' ' + generator.choice(words) + ' ')
+            source = ''.join(parts) + ')' * depth
+            with self.subTest(source=source):
+                self.assert_same(source.split('\n'))
+
+
+if __name__ == '__main__':
+    unittest.main()
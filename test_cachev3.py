@@ -0,0 +1,83 @@
+"""
+Tests of the on-disk cache of parsed programs.
+
+Run with python3 -m unittest test_cachev3
+"""
+
+import marshal
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from cachev3 import ParseCache
+from interpreterv3 import Interpreter
+
+SOURCE = '''(class main
+ (method void main () (print (+ 1 2) " " "a # b")))'''.split('\n')
+
+
+class ParseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def run_source(self, source=SOURCE, fold_constants=True):
+        interpreter = Interpreter(console_output=False, cache_dir=self.directory.name, fold_constants=fold_constants)
+        interpreter.run(source)
+        return interpreter
+
+    def cache(self, source=SOURCE, fold_constants=True):
+        return ParseCache(Interpreter(fold_constants=fold_constants), self.directory.name, source)
+
+    def test_hit(self):
+        first = self.run_source()
+        program, folds = self.cache().load()
+        self.assertEqual(folds, first.get_folds())
+        self.assertEqual(program, [['class', 'main', ['method', 'void', 'main', [], ['print', '3', '" "', '"a # b"']]]])
+        self.assertEqual([item.line_num for item in program[0][2:]], [1])
+        second = self.run_source()
+        self.assertEqual((second.get_output(), second.get_folds()), (['3 a # b'], first.get_folds()))
+
+    def test_corrupt_or_truncated_file_is_a_miss(self):
+        self.run_source()
+        cache = self.cache()
+        with open(cache.path, 'rb') as file:
+            data = file.read()
+        for broken in (data[:len(data) // 2], b'', b'not marshal data',
+                       marshal.dumps((ParseCache.FORMAT_VERSION, ['a'], [5], [])),
+                       marshal.dumps((ParseCache.FORMAT_VERSION, ['a'], [-1], [])),
+                       marshal.dumps((ParseCache.FORMAT_VERSION, [1], [0], [])),
+                       marshal.dumps(42)):
+            with self.subTest(broken=broken):
+                with open(cache.path, 'wb') as file:
+                    file.write(broken)
+                self.assertIsNone(cache.load())
+                self.assertEqual(self.run_source().get_output(), ['3 a # b'])
+                self.assertIsNotNone(cache.load())  # the run wrote the file again
+
+    def test_key_changes_with_fold_constants(self):
+        self.assertNotEqual(self.cache(fold_constants=True).path, self.cache(fold_constants=False).path)
+        self.run_source(fold_constants=True)
+        self.assertIsNone(self.cache(fold_constants=False).load())
+        unfolded = self.run_source(fold_constants=False)
+        self.assertEqual((unfolded.get_output(), unfolded.get_folds()), (['3 a # b'], []))
+        self.assertEqual(self.cache(fold_constants=False).load()[0][0][2][4][1], ['+', '1', '2'])
+        self.assertEqual(self.cache(fold_constants=True).load()[0][0][2][4][1], '3')
+
+    def test_least_recently_used_files_are_evicted(self):
+        sources = [[f'(class main (method void main () (print {i})))'] for i in range(4)]
+        with mock.patch.object(ParseCache, 'MAX_FILES', 2):
+            for source in sources[:2]:
+                self.run_source(source)
+            # loading the first program makes the second one the least recently used
+            os.utime(self.cache(sources[1]).path, (0, 0))
+            self.assertIsNotNone(self.cache(sources[0]).load())
+            self.run_source(sources[2])
+            self.assertEqual([self.cache(source).load() is not None for source in sources[:3]], [True, False, True])
+            self.run_source(sources[3])
+        self.assertEqual(len([name for name in os.listdir(self.directory.name) if name.endswith('.bpc')]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+"""
+Tests of the closure engine: when it compiles, the paths that skip intermediate Values, and the errors
+it defers until a compiled statement runs. Its results must be those of the tree-walker.
+
+Run with python3 -m unittest test_closurev3
+"""
+
+import io
+import unittest
+from unittest import mock
+
+from closurev3 import ClosureEngine
+from intbase import ErrorType
+from interpreterv3 import Interpreter
+
+
+def run(source, engine='closure', inp=None, fold_constants=True):
+    """Run a program and return (printed lines, error type, error line)"""
+    interpreter = Interpreter(console_output=False, engine=engine, inp=inp, fold_constants=fold_constants)
+    try:
+        interpreter.run(io.StringIO(source))
+    except RuntimeError:
+        pass
+    return interpreter.get_output(), interpreter.error_type, interpreter.error_line
+
+
+class ClosureEngineTest(unittest.TestCase):
+    def assert_like_tree(self, source, expected, inp=None, fold_constants=True):
+        self.assertEqual(run(source, 'closure', inp, fold_constants), expected)
+        self.assertEqual(run(source, 'tree', inp, fold_constants), expected)
+
+    def test_classes_compile_once_on_first_call(self):
+        source = '''
+(class helper (method int twice ((int x)) (return (* 2 x))))
+(class unused (method void never () (print "never")))
+(class main
+ (field int i 0)
+ (field int total 0)
+ (method void main ()
+  (begin
+   (while (< i 50) (begin (set total (+ total (call (new helper) twice i))) (set i (+ i 1))))
+   (print total))))
+'''
+        compile_class = ClosureEngine._ClosureEngine__compile_class
+        with mock.patch.object(ClosureEngine, '_ClosureEngine__compile_class', autospec=True,
+                               side_effect=compile_class) as compiled:
+            self.assertEqual(run(source), (['2450'], None, None))
+        self.assertEqual([call.args[1].name for call in compiled.call_args_list], ['main', 'helper'])
+
+    def test_unboxed_arithmetic(self):
+        # parameters and let variables of primitive types are computed on Python values
+        source = '''
+(class main
+ (method void show ((int a) (int b) (string s) (bool f))
+  (let ((int c -3))
+   (print (/ a b) " " (% a b) " " (/ a c) " " (+ (* a b) (- c a)) " " (+ s s) " " (< s "b") " "
+          (& f (! (== a b))) " " (| f (> a c)))))
+ (method void main () (call me show -7 2 "a" false)))
+'''
+        self.assert_like_tree(source, (['-3 1 2 -10 aa true false false'], None, None))
+
+    def test_unboxed_while_condition(self):
+        source = '''
+(class main
+ (method void main ()
+  (let ((int i 0) (int total 0))
+   (while (< i 5) (begin (set total (+ total i)) (set i (+ i 1))))
+   (print total))))
+'''
+        self.assert_like_tree(source, (['10'], None, None))
+
+    def test_fields_stay_boxed(self):
+        # inputs can store a string into an int field, so arithmetic on fields checks types when it runs
+        source = '''
+(class main
+ (field int x 0)
+ (method void main () (begin (inputs x) (print (+ x "!")) (print (+ x 1)))))
+'''
+        self.assert_like_tree(source, (['5!'], ErrorType.TYPE_ERROR, 3), inp=['5'])
+
+    def test_errors_wait_until_the_statement_runs(self):
+        source = '''
+(class main
+ (method void broken () (begin (print "broken") (call me)))
+ (method void never () (frobnicate 1))
+ (method void main ()
+  (begin
+   (if false (print missing) (print "fine"))
+   (call me broken))))
+'''
+        # the tree-walker fails on the malformed call with a Python error rather than a Brewin one
+        self.assertEqual(run(source, fold_constants=False), (['fine', 'broken'], ErrorType.SYNTAX_ERROR, 2))
+
+    def test_statements_that_never_run_never_fail(self):
+        source = '''
+(class main
+ (method void never () (begin (frobnicate 1) (call me) (print missing)))
+ (method void main () (if false (call me never) (print "fine"))))
+'''
+        self.assert_like_tree(source, (['fine'], None, None), fold_constants=False)
+
+    def test_call_inside_try_is_not_a_tail_call(self):
+        source = '''
+(class main
+ (method int fail () (begin (throw "bad") (return 1)))
+ (method int f () (begin (try (return (call me fail)) (print "caught " exception)) (return 2)))
+ (method void main () (print (call me f))))
+'''
+        self.assert_like_tree(source, (['caught bad', '2'], None, None))
+
+    def test_tail_call_result_is_coerced(self):
+        source = '''
+(class main
+ (method string s () (return "text"))
+ (method int f () (return (call me s)))
+ (method void main () (print (call me f))))
+'''
+        self.assert_like_tree(source, ([], ErrorType.TYPE_ERROR, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
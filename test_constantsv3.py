@@ -0,0 +1,54 @@
+"""
+Tests of the pool of parsed atoms every interpreter keeps.
+
+Run with python3 -m unittest test_constantsv3
+"""
+
+import io
+import unittest
+
+from interpreterv3 import Interpreter, Type
+
+PROGRAM = '''
+(class main
+ (field int x 40)
+ (method void main () (print (+ x 2) " " "text" " " true)))
+'''
+
+
+class ConstantsTest(unittest.TestCase):
+    def test_interpreters_do_not_share_constants(self):
+        first, second = Interpreter(console_output=False), Interpreter(console_output=False)
+        first.run(io.StringIO(PROGRAM))
+        self.assertIn('40', first.constants)
+        self.assertEqual(len(second.constants), 0)
+
+    def test_least_recently_used_atom_is_dropped(self):
+        interpreter = Interpreter(console_output=False)
+        interpreter.LITERAL_CACHE_SIZE = 2
+        one = interpreter.constant('1')
+        interpreter.constant('"two"')
+        self.assertIs(interpreter.constant('1'), one)
+        interpreter.constant('x')
+        self.assertEqual(list(interpreter.constants), ['1', 'x'])
+        self.assertEqual((one.typeof(), one.val()), (Type.INT, 1))
+        self.assertEqual(interpreter.constant('x').typeof(), Type.UNDEFINED)
+
+    def test_literal_is_a_new_value(self):
+        interpreter = Interpreter(console_output=False)
+        literal = interpreter.literal('null')
+        self.assertIsNot(literal, interpreter.constant('null'))
+        self.assertEqual((literal.typeof(), literal.val()), (Type.POINTER, None))
+
+    def test_programs_run_with_a_small_pool(self):
+        for engine in Interpreter.ENGINES:
+            with self.subTest(engine=engine):
+                interpreter = Interpreter(console_output=False, engine=engine)
+                interpreter.LITERAL_CACHE_SIZE = 2
+                interpreter.run(io.StringIO(PROGRAM))
+                self.assertEqual(interpreter.get_output(), ['42 text true'])
+                self.assertLessEqual(len(interpreter.constants), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
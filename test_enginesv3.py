@@ -0,0 +1,203 @@
+"""
+Differential tests of the v3 execution engines: every program runs on the tree-walker and on the
+closure and vm engines, which must print the same lines and end with the same error type and line,
+except for the differences listed in the readme, which are pinned down here too.
+
+Run with python3 -m unittest test_enginesv3
+"""
+
+import io
+import unittest
+
+from intbase import ErrorType
+from interpreterv3 import Interpreter
+
+COMPILED_ENGINES = ('closure', 'vm')
+
+
+def run(source, engine):
+    """Run a program and return (printed lines, error type, error line)"""
+    interpreter = Interpreter(console_output=False, engine=engine)
+    try:
+        interpreter.run(io.StringIO(source))  # a streamed program is not echoed by the parser
+    except RuntimeError:
+        pass
+    return interpreter.get_output(), interpreter.error_type, interpreter.error_line
+
+
+# (name, program, expected output, error type, error line) that every engine must agree on
+MATCHED = [
+    ('return inside try ends the try body', '''
+(class main
+ (method int f () (begin (try (return 5) (print "x")) (print "after try")))
+ (method void main () (print (call me f))))
+''', ['after try', '0'], None, None),
+    ('return inside catch', '''
+(class main
+ (method int f () (begin (try (throw "x") (return 7)) (return 8)))
+ (method void main () (print (call me f))))
+''', ['7'], None, None),
+    ('if running a call ends the statements around it', '''
+(class main
+ (method void hi () (print "hi"))
+ (method void main () (begin (if true (call me hi)) (print "after"))))
+''', ['hi'], None, None),
+    ('a call from an if is the result of the method', '''
+(class main
+ (method int f () (begin (if false (print "x") (call me g)) (return 1)))
+ (method int g () (return 4))
+ (method void main () (print (call me f))))
+''', ['4'], None, None),
+    ('a begin ending with a call ends the statements around it', '''
+(class main
+ (method int f () (return 3))
+ (method int g () (begin (begin (print "a") (call me f)) (print "b") (return 9)))
+ (method void main () (print (call me g))))
+''', ['a', '3'], None, None),
+    ('a call statement in a loop body ends the loop and the statements around it', '''
+(class main
+ (field int i 0)
+ (method void f () (set i (+ i 1)))
+ (method void main () (begin (while (< i 5) (call me f)) (print "after " i))))
+''', [], None, None),
+    ('a loop that never runs ends the statements around it', '''
+(class main
+ (field int i 0)
+ (method void main () (begin (while (< i 0) (set i 1)) (print "after"))))
+''', [], None, None),
+    ('a loop condition is evaluated once more before the loop', '''
+(class main
+ (field int n 0)
+ (method bool c () (begin (set n (+ n 1)) (return (< n 3))))
+ (method void main () (begin (while (call me c) (print n)) (print "end " n))))
+''', ['2', 'end 3'], None, None),
+    ('a throw in a loop condition unwinds to the enclosing try', '''
+(class main
+ (field int i 0)
+ (method bool c () (begin (set i (+ i 1)) (if (> i 1) (throw "stop")) (return true)))
+ (method void main () (try (while (call me c) (print i)) (print "caught " exception " " i))))
+''', ['caught stop 2'], None, None),
+    ('an int loop condition goes on while it is not 0', '''
+(class main
+ (field int i 3)
+ (method void main () (begin (while (- i 0) (set i (- i 1))) (print i))))
+''', ['0'], None, None),
+    ('an int variable is not an if condition', '''
+(class main
+ (field int n 1)
+ (method void main () (if n (print "yes") (print "no"))))
+''', [], ErrorType.TYPE_ERROR, 3),
+    ('an undefined loop condition is a type error', '''
+(class main
+ (method void main () (while x (print 1))))
+''', [], ErrorType.TYPE_ERROR, 2),
+    ('main is not coerced to its return type', '''
+(class main
+ (method void main () (return 5)))
+''', [], None, None),
+    ('me passed as an argument', '''
+(class main
+ (method void take ((main m)) (print "took"))
+ (method void main () (call me take me)))
+''', [], ErrorType.NAME_ERROR, None),
+    ('me assigned to a field', '''
+(class main
+ (field main m null)
+ (method void main () (begin (set m me) (print "ok"))))
+''', [], ErrorType.TYPE_ERROR, None),
+    ('me printed', '''
+(class main
+ (method void main () (print me)))
+''', [], ErrorType.NAME_ERROR, 2),
+    ('me thrown', '''
+(class main
+ (method void main () (throw me)))
+''', [], ErrorType.NAME_ERROR, None),
+    ('exception printed outside a catch', '''
+(class main
+ (method void main () (print exception)))
+''', [], ErrorType.NAME_ERROR, 2),
+    ('the exception variable is gone once any catch completes', '''
+(class main
+ (method void main () (try (throw "a") (begin (try (throw "b") (print exception)) (print exception)))))
+''', ['b'], ErrorType.NAME_ERROR, 2),
+    ('the exception variable is seen by methods called from a catch', '''
+(class main
+ (method void show () (print "in show " exception))
+ (method void main () (try (throw "e") (call me show))))
+''', ['in show e'], None, None),
+    ('me in a method run by super is the base class', '''
+(class a (method string s () (return "a")) (method void d () (print (call me s))))
+(class b inherits a (method string s () (return "b")) (method void d () (call super d)))
+(class main (method void main () (call (new b) d)))
+''', ['a'], None, None),
+]
+
+
+class MatchedBehaviourTest(unittest.TestCase):
+    def test_engines_agree(self):
+        for name, source, output, error_type, error_line in MATCHED:
+            for engine in Interpreter.ENGINES:
+                with self.subTest(name, engine=engine):
+                    self.assertEqual(run(source, engine), (output, error_type, error_line))
+
+
+class DocumentedDifferenceTest(unittest.TestCase):
+    """The deliberate differences of the compiled engines listed in the readme"""
+
+    def assert_outcomes(self, source, tree, compiled, engines=COMPILED_ENGINES):
+        self.assertEqual(run(source, 'tree'), tree)
+        for engine in engines:
+            with self.subTest(engine=engine):
+                self.assertEqual(run(source, engine), compiled)
+
+    def test_let_variables_are_not_seen_by_called_methods(self):
+        source = '''
+(class main
+ (method void show () (print x))
+ (method void main () (let ((int x 5)) (call me show))))
+'''
+        self.assert_outcomes(source, (['5'], None, None), ([], ErrorType.NAME_ERROR, 2))
+
+    def test_let_variable_is_checked_against_its_declared_class(self):
+        source = '''
+(class a (method void x () (print "a")))
+(class b inherits a)
+(class c inherits a)
+(class main (method void main () (let ((a q null)) (set q (new b)) (set q (new c)) (print "ok"))))
+'''
+        self.assert_outcomes(source, ([], ErrorType.TYPE_ERROR, None), (['ok'], None, None))
+
+    def test_parameter_is_checked_against_its_declared_class(self):
+        source = '''
+(class a (method void x () (print "a")))
+(class b inherits a)
+(class c inherits a)
+(class main
+ (method void f ((a q)) (begin (set q (new c)) (print "ok")))
+ (method void main () (call me f (new b))))
+'''
+        self.assert_outcomes(source, ([], ErrorType.TYPE_ERROR, None), (['ok'], None, None))
+
+    def test_me_is_the_whole_object(self):
+        source = '''
+(class a (method bool same ((a other)) (return (== me other))))
+(class b inherits a)
+(class main
+ (field b x null)
+ (method void main () (begin (set x (new b)) (print (call x same x)))))
+'''
+        self.assert_outcomes(source, (['false'], None, None), (['true'], None, None))
+
+    def test_vm_recursion_is_not_bound_by_the_python_stack(self):
+        source = '''
+(class main
+ (method int sum ((int k)) (if (== k 0) (return 0) (return (+ k (call me sum (- k 1))))))
+ (method void main () (print (call me sum 3000))))
+'''
+        self.assertEqual(run(source, 'tree'), ([], ErrorType.FAULT_ERROR, None))
+        self.assertEqual(run(source, 'vm'), (['4501500'], None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
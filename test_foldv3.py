@@ -0,0 +1,117 @@
+"""
+Tests of the constant folding pass: what it rewrites, what it leaves alone, and that folded programs
+behave on every engine as they do unfolded.
+
+Run with python3 -m unittest test_foldv3
+"""
+
+import io
+import unittest
+
+from intbase import ErrorType
+from interpreterv3 import Interpreter
+
+
+def run(source, engine='tree', fold_constants=True):
+    """Run a program and return (printed lines, error type, error line, folds)"""
+    interpreter = Interpreter(console_output=False, engine=engine, fold_constants=fold_constants)
+    try:
+        interpreter.run(io.StringIO(source))
+    except RuntimeError:
+        pass
+    return interpreter.get_output(), interpreter.error_type, interpreter.error_line, interpreter.get_folds()
+
+
+class ConstantFolderTest(unittest.TestCase):
+    def assert_folds(self, source, folds, output, error_type=None, error_line=None):
+        """Check the folds of source, and its outcome on every engine, folded or not"""
+        self.assertEqual(run(source)[3], folds)
+        for engine in Interpreter.ENGINES:
+            for fold_constants in (True, False):
+                with self.subTest(engine=engine, fold_constants=fold_constants):
+                    self.assertEqual(run(source, engine, fold_constants)[:3], (output, error_type, error_line))
+
+    def test_nested_expression(self):
+        source = '''
+(class main
+ (method void main () (print (+ 1 (* 2 3)) " " (== "a" "a") " " (! false))))
+'''
+        self.assert_folds(source, [(2, '(* 2 3)', '6'), (2, '(+ 1 (* 2 3))', '7'), (2, '(== "a" "a")', 'true'),
+                                   (2, '(! false)', 'true')], ['7 true true'])
+
+    def test_division_by_zero_is_left_alone(self):
+        # the division still fails when the program reaches it, as it does unfolded
+        for operator in ('/', '%'):
+            source = f'''
+(class main
+ (method void main () (begin (print "before") (print ({operator} 1 0)))))
+'''
+            for engine in Interpreter.ENGINES:
+                with self.subTest(operator=operator, engine=engine):
+                    interpreter = Interpreter(console_output=False, engine=engine)
+                    with self.assertRaises(ZeroDivisionError):
+                        interpreter.run(io.StringIO(source))
+                    self.assertEqual((interpreter.get_output(), interpreter.get_folds()), (['before'], []))
+
+    def test_mismatched_types_are_left_alone(self):
+        source = '''
+(class main
+ (method void main () (begin (print "before") (print (+ 1 "a")))))
+'''
+        self.assert_folds(source, [], ['before'], ErrorType.TYPE_ERROR, 2)
+
+    def test_operator_of_another_type_is_left_alone(self):
+        source = '''
+(class main
+ (method void main () (print (- "a" "b"))))
+'''
+        self.assert_folds(source, [], [], ErrorType.TYPE_ERROR, None)
+
+    def test_if_on_literal_conditions(self):
+        source = '''
+(class main
+ (method void main ()
+  (begin
+   (if true (print "then") (print "else"))
+   (if (> 1 2) (print "then") (print "else"))
+   (if false (print "never"))
+   (print "end"))))
+'''
+        self.assert_folds(source, [(4, '(if true ...)', 'then branch'), (5, '(> 1 2)', 'false'),
+                                   (5, '(if false ...)', 'else branch'), (6, '(if false ...)', '(begin)')],
+                          ['then', 'else', 'end'])
+
+    def test_non_bool_condition_is_left_alone(self):
+        source = '''
+(class main
+ (method void main () (if (+ 1 1) (print "yes"))))
+'''
+        self.assert_folds(source, [], [], ErrorType.TYPE_ERROR, None)
+
+    def test_while_false_literal(self):
+        source = '''
+(class main
+ (method void main () (begin (while false (print "never")) (print "end"))))
+'''
+        self.assert_folds(source, [(2, '(while false ...)', '(begin)')], ['end'])
+
+    def test_while_on_an_expression_folding_to_false_returns_false(self):
+        # the tree-walker ends the statements around a loop that never runs with the value of its condition
+        source = '''
+(class main
+ (method bool f () (begin (while (> 1 2) (print "never")) (return true)))
+ (method void main () (print (call me f))))
+'''
+        self.assert_folds(source, [(2, '(> 1 2)', 'false'), (2, '(while false ...)', '(return false)')], ['false'])
+
+    def test_call_on_an_if_branch_keeps_ending_the_statements_around_it(self):
+        source = '''
+(class main
+ (method void hi () (print "hi"))
+ (method void main () (begin (if true (call me hi)) (print "after"))))
+'''
+        self.assert_folds(source, [(3, '(if true ...)', 'then branch')], ['hi'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+Tests of the input providers, above all of values that StreamInput reads across block boundaries.
+
+Run with python3 -m unittest test_inputv3
+"""
+
+import io
+import mmap
+import os
+import tempfile
+import unittest
+
+from inputv3 import IterableInput, StreamInput
+from interpreterv3 import Interpreter
+
+BLOCK = StreamInput.BLOCK_SIZE
+
+
+def read_all(provider):
+    values = []
+    while (value := provider.next()) is not None:
+        values.append(value)
+    return values
+
+
+class StreamInputTest(unittest.TestCase):
+    def assert_values(self, data, lines, tokens, block_size=BLOCK):
+        """Check the lines and tokens StreamInput reads from data, as bytes, as a mmap and, decoded, as text"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'input')
+            with open(path, 'wb') as file:
+                file.write(data)
+            for split_tokens, expected in ((False, lines), (True, tokens)):
+                with self.subTest(tokens=split_tokens, form='bytes'):
+                    self.assertEqual(read_all(StreamInput(io.BytesIO(data), block_size, split_tokens)), expected)
+                with self.subTest(tokens=split_tokens, form='text'):
+                    stream = io.StringIO(data.decode(), newline='')
+                    self.assertEqual(read_all(StreamInput(stream, block_size, split_tokens)), expected)
+                with self.subTest(tokens=split_tokens, form='mmap'):
+                    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        self.assertEqual(read_all(StreamInput(mapped, block_size, split_tokens)), expected)
+
+    def test_line_across_the_block_boundary(self):
+        first = 'a' * (BLOCK - 3)
+        data = (first + '\nstraddles\nlast').encode()
+        self.assertEqual(len(first) + 1, BLOCK - 2)  # the block ends inside 'straddles'
+        self.assert_values(data, [first, 'straddles', 'last'], [first, 'straddles', 'last'])
+
+    def test_line_break_at_the_block_boundary(self):
+        for offset in (-1, 0, 1):
+            with self.subTest(offset=offset):
+                first = 'b' * (BLOCK - 1 + offset)
+                data = (first + '\r\n12 34\r\n').encode()
+                self.assert_values(data, [first, '12 34'], [first, '12', '34'])
+
+    def test_token_across_the_block_boundary(self):
+        words = ' '.join(['word'] * (BLOCK // 5))  # 'word ' * n without the last space
+        data = (words + 'token across\n').encode()
+        self.assertLess(len(words), BLOCK)
+        self.assertGreater(len(words) + len('token'), BLOCK)
+        self.assert_values(data, [words + 'token across'], ['word'] * (BLOCK // 5 - 1) + ['wordtoken', 'across'])
+
+    def test_multibyte_character_across_the_block_boundary(self):
+        for character in ('é', '€', '😀'):
+            size = len(character.encode())
+            for cut in range(1, size):
+                with self.subTest(character=character, cut=cut):
+                    first = 'c' * (BLOCK - cut)  # the block ends after cut bytes of the character
+                    lines = [first + character + 'd', character]
+                    data = '\n'.join(lines).encode()
+                    self.assertEqual(io.BytesIO(data).read(BLOCK)[-cut:], character.encode()[:cut])
+                    self.assert_values(data, lines, lines)
+
+    def test_small_blocks(self):
+        text = 'x é\r\n€€ 😀y\n\n  z  \nlast'
+        lines = ['x é', '€€ 😀y', '', '  z  ', 'last']
+        for block_size in range(1, 9):
+            with self.subTest(block_size=block_size):
+                self.assert_values(text.encode(), lines, text.split(), block_size)
+
+    def test_empty_stream(self):
+        for stream in (io.BytesIO(), io.StringIO()):  # an empty file cannot be memory-mapped
+            for tokens in (False, True):
+                self.assertEqual(read_all(StreamInput(stream, tokens=tokens)), [])
+
+
+class InterpreterInputTest(unittest.TestCase):
+    def test_program_reads_from_a_provider(self):
+        source = '''
+(class main
+ (field int x 0)
+ (field string s "")
+ (method void main () (begin (inputi x) (inputs s) (print (+ x 1) s))))
+'''
+        for provider in (lambda: IterableInput(['41', 'é']),
+                         lambda: StreamInput(io.BytesIO('41\né'.encode()), block_size=3)):
+            for engine in Interpreter.ENGINES:
+                with self.subTest(engine=engine):
+                    interpreter = Interpreter(console_output=False, engine=engine, input_provider=provider())
+                    interpreter.run(io.StringIO(source))
+                    self.assertEqual(interpreter.get_output(), ['42é'])
+
+
+if __name__ == '__main__':
+    unittest.main()
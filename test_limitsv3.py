@@ -0,0 +1,105 @@
+"""
+Tests of max_steps and time_limit: every engine must stop a run at the same step, and a run that goes
+on too long must end with a FAULT_ERROR.
+
+Run with python3 -m unittest test_limitsv3
+"""
+
+import io
+import time
+import unittest
+
+from intbase import ErrorType
+from interpreterv3 import Interpreter
+
+# the call of main is the first step and every loop iteration and method call one more
+LOOP = '''
+(class main
+ (field int i 0)
+ (method void main () (while true (begin (print i) (set i (+ i 1))))))
+'''
+CALLS = '''
+(class main
+ (field int i 0)
+ (method void f () (print i))
+ (method void main () (while true (begin (call me f) (set i (+ i 1))))))
+'''
+RECURSION = '''
+(class main
+ (method void f ((int n)) (begin (print n) (call me f (+ n 1))))
+ (method void main () (call me f 0)))
+'''
+TAIL_RECURSION = '''
+(class main
+ (method int f ((int n)) (begin (print n) (return (call me f (+ n 1)))))
+ (method void main () (print (call me f 0))))
+'''
+FIVE_ITERATIONS = '''
+(class main
+ (field int i 0)
+ (method void main () (begin (while (< i 5) (set i (+ i 1))) (print i))))
+'''
+
+
+def outcome(source, **limits):
+    interpreter = Interpreter(console_output=False, **limits)
+    try:
+        interpreter.run(io.StringIO(source))
+        description = None
+    except RuntimeError as error:
+        description = str(error)
+    return interpreter.get_output(), interpreter.error_type, description
+
+
+class StepBudgetTest(unittest.TestCase):
+    def test_exact_stopping_step(self):
+        # (program, lines printed before the step past a budget of max_steps, budgets); plain recursion
+        # stays shallow enough for the Python stack of the tree-walker and the closure engine
+        programs = [
+            ('loop', LOOP, lambda max_steps: max_steps - 1, (1, 2, 3, 10, 101, 2500)),
+            ('calls', CALLS, lambda max_steps: (max_steps - 1) // 2, (1, 2, 3, 10, 101, 2500)),
+            ('recursion', RECURSION, lambda max_steps: max_steps - 1, (1, 2, 3, 10, 101)),
+            ('tail recursion', TAIL_RECURSION, lambda max_steps: max_steps - 1, (1, 2, 3, 10, 101, 2500)),
+        ]
+        for name, source, printed, budgets in programs:
+            for engine in Interpreter.ENGINES:
+                for max_steps in budgets:
+                    with self.subTest(name, engine=engine, max_steps=max_steps):
+                        output, error_type, description = outcome(source, engine=engine, max_steps=max_steps)
+                        self.assertEqual(output, [str(i) for i in range(printed(max_steps))])
+                        self.assertEqual(error_type, ErrorType.FAULT_ERROR)
+                        self.assertIn('step budget exhausted', description)
+
+    def test_run_of_exactly_max_steps_finishes(self):
+        for engine in Interpreter.ENGINES:
+            with self.subTest(engine=engine):
+                self.assertEqual(outcome(FIVE_ITERATIONS, engine=engine, max_steps=6), (['5'], None, None))
+                self.assertEqual(outcome(FIVE_ITERATIONS, engine=engine, max_steps=5)[1], ErrorType.FAULT_ERROR)
+
+    def test_budget_with_a_time_limit(self):
+        # with a time limit the engines check in every LIMIT_CHECK_INTERVAL steps, but stop at the same step
+        for engine in Interpreter.ENGINES:
+            with self.subTest(engine=engine):
+                output, error_type, _ = outcome(LOOP, engine=engine, max_steps=2500, time_limit=60)
+                self.assertEqual((len(output), error_type), (2499, ErrorType.FAULT_ERROR))
+
+
+class TimeLimitTest(unittest.TestCase):
+    def test_endless_loop_is_stopped(self):
+        for source in (LOOP, TAIL_RECURSION):
+            for engine in Interpreter.ENGINES:
+                with self.subTest(engine=engine):
+                    start = time.monotonic()
+                    _, error_type, description = outcome(source, engine=engine, time_limit=0.2)
+                    self.assertLess(time.monotonic() - start, 5)
+                    self.assertEqual(error_type, ErrorType.FAULT_ERROR)
+                    self.assertIn('time limit exceeded', description)
+
+    def test_short_run_finishes(self):
+        for engine in Interpreter.ENGINES:
+            with self.subTest(engine=engine):
+                self.assertEqual(outcome(FIVE_ITERATIONS, engine=engine, time_limit=60), (['5'], None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
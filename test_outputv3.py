@@ -0,0 +1,100 @@
+"""
+Tests of the output sinks.
+
+Run with python3 -m unittest test_outputv3
+"""
+
+import io
+import unittest
+
+from interpreterv3 import Interpreter
+from outputv3 import BufferedWriter, DiscardLog, OutputLog, RingBufferLog, TeeSink
+
+PROGRAM = '''
+(class main
+ (field int i 0)
+ (method void main ()
+  (begin
+   (while (< i 5) (begin (print "line " i) (set i (+ i 1))))
+   (print missing))))
+'''
+
+
+class BufferedWriterTest(unittest.TestCase):
+    def test_writes_in_blocks(self):
+        stream = io.StringIO()
+        writer = BufferedWriter(stream, block_size=10)
+        writer.write('abc')
+        self.assertEqual(stream.getvalue(), '')
+        writer.write('defgh')  # 4 + 6 characters with the newlines: a whole block
+        self.assertEqual(stream.getvalue(), 'abc\ndefgh\n')
+        writer.write('x')
+        self.assertEqual(stream.getvalue(), 'abc\ndefgh\n')
+        writer.flush()
+        self.assertEqual(stream.getvalue(), 'abc\ndefgh\nx\n')
+        writer.flush()
+        self.assertEqual(stream.getvalue(), 'abc\ndefgh\nx\n')
+
+    def test_line_longer_than_a_block(self):
+        stream = io.StringIO()
+        BufferedWriter(stream, block_size=4).write('too long')
+        self.assertEqual(stream.getvalue(), 'too long\n')
+
+
+class RingBufferLogTest(unittest.TestCase):
+    def test_keeps_the_last_lines(self):
+        log = RingBufferLog(3)
+        for i in range(5):
+            log.write(str(i))
+        self.assertEqual(log.get_output(), ['2', '3', '4'])
+        log.clear()
+        log.write('5')
+        self.assertEqual(log.get_output(), ['5'])
+
+
+class TeeSinkTest(unittest.TestCase):
+    def test_output_of_the_last_sink(self):
+        sink = TeeSink(OutputLog(), RingBufferLog(2))
+        for line in 'abc':
+            sink.write(line)
+        self.assertEqual(sink.get_output(), ['b', 'c'])
+
+    def test_output_of_the_given_log(self):
+        log = OutputLog()
+        sink = TeeSink(log, RingBufferLog(2), DiscardLog(), log=log)
+        for line in 'abc':
+            sink.write(line)
+        self.assertEqual(sink.get_output(), ['a', 'b', 'c'])
+        sink.clear()
+        self.assertEqual(sink.get_output(), [])
+
+    def test_log_must_be_one_of_the_sinks(self):
+        with self.assertRaises(ValueError):
+            TeeSink(OutputLog(), log=OutputLog())
+        with self.assertRaises(ValueError):
+            TeeSink()
+
+
+class InterpreterSinkTest(unittest.TestCase):
+    def test_console_sink_is_rejected_without_console_output(self):
+        for sink in (BufferedWriter(), TeeSink(BufferedWriter(), OutputLog())):
+            with self.subTest(sink=sink):
+                with self.assertRaises(ValueError):
+                    Interpreter(console_output=False, output_sink=sink)
+        Interpreter(console_output=False, output_sink=TeeSink(BufferedWriter(io.StringIO()), OutputLog()))
+        Interpreter(console_output=True, output_sink=BufferedWriter())
+
+    def test_failed_run_is_flushed(self):
+        for engine in Interpreter.ENGINES:
+            with self.subTest(engine=engine):
+                stream = io.StringIO()
+                interpreter = Interpreter(console_output=False, engine=engine,
+                                          output_sink=TeeSink(BufferedWriter(stream), RingBufferLog(2)))
+                with self.assertRaises(RuntimeError):
+                    interpreter.run(io.StringIO(PROGRAM))
+                self.assertEqual(stream.getvalue(), ''.join(f'line {i}\n' for i in range(5)))
+                self.assertEqual(interpreter.get_output(), ['line 3', 'line 4'])
+
+
+if __name__ == '__main__':
+    unittest.main()
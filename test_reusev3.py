@@ -0,0 +1,93 @@
+"""
+Tests of running many programs on one interpreter: no run may see the classes, output, input or error
+of the run before it once the interpreter is reset.
+
+Run with python3 -m unittest test_reusev3
+"""
+
+import io
+import unittest
+
+from intbase import ErrorType
+from interpreterv3 import Interpreter
+from outputv3 import RingBufferLog
+
+FIRST = '''
+(class helper (method int value () (return 1)))
+(tclass box (field_type) (method string kind () (return "first box")))
+(class main
+ (field int x 0)
+ (method void main ()
+  (begin
+   (inputi x)
+   (print "first " x " " (call (new helper) value) " " (call (new box@int) kind))
+   (throw "uncaught"))))
+'''
+# the same names as FIRST, but helper is gone, box and main are different, and exception is not set
+SECOND = '''
+(tclass box (field_type) (method string kind () (return "second box")))
+(class main
+ (field int x 0)
+ (method void main ()
+  (begin
+   (inputi x)
+   (print "second " x " " (call (new box@int) kind))
+   (print exception))))
+'''
+THIRD = '''
+(class main
+ (method void main () (call (new helper) value)))
+'''
+
+
+def outcome(interpreter, source):
+    try:
+        interpreter.run(io.StringIO(source))
+    except RuntimeError:
+        pass
+    return interpreter.get_output(), interpreter.error_type, interpreter.error_line
+
+
+class ReuseTest(unittest.TestCase):
+    def test_reset_runs_like_a_new_interpreter(self):
+        for engine in Interpreter.ENGINES:
+            with self.subTest(engine=engine):
+                fresh = [outcome(Interpreter(console_output=False, inp=['7', '8'], engine=engine), source)
+                         for source in (FIRST, SECOND, THIRD)]
+                self.assertEqual(fresh, [(['first 7 1 first box'], None, None),
+                                         (['second 7 second box'], ErrorType.NAME_ERROR, 8),
+                                         ([], ErrorType.TYPE_ERROR, None)])
+                interpreter = Interpreter(console_output=False, inp=['7', '8'], engine=engine)
+                reused = []
+                for source in (FIRST, SECOND, THIRD, FIRST):
+                    interpreter.reset()
+                    reused.append(outcome(interpreter, source))
+                self.assertEqual(reused, fresh + fresh[:1])
+
+    def test_output_sink_is_cleared(self):
+        interpreter = Interpreter(console_output=False, inp=['7'], output_sink=RingBufferLog(10))
+        outcome(interpreter, FIRST)
+        interpreter.reset()
+        self.assertEqual((interpreter.get_output(), interpreter.error_type), ([], None))
+
+    def test_input_cursor_goes_on_without_reset(self):
+        interpreter = Interpreter(console_output=False, inp=['7', '8'])
+        self.assertEqual(outcome(interpreter, FIRST)[0], ['first 7 1 first box'])
+        self.assertEqual(outcome(interpreter, SECOND)[0], ['first 7 1 first box', 'second 8 second box'])
+
+    def test_limits_start_over(self):
+        source = '''
+(class main
+ (field int i 0)
+ (method void main () (begin (while (< i 30) (set i (+ i 1))) (print i))))
+'''
+        for engine in Interpreter.ENGINES:
+            with self.subTest(engine=engine):
+                interpreter = Interpreter(console_output=False, engine=engine, max_steps=50)
+                for _ in range(3):
+                    interpreter.reset()
+                    self.assertEqual(outcome(interpreter, source), (['30'], None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
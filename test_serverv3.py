@@ -0,0 +1,51 @@
+"""
+Tests of the resident interpreter server.
+
+Run with python3 -m unittest test_serverv3
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+
+from serverv3 import InterpreterServer, request, serve_request
+
+ECHO = '''(class main
+ (field string s "")
+ (method void main () (begin (inputs s) (print "got " s))))'''
+
+
+class ServeRequestTest(unittest.TestCase):
+    def test_runs_a_program(self):
+        response = serve_request({'source': ECHO, 'input': ['x']}, 'tree')
+        self.assertEqual((response['output'], response['exception']), (['got x'], None))
+
+    def test_rejects_bad_requests(self):
+        for request_value in ([1, 2], 3, {'source': ECHO, 'input': 'abc'}, {'source': ECHO, 'input': [1]},
+                              {'source': ECHO, 'engine': 'jit'}):
+            with self.subTest(request=request_value):
+                self.assertIn('exception', serve_request(request_value, 'tree'))
+                self.assertNotIn('output', serve_request(request_value, 'tree'))
+
+
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'brewin.sock')
+        self.server = InterpreterServer(self.path, workers=1, cache_dir=directory.name)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_round_trip(self):
+        response = request(self.path, ECHO, ['y'], engine='vm')
+        self.assertEqual((response['output'], response['error_type']), (['got y'], None))
+        response = request(self.path, ECHO.split('\n'), ['z'])
+        self.assertEqual(response['output'], ['got z'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+"""
+Tests of streamed programs: a program read from a file object, a memory-mapped file or an iterator of
+lines must parse to the same tree and run exactly like the same program given as a list of lines,
+errors and line numbers included.
+
+Run with python3 -m unittest test_streamv3
+"""
+
+import io
+import mmap
+import os
+import tempfile
+import unittest
+
+from bparser import BParser, BParserError
+from intbase import ErrorType
+from interpreterv3 import Interpreter
+
+PROGRAMS = [
+    ('runs', '''# a comment before the first class
+(class helper
+ (method string greet ((string name)) (return (+ "hi # " name))))
+(class main
+ (field helper h null)
+ (method void main ()
+  (begin
+   (set h (new helper))
+   (print (call h greet "you")))))
+''', ['hi # you'], None, None),
+    ('name error', '''(class main
+ (method void main ()
+  (begin
+   (print "before")
+   (print missing))))
+''', ['before'], ErrorType.NAME_ERROR, 4),
+    ('type error in a later class', '''(class main
+ (method void main () (call (new other) f)))
+(class other
+ (method void f ()
+  (print (+ 1 "a"))))
+''', [], ErrorType.TYPE_ERROR, 4),
+    ('unclosed parenthesis', '''(class main
+ (method void main () (print "x"))
+''', [], ErrorType.SYNTAX_ERROR, None),
+    ('unclosed string', '''(class main
+ (method void main () (print "x)))
+''', [], ErrorType.SYNTAX_ERROR, None),
+    ('extra parenthesis', '''(class main
+ (method void main () (print "x"))))
+''', [], ErrorType.SYNTAX_ERROR, None),
+]
+
+
+def outcome(interpreter, program):
+    try:
+        interpreter.run(program)
+    except RuntimeError:
+        pass
+    return interpreter.get_output(), interpreter.error_type, interpreter.error_line
+
+
+class StreamedProgramTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def streamed_forms(self, source):
+        """Yield (name, program) for every streamed form of source; files are closed after each run"""
+        path = os.path.join(self.directory.name, 'program.br')
+        with open(path, 'w') as file:
+            file.write(source)
+        yield 'string io', io.StringIO(source)
+        yield 'iterator', iter(source.split('\n'))
+        yield 'generator of bytes', (line.encode() for line in source.splitlines(keepends=True))
+        with open(path) as file:
+            yield 'text file', file
+        with open(path, 'rb') as file:
+            yield 'binary file', file
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield 'mmap', mapped
+
+    def test_runs_like_a_list(self):
+        for name, source, output, error_type, error_line in PROGRAMS:
+            for engine in Interpreter.ENGINES:
+                expected = outcome(Interpreter(console_output=False, engine=engine), source.split('\n'))
+                self.assertEqual(expected, (output, error_type, error_line), name)
+                for form, program in self.streamed_forms(source):
+                    with self.subTest(name, engine=engine, form=form):
+                        self.assertEqual(outcome(Interpreter(console_output=False, engine=engine), program),
+                                         expected)
+
+    def test_parses_like_a_list(self):
+        for name, source, _, _, _ in PROGRAMS:
+            status, expected = BParser.parse(source.split('\n'), interned=True)
+            for form, program in self.streamed_forms(source):
+                with self.subTest(name, form=form):
+                    items = []
+                    try:
+                        for item in BParser.parse_stream(program, interned=True):
+                            items.append(item)
+                    except BParserError as error:
+                        self.assertEqual((False, str(error)), (status, expected))
+                        continue
+                    self.assertTrue(status)
+                    self.assertEqual(items, expected)
+                    self.assertEqual(lines_of(items), lines_of(expected))
+
+
+def lines_of(items):
+    """The line number of every list of a parse tree, depth first"""
+    lines = []
+    for item in items:
+        if isinstance(item, list):
+            lines.append(item.line_num)
+            lines += lines_of(item)
+    return lines
+
+
+if __name__ == '__main__':
+    unittest.main()
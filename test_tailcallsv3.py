@@ -0,0 +1,91 @@
+"""
+Tests of calls in tail position: a chain of them, mutual recursion included, runs in constant
+memory on every engine and coerces its result to the same return types as nested calls would.
+
+Run with python3 -m unittest test_tailcallsv3
+"""
+
+import io
+import unittest
+
+from intbase import ErrorType
+from interpreterv3 import Interpreter, Type, add_return_check
+
+
+def run(source, engine):
+    """Run a program and return (printed lines, error type, error line)"""
+    interpreter = Interpreter(console_output=False, engine=engine)
+    try:
+        interpreter.run(io.StringIO(source))
+    except RuntimeError:
+        pass
+    return interpreter.get_output(), interpreter.error_type, interpreter.error_line
+
+
+class Method:
+    """The part of a method add_return_check looks at"""
+
+    def __init__(self, return_type, real_return_type):
+        self.return_type = return_type
+        self.real_return_type = real_return_type
+
+
+class MutualTailRecursionTest(unittest.TestCase):
+    def test_deep_mutual_recursion(self):
+        source = '''
+(class main
+ (method int even ((int n) (int acc)) (if (== n 0) (return acc) (return (call me odd (- n 1) (+ acc 1)))))
+ (method int odd ((int n) (int acc)) (if (== n 0) (return acc) (return (call me even (- n 1) (+ acc 2)))))
+ (method void main () (print (call me even 20000 0))))
+'''
+        for engine in Interpreter.ENGINES:
+            with self.subTest(engine=engine):
+                self.assertEqual(run(source, engine), (['30000'], None, None))
+
+    def test_deep_recursion_through_differing_return_types(self):
+        # the int a bool method returns is only rejected once the chain ends, by the bool method
+        source = '''
+(class main
+ (method int f ((int n)) (if (== n 0) (return 1) (return (call me g (- n 1)))))
+ (method bool g ((int n)) (return (call me f n)))
+ (method void main () (print (call me g 20000))))
+'''
+        for engine in Interpreter.ENGINES:
+            with self.subTest(engine=engine):
+                self.assertEqual(run(source, engine)[:2], ([], ErrorType.TYPE_ERROR))
+
+    def test_deep_recursion_through_class_return_types(self):
+        source = '''
+(class a (method string name () (return "a")))
+(class b inherits a (method string name () (return "b")))
+(class main
+ (field a x null)
+ (method a f ((int n)) (if (== n 0) (return (new b)) (return (call me g (- n 1)))))
+ (method b g ((int n)) (return (call me f n)))
+ (method void main () (begin (set x (call me f 20000)) (print (call x name)))))
+'''
+        for engine in Interpreter.ENGINES:
+            with self.subTest(engine=engine):
+                self.assertEqual(run(source, engine), (['b'], None, None))
+
+
+class AddReturnCheckTest(unittest.TestCase):
+    def test_alternating_methods_keep_the_list_short(self):
+        int_method, other_int_method = Method(Type.INT, 'int'), Method(Type.INT, 'int')
+        methods = []
+        for _ in range(1000):
+            add_return_check(methods, int_method)
+            add_return_check(methods, other_int_method)
+        self.assertEqual(methods, [int_method])
+
+    def test_alternating_classes_keep_the_list_short(self):
+        a, b = Method(Type.POINTER, 'a'), Method(Type.POINTER, 'b')
+        methods = []
+        for _ in range(1000):
+            add_return_check(methods, a)
+            add_return_check(methods, b)
+        self.assertEqual(methods, [a, b])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,717 @@
+"""
+Stack-based bytecode virtual machine for the v3 interpreter.
+
+Each method body is lowered once into a CodeObject: an array of (opcode, argument) pairs, a
+constant pool and a line number per instruction. A single dispatch loop runs the code with
+its own stack of frames, so a Brewin call pushes a VMFrame instead of recursing through
+Python; deep Brewin recursion is not limited by Python's recursion limit, only by the frame
+budget Interpreter(max_frames=...), past which a call is a FAULT_ERROR. (try ...) installs
+a handler on the running frame and (throw ...) unwinds frames inside the loop until it
+finds one.
+
+Since no Python frames are left behind between two instructions, a run can also be suspended:
+VirtualMachine.steps runs a program as a generator that yields for input, output and every so many
+loop iterations, which is how Interpreter.run_async runs programs on an event loop.
+
+Select it with Interpreter(engine='vm').
+"""
+
+from array import array
+
+from intbase import InterpreterBase, ErrorType
+from interpreterv3 import Type, Value, add_return_check
+from runtimev3 import CallSite, Instance, Runtime, Scope, is_well_formed
+
+# opcodes; the argument of each instruction is described next to it
+LOAD_CONST = 0  # constant pool index
+LOAD_LOCAL = 1  # slot of a parameter or (let ...) variable
+LOAD_FIELD = 2  # slot of the field in the Instance
+LOAD_ME = 3
+LOAD_EXCEPTION = 4  # constant pool index of (line number, description) of the error if there is no exception
+STORE_LOCAL = 5  # slot of a parameter or (let ...) variable
+STORE_FIELD = 6  # constant pool index of (field slot, declared type)
+STORE_EXCEPTION = 7
+BINARY_OP = 8  # constant pool index of the operator
+NOT = 9
+NEW = 10  # constant pool index of the class name
+CALL = 11  # constant pool index of the CallSite; the target object is below the arguments
+CALL_ME = 12  # same as CALL, called on me and looked up where the running method was
+CALL_SUPER = 13  # same as CALL, looked up in the base class of the class that defines the code
+RETURN_VALUE = 14
+RETURN_NONE = 15
+POP_TOP = 16
+JUMP = 17  # target instruction offset
+JUMP_IF_FALSE = 18  # target instruction offset; fails with the checks entry of the instruction, if any, on non-bools
+PRINT = 19  # number of values to print
+INPUT = 20  # constant pool index of (field slot, Type)
+ENTER_LET = 21  # constant pool index of ((slot, declared type, initial Value or None), ...)
+SETUP_TRY = 22  # target instruction offset of the handler
+POP_TRY = 23
+END_CATCH = 24  # clears the exception variable
+THROW = 25
+FAIL = 26  # constant pool index of (ErrorType, description, line number)
+TAIL_CALL = 27  # constant pool index of (CALL, CALL_ME or CALL_SUPER, CallSite); the callee replaces the running frame
+LOOP = 28  # start of an iteration of a while body, a step of the run
+
+# what a suspendable run, see VirtualMachine.steps, yields to the code driving it
+INPUT_REQUEST = 'input'  # (INPUT_REQUEST,): send back the next input value
+OUTPUT_REQUEST = 'output'  # (OUTPUT_REQUEST, line): the program printed line
+PAUSE_REQUEST = 'pause'  # (PAUSE_REQUEST,): a loop ran yield_every more iterations
+
+OPCODE_NAMES = {value: name for name, value in list(globals().items()) if name.isupper() and isinstance(value, int)}
+
+
+class CodeObject:
+    """Bytecode of one method body"""
+
+    __slots__ = ('name', 'layout', 'code', 'consts', 'lines', 'checks', 'slot_types')
+
+    def __init__(self, name, layout):
+        self.name = name
+        self.layout = layout  # ClassLayout of the class that defines the method
+        self.code = array('i')  # opcode and argument of every instruction, one after the other
+        self.consts = []  # constant pool
+        self.lines = []  # line number of every instruction, indexed by offset // 2
+        self.checks = {}  # dict: {key=offset of a JUMP_IF_FALSE, value=(description, line number)}
+        self.slot_types = []  # declared type of every parameter and (let ...) variable slot
+
+    def disassemble(self):
+        lines = []
+        for offset in range(0, len(self.code), 2):
+            opcode, arg = self.code[offset], self.code[offset + 1]
+            operand = ''
+            if opcode in (LOAD_CONST, LOAD_EXCEPTION, STORE_FIELD, BINARY_OP, NEW, CALL, CALL_ME, CALL_SUPER, INPUT,
+                          ENTER_LET, FAIL, TAIL_CALL):
+                const = self.consts[arg]
+                operand = f'({Runtime.format_value(const) if isinstance(const, Value) else const!r})'
+            lines.append(f'{offset:5} {OPCODE_NAMES[opcode]:<16} {arg:<4} {operand}')
+        return '\n'.join(lines)
+
+
+class MethodCompiler:
+    """Lowers one method body into a CodeObject"""
+
+    def __init__(self, vm, name, scope):
+        self.vm = vm
+        self.scope = scope
+        self.code = CodeObject(name, scope.layout)
+        self.__const_index = {}
+        # (try ...) bodies and catches the statement being compiled is in, innermost last: the offsets of
+        # the jumps out of a body, None for a catch
+        self.__blocks = []
+        self.__statement_compilers = {
+            InterpreterBase.PRINT_DEF: self.__compile_print,
+            InterpreterBase.INPUT_INT_DEF: self.__compile_input,
+            InterpreterBase.INPUT_STRING_DEF: self.__compile_input,
+            InterpreterBase.SET_DEF: self.__compile_set,
+            InterpreterBase.CALL_DEF: self.__compile_call_statement,
+            InterpreterBase.WHILE_DEF: self.__compile_while,
+            InterpreterBase.IF_DEF: self.__compile_if,
+            InterpreterBase.RETURN_DEF: self.__compile_return,
+            InterpreterBase.LET_DEF: self.__compile_let,
+            InterpreterBase.BEGIN_DEF: self.__compile_begin,
+            InterpreterBase.THROW_DEF: self.__compile_throw,
+            InterpreterBase.TRY_DEF: self.__compile_try,
+        }
+
+    def compile(self, body):
+        self.__compile_statement(body)
+        self.__emit(RETURN_NONE)
+        self.code.slot_types = self.scope.slot_types
+        return self.code
+
+    # assembly
+
+    def __emit(self, opcode, arg=0, line_num=None):
+        self.code.code.append(opcode)
+        self.code.code.append(arg)
+        self.code.lines.append(line_num)
+        return len(self.code.code) - 2
+
+    def __const(self, value):
+        key = (type(value), value) if isinstance(value, (str, tuple)) else id(value)
+        if key not in self.__const_index:
+            self.__const_index[key] = len(self.code.consts)
+            self.code.consts.append(value)
+        return self.__const_index[key]
+
+    def __here(self):
+        return len(self.code.code)
+
+    def __patch(self, offset, target=None):
+        self.code.code[offset + 1] = self.__here() if target is None else target
+
+    def __fail(self, error_type, description, line_num=None):
+        self.__emit(FAIL, self.__const((error_type, description, line_num)), line_num)
+
+    # statements
+
+    def __compile_statement(self, statement, discard=False):
+        if not isinstance(statement, list) or not statement or not isinstance(statement[0], str):
+            self.__fail(ErrorType.SYNTAX_ERROR, "invalid statement")
+            return
+        compiler = self.__statement_compilers.get(statement[0])
+        if compiler is None:
+            self.__fail(ErrorType.SYNTAX_ERROR, f"unknown statement {statement[0]}", statement.line_num)
+            return
+        if not is_well_formed(statement):
+            # malformed statements only fail once they run, like they do in the tree-walker
+            self.__fail(ErrorType.SYNTAX_ERROR, f"malformed {statement[0]} statement", statement.line_num)
+            return
+        if discard:
+            # a call among the statements of a begin or let, other than the last one: its result is dropped
+            self.__compile_call(statement)
+            self.__emit(POP_TOP)
+            return
+        compiler(statement)
+
+    def __compile_print(self, statement):
+        line_num = statement.line_num
+        for arg in statement[1:]:
+            if arg == InterpreterBase.ME_DEF:
+                # the tree-walker does not print objects: to it, me is an undefined variable here
+                self.__fail(ErrorType.NAME_ERROR, "undefined variable", line_num)
+            elif arg == InterpreterBase.EXCEPTION_VARIABLE_DEF:
+                self.__emit(LOAD_EXCEPTION, self.__const((line_num, "undefined variable")))
+            else:
+                self.__compile_operand(arg, line_num)
+        self.__emit(PRINT, len(statement) - 1, line_num)
+
+    def __compile_input(self, statement):
+        name = statement[1]
+        if name not in self.scope.fields:
+            self.__fail(ErrorType.NAME_ERROR, "undefined variable", statement.line_num)
+            return
+        value_type = Type.INT if statement[0] == InterpreterBase.INPUT_INT_DEF else Type.STRING
+        self.__emit(INPUT, self.__const((self.scope.fields[name][0], value_type)), statement.line_num)
+
+    def __compile_set(self, statement):
+        name = statement[1]
+        line_num = statement.line_num
+        if name != InterpreterBase.EXCEPTION_VARIABLE_DEF and self.scope.resolve(name) is None:
+            self.__fail(ErrorType.NAME_ERROR, "undefined variable", line_num)
+            return
+        self.__compile_argument(statement[2], line_num)
+        if name == InterpreterBase.EXCEPTION_VARIABLE_DEF:
+            self.__emit(STORE_EXCEPTION, 0, line_num)
+            return
+        kind, slot, type_name = self.scope.resolve(name)
+        if kind == 'local':
+            self.__emit(STORE_LOCAL, slot, line_num)
+        else:
+            self.__emit(STORE_FIELD, self.__const((slot, type_name)), line_num)
+
+    def __compile_call_statement(self, statement):
+        # the result of a call statement is the Value the call returns
+        self.__compile_call(statement)
+        self.__emit_return(statement.line_num)
+
+    def __compile_condition(self, token, line_num, description):
+        """Emit a JUMP_IF_FALSE for an if/while condition and return its offset, or None for a literal"""
+        if token == InterpreterBase.TRUE_DEF or token == InterpreterBase.FALSE_DEF:
+            return None
+        if isinstance(token, list):
+            check_line = None  # the tree-walker reports expression conditions without a line
+        elif token == InterpreterBase.ME_DEF or self.scope.resolve(token) is None:
+            # other than true and false, the tree-walker only takes variables and expressions for conditions
+            self.__fail(ErrorType.TYPE_ERROR, description, line_num)
+            return None
+        else:
+            check_line = line_num
+        self.__compile_operand(token, line_num)
+        offset = self.__emit(JUMP_IF_FALSE, 0, line_num)
+        self.code.checks[offset] = (description, check_line)
+        return offset
+
+    def __compile_while(self, statement):
+        if statement[1] == InterpreterBase.FALSE_DEF:
+            return
+        if isinstance(statement[1], list):
+            self.__compile_while_expression(statement)
+            return
+        start = self.__here()
+        exit_jump = self.__compile_condition(statement[1], statement.line_num, "not boolean in while statement")
+        self.__emit(LOOP, 0, statement.line_num)
+        self.__compile_statement(statement[2])
+        self.__emit(JUMP, start, statement.line_num)
+        if exit_jump is not None:
+            self.__patch(exit_jump)
+
+    def __compile_while_expression(self, statement):
+        # like in the tree-walker, an expression condition is evaluated once more before the loop, which is
+        # the result of a loop that never runs, and any value but false, 0, "" and null goes on: the
+        # JUMP_IF_FALSE instructions on it have no checks entry
+        line_num = statement.line_num
+        self.__compile_expression(statement[1])
+        self.__compile_expression(statement[1])
+        never_jump = self.__emit(JUMP_IF_FALSE, 0, line_num)
+        self.__emit(POP_TOP)
+        start = self.__here()
+        self.__emit(LOOP, 0, line_num)
+        self.__compile_statement(statement[2])
+        self.__compile_expression(statement[1])
+        exit_jump = self.__emit(JUMP_IF_FALSE, 0, line_num)
+        self.__emit(JUMP, start, line_num)
+        self.__patch(never_jump)
+        self.__emit_return(line_num)
+        self.__patch(exit_jump)
+
+    def __compile_if(self, statement):
+        if statement[1] == InterpreterBase.TRUE_DEF:
+            self.__compile_statement(statement[2])
+            return
+        if statement[1] == InterpreterBase.FALSE_DEF:
+            if len(statement) > 3:
+                self.__compile_statement(statement[3])
+            return
+        else_jump = self.__compile_condition(statement[1], statement.line_num, "not boolean in if statement")
+        self.__compile_statement(statement[2])
+        if len(statement) > 3:
+            end_jump = self.__emit(JUMP)
+            self.__patch(else_jump)
+            self.__compile_statement(statement[3])
+            self.__patch(end_jump)
+        else:
+            self.__patch(else_jump)
+
+    def __compile_return(self, statement):
+        if len(statement) == 1:
+            self.__emit(LOAD_CONST, self.__const(Runtime.VOID_RESULT))
+        elif isinstance(statement[1], list) and statement[1] and statement[1][0] == InterpreterBase.CALL_DEF \
+                and not self.__blocks:
+            # a call in tail position; inside a try it must return to the handlers of this frame
+            self.__compile_call(statement[1], tail=True)
+        else:
+            self.__compile_operand(statement[1], None)
+        self.__emit_return(statement.line_num)
+
+    def __emit_return(self, line_num):
+        # return the value on the stack from the method; like in the tree-walker, inside a try body it
+        # only ends that body, and leaving a catch clears the exception variable
+        catches = 0
+        for exits in reversed(self.__blocks):
+            if exits is not None:
+                self.__emit(POP_TOP)
+                if catches:
+                    self.__emit(END_CATCH)
+                exits.append(self.__emit(JUMP))
+                return
+            catches += 1
+        if catches:
+            self.__emit(END_CATCH)
+        self.__emit(RETURN_VALUE, 0, line_num)
+
+    def __compile_let(self, statement):
+        declarations = []
+        declared = {}
+        for variable in statement[1]:
+            if variable[1] in declared:
+                self.__fail(ErrorType.NAME_ERROR, 'Duplicate definition of local variables')
+                return
+            declared[variable[1]] = variable[0]
+            initial_value = self.vm.interpreter.constant(variable[2]) if len(variable) == 3 else None
+            declarations.append((variable[1], variable[0], initial_value))
+        slots = self.scope.enter_let(declared.items())
+        declarations = tuple((slot, type_name, initial_value)
+                             for slot, (_, type_name, initial_value) in zip(slots, declarations))
+        self.__emit(ENTER_LET, self.__const(declarations), statement.line_num)
+        self.__compile_sequence(statement[2:])
+        self.scope.exit_let()
+
+    def __compile_begin(self, statement):
+        self.__compile_sequence(statement[1:])
+
+    def __compile_sequence(self, statements):
+        # the statements of a begin or let: like in the tree-walker, the first result of one that is not a
+        # call ends them, otherwise their result is that of the last one
+        for index, sub_statement in enumerate(statements):
+            is_call = isinstance(sub_statement, list) and sub_statement[:1] == [InterpreterBase.CALL_DEF]
+            self.__compile_statement(sub_statement, discard=is_call and index < len(statements) - 1)
+
+    def __compile_throw(self, statement):
+        self.__compile_argument(statement[1], statement.line_num)
+        self.__emit(THROW, 0, statement.line_num)
+
+    def __compile_try(self, statement):
+        setup = self.__emit(SETUP_TRY, 0, statement.line_num)
+        exits = []
+        self.__blocks.append(exits)
+        try:
+            self.__compile_statement(statement[1])
+        finally:
+            self.__blocks.pop()
+        for exit_jump in exits:
+            self.__patch(exit_jump)
+        self.__emit(POP_TRY)
+        end_jump = self.__emit(JUMP)
+        self.__patch(setup)
+        self.__blocks.append(None)
+        try:
+            self.__compile_statement(statement[2])
+        finally:
+            self.__blocks.pop()
+        self.__emit(END_CATCH)
+        self.__patch(end_jump)
+
+    # expressions
+
+    def __compile_argument(self, token, line_num):
+        # the value of a set or throw statement or an argument of a call; there, like in the tree-walker, a
+        # name that is not a variable, me included, is an undefined literal that fails the type check or
+        # method lookup it gets to
+        if not isinstance(token, list) and token != InterpreterBase.EXCEPTION_VARIABLE_DEF \
+                and self.scope.resolve(token) is None:
+            self.__emit(LOAD_CONST, self.__const(self.vm.interpreter.constant(token)))
+            return
+        self.__compile_operand(token, line_num)
+
+    def __compile_operand(self, token, line_num):
+        if isinstance(token, list):
+            self.__compile_expression(token)
+            return
+        if token == InterpreterBase.ME_DEF:
+            self.__emit(LOAD_ME)
+            return
+        if token == InterpreterBase.EXCEPTION_VARIABLE_DEF:
+            self.__emit(LOAD_EXCEPTION, self.__const((None, 'Undefined exception')))
+            return
+        literal = self.vm.interpreter.constant(token)
+        if literal.typeof() != Type.UNDEFINED:
+            self.__emit(LOAD_CONST, self.__const(literal))
+            return
+        binding = self.scope.resolve(token)
+        if binding is None:
+            self.__fail(ErrorType.NAME_ERROR, "undefined variable", line_num)
+            return
+        kind, slot, _ = binding
+        if kind == 'local':
+            self.__emit(LOAD_LOCAL, slot)
+        else:
+            self.__emit(LOAD_FIELD, slot)
+
+    def __compile_expression(self, expression):
+        if not expression:
+            self.__fail(ErrorType.SYNTAX_ERROR, "empty expression")
+            return
+        operator = expression[0]
+        line_num = expression.line_num if isinstance(operator, str) else None
+        if operator == InterpreterBase.CALL_DEF:
+            self.__compile_call(expression)
+            return
+        if operator == InterpreterBase.NEW_DEF:
+            if not is_well_formed(expression):
+                self.__fail(ErrorType.SYNTAX_ERROR, "malformed new expression", line_num)
+                return
+            self.__emit(NEW, self.__const(str(expression[1])), line_num)
+            return
+        if not isinstance(operator, str) or operator not in self.vm.interpreter.operators:
+            self.__fail(ErrorType.NAME_ERROR, "undefined variable", line_num)
+            return
+        operands = expression[1:]
+        if len(operands) == 1 and operator != '!':
+            self.__fail(ErrorType.TYPE_ERROR, "operator error", line_num)
+            return
+        if len(operands) not in (1, 2):
+            self.__fail(ErrorType.SYNTAX_ERROR, "invalid operator", line_num)
+            return
+        for operand in operands:
+            self.__compile_operand(operand, line_num)
+        if len(operands) == 1:
+            self.__emit(NOT, 0, line_num)
+        else:
+            self.__emit(BINARY_OP, self.__const(str(operator)), line_num)
+
+    def __compile_call(self, statement, tail=False):
+        line_num = statement.line_num
+        if not is_well_formed(statement):
+            self.__fail(ErrorType.SYNTAX_ERROR, "malformed call expression", line_num)
+            self.__emit(LOAD_CONST, self.__const(Runtime.VOID_RESULT))
+            return
+        target = statement[1]
+        if not isinstance(target, list) and target not in (InterpreterBase.ME_DEF, InterpreterBase.SUPER_DEF) \
+                and self.scope.resolve(target) is None:
+            self.__fail(ErrorType.FAULT_ERROR, "referenced illegal value")
+            self.__emit(LOAD_CONST, self.__const(Runtime.VOID_RESULT))
+            return
+        if len(statement) == 2:
+            self.__fail(ErrorType.SYNTAX_ERROR, "malformed call expression", line_num)
+            self.__emit(LOAD_CONST, self.__const(Runtime.VOID_RESULT))
+            return
+        call_site = CallSite(str(statement[2]), len(statement) - 3)
+        if target == InterpreterBase.ME_DEF:
+            opcode = CALL_ME
+        elif target == InterpreterBase.SUPER_DEF:
+            opcode = CALL_SUPER
+        else:
+            opcode = CALL
+            self.__compile_operand(target, line_num)
+        for arg in statement[3:]:
+            self.__compile_argument(arg, line_num)
+        if opcode == CALL_SUPER and self.scope.layout.super_layout is None:
+            self.__fail(ErrorType.NAME_ERROR, "method undefined")
+            return
+        if tail:
+            self.__emit(TAIL_CALL, self.__const((opcode, call_site)), line_num)
+        else:
+            self.__emit(opcode, self.__const(call_site), line_num)
+
+
+class VMFrame:
+    """State of one running method"""
+
+    __slots__ = ('code', 'pc', 'stack', 'me', 'layout', 'locals', 'method', 'handlers', 'returns')
+
+    def __init__(self, code, me, layout, locals, method):
+        self.code = code
+        self.pc = 0
+        self.stack = []
+        self.me = me  # the Instance the method was called on
+        # the layout the method was looked up in, where CALL_ME looks up methods too: like in the
+        # tree-walker, that of the base class for a method run by (call super ...)
+        self.layout = layout
+        self.locals = locals  # parameters and (let ...) variables, in the slots given to them by Scope
+        self.method = method
+        self.handlers = None  # (handler offset, stack depth) per enclosing (try ...), once there is one
+        # the methods whose return types the result is coerced to, outermost first, once this frame replaced
+        # others by tail calls (see add_return_check), and None until then: the result of the method is
+        # coerced to its own return type, unless the frame is the one main runs in
+        self.returns = None
+
+
+class VirtualMachine:
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.runtime = Runtime(interpreter)
+        self.compiled_classes = {}  # dict: {key=class name, value={key=method name, value=CodeObject}}
+
+    def run(self, class_def):
+        obj = self.runtime.new_object(class_def.my_name).value
+        self.execute(obj, CallSite(InterpreterBase.MAIN_FUNC_DEF, 0), [])
+
+    def steps(self, class_def, yield_every):
+        """
+        Return a generator that runs the main method of class_def; instead of reading input and printing
+        itself, it yields an INPUT_REQUEST or OUTPUT_REQUEST, and it yields a PAUSE_REQUEST every
+        yield_every iterations of a loop, so the code driving it can do other work in between
+        """
+        obj = self.runtime.new_object(class_def.my_name).value
+        return self.__run(obj, CallSite(InterpreterBase.MAIN_FUNC_DEF, 0), [], yield_every)
+
+    def code_for(self, layout, method_name):
+        compiled = self.compiled_classes.get(layout.name)
+        if compiled is None:
+            # the first call into a class compiles all of its methods
+            compiled = self.compiled_classes[layout.name] = self.__compile_class(layout)
+        return compiled[method_name]
+
+    def __compile_class(self, layout):
+        compiled = {}
+        for method in self.runtime.members(layout.name)[1]:
+            compiler = MethodCompiler(self, f'{layout.name}.{method[2]}', Scope.for_method(layout, method))
+            compiled[method[2]] = compiler.compile(method[4])
+        return compiled
+
+    def __lookup(self, layout, method_name, args):
+        method, owner = self.runtime.find_method(layout, method_name, Runtime.signature(args))
+        return method, owner, self.code_for(owner, method_name)
+
+    def __push_frame(self, call_site, layout, me, args):
+        runtime = self.runtime
+        method, _, code = call_site.resolve(layout, args, self.__lookup)
+        return VMFrame(code, me, layout, runtime.bind_arguments(method, args, len(code.slot_types)), method)
+
+    def execute(self, obj, call_site, args):
+        """Run a method to completion and return its result, or None if an exception was not caught"""
+        try:
+            next(self.__run(obj, call_site, args, 0))
+        except StopIteration as stop:
+            return stop.value
+
+    def __run(self, obj, call_site, args, yield_every):
+        # the dispatch loop; with yield_every 0 it never yields, and reads input and prints itself
+        interpreter = self.interpreter
+        runtime = self.runtime
+        check_store = runtime.check_store
+        max_frames = interpreter.max_frames
+        binary_ops = runtime.binary_ops
+        BOOL = Type.BOOL
+        POINTER = Type.POINTER
+
+        frames = []
+        interpreter.countdown -= 1  # the call of the method, a step like the calls it makes
+        if interpreter.countdown < 0:
+            interpreter.check_limits()
+        frame = self.__push_frame(call_site, obj.layout, obj, args)
+        code = frame.code.code
+        consts = frame.code.consts
+        stack = frame.stack
+        slots = frame.locals
+        pc = 0
+        countdown = yield_every
+        while True:
+            opcode = code[pc]
+            arg = code[pc + 1]
+            pc += 2
+            if opcode == LOAD_LOCAL:
+                stack.append(slots[arg])
+            elif opcode == LOAD_CONST:
+                stack.append(consts[arg])
+            elif opcode == BINARY_OP:
+                b = stack.pop()
+                a = stack.pop()
+                operator = consts[arg]
+                operation = binary_ops[operator].get(a.type)
+                if a.type is b.type and a.type is not POINTER and operation is not None:
+                    stack.append(operation(a, b))
+                else:
+                    stack.append(runtime.binary(operator, a, b, frame.code.lines[(pc - 2) // 2]))
+            elif opcode == JUMP_IF_FALSE:
+                condition = stack.pop()
+                if condition.type is not BOOL and pc - 2 in frame.code.checks:
+                    interpreter.error(ErrorType.TYPE_ERROR, *frame.code.checks[pc - 2])
+                if not condition.value:
+                    pc = arg
+            elif opcode == STORE_LOCAL:
+                slots[arg] = check_store(frame.code.slot_types[arg], stack.pop())
+            elif opcode == LOOP:
+                interpreter.countdown -= 1
+                if interpreter.countdown < 0:
+                    interpreter.check_limits()
+                if yield_every:
+                    countdown -= 1
+                    if not countdown:
+                        countdown = yield_every
+                        yield (PAUSE_REQUEST,)
+            elif opcode == JUMP:
+                pc = arg
+            elif opcode == LOAD_FIELD:
+                stack.append(frame.me.fields[arg])
+            elif opcode == STORE_FIELD:
+                slot, type_name = consts[arg]
+                frame.me.fields[slot] = check_store(type_name, stack.pop())
+            elif opcode == CALL or opcode == CALL_ME or opcode == CALL_SUPER or opcode == TAIL_CALL:
+                interpreter.countdown -= 1
+                if interpreter.countdown < 0:
+                    interpreter.check_limits()
+                tail_call = opcode == TAIL_CALL
+                if tail_call:
+                    opcode, call_site = consts[arg]
+                else:
+                    call_site = consts[arg]
+                argc = call_site.argc
+                if argc:
+                    args = stack[-argc:]
+                    del stack[-argc:]
+                else:
+                    args = []
+                if opcode == CALL:
+                    me = stack.pop().value
+                    if not isinstance(me, Instance):
+                        if me is None:
+                            interpreter.error(ErrorType.FAULT_ERROR, "referenced a null value")
+                        interpreter.error(ErrorType.FAULT_ERROR, "referenced illegal value")
+                    layout = me.layout
+                elif opcode == CALL_ME:
+                    me = frame.me
+                    layout = frame.layout
+                else:
+                    me = frame.me
+                    layout = frame.code.layout.super_layout
+                if tail_call:
+                    # the caller has nothing left to run: the callee takes the place of its frame, so
+                    # tail recursion runs in constant space and does not count against max_frames
+                    returns = frame.returns
+                    if returns is None:
+                        # the return type of main is not checked, like in the tree-walker
+                        returns = [frame.method] if frames else []
+                    frame = self.__push_frame(call_site, layout, me, args)
+                    add_return_check(returns, frame.method)
+                    frame.returns = returns
+                else:
+                    frame.pc = pc
+                    frames.append(frame)
+                    if len(frames) >= max_frames:
+                        interpreter.error(ErrorType.FAULT_ERROR, "call stack exhausted",
+                                          frame.code.lines[(pc - 2) // 2])
+                    frame = self.__push_frame(call_site, layout, me, args)
+                code = frame.code.code
+                consts = frame.code.consts
+                stack = frame.stack
+                slots = frame.locals
+                pc = 0
+            elif opcode == RETURN_VALUE or opcode == RETURN_NONE:
+                result = stack.pop() if opcode == RETURN_VALUE else None
+                if frame.returns is not None:
+                    for method in reversed(frame.returns):
+                        result = runtime.coerce_return(method, result)
+                elif frames:
+                    result = runtime.coerce_return(frame.method, result)
+                if not frames:
+                    # like in the tree-walker, the result of main is not coerced to its return type, only
+                    # those of the calls it made in tail position
+                    return result
+                frame = frames.pop()
+                code = frame.code.code
+                consts = frame.code.consts
+                stack = frame.stack
+                slots = frame.locals
+                pc = frame.pc
+                stack.append(result)
+            elif opcode == POP_TOP:
+                stack.pop()
+            elif opcode == LOAD_ME:
+                stack.append(Value(frame.me, POINTER, frame.code.layout.name))
+            elif opcode == NOT:
+                stack.append(runtime.logical_not(stack.pop(), frame.code.lines[(pc - 2) // 2]))
+            elif opcode == NEW:
+                stack.append(runtime.new_object(consts[arg]))
+            elif opcode == PRINT:
+                values = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                line = ''.join([Runtime.format_value(value) for value in values])
+                if yield_every:
+                    yield (OUTPUT_REQUEST, line)
+                else:
+                    interpreter.output(line)
+            elif opcode == ENTER_LET:
+                for slot, type_name, initial_value in consts[arg]:
+                    slots[slot] = runtime.declare(type_name, initial_value)
+            elif opcode == LOAD_EXCEPTION:
+                stack.append(runtime.current_exception(*consts[arg]))
+            elif opcode == STORE_EXCEPTION:
+                runtime.set_exception(stack.pop())
+            elif opcode == INPUT:
+                slot, value_type = consts[arg]
+                value = (yield (INPUT_REQUEST,)) if yield_every else interpreter.get_input()
+                frame.me.fields[slot] = Value(value, value_type)
+            elif opcode == SETUP_TRY:
+                if frame.handlers is None:
+                    frame.handlers = []
+                frame.handlers.append((arg, len(stack)))
+            elif opcode == POP_TRY:
+                frame.handlers.pop()
+            elif opcode == END_CATCH:
+                interpreter.exception = None
+            elif opcode == THROW:
+                err_msg = stack.pop()
+                if err_msg.type is Type.UNDEFINED:
+                    interpreter.error(ErrorType.NAME_ERROR, 'Undefined variable')
+                if err_msg.type != Type.STRING:
+                    interpreter.error(ErrorType.TYPE_ERROR, 'Not a string in throw')
+                # unwind to the innermost (try ...), in this method or in one of its callers
+                while not frame.handlers:
+                    if not frames:
+                        return None  # an uncaught exception ends the program, as it does in the tree-walker
+                    frame = frames.pop()
+                handler, stack_depth = frame.handlers.pop()
+                code = frame.code.code
+                consts = frame.code.consts
+                stack = frame.stack
+                slots = frame.locals
+                del stack[stack_depth:]
+                interpreter.exception = err_msg
+                pc = handler
+            elif opcode == FAIL:
+                interpreter.error(*consts[arg])
+            else:
+                interpreter.error(ErrorType.SYNTAX_ERROR, f"invalid opcode {opcode}")